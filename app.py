@@ -1,16 +1,20 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_from_directory, current_app
+from flask import Flask, render_template, request, redirect, url_for, jsonify, send_from_directory, current_app, g
 from flask_httpauth import HTTPBasicAuth
 import os
 import threading
 import logging
-import sys
-from translation_app.utils import translate_docx_with_deepl
 from translation_app.routes import translation_bp
 from calculator_app.routes import calculator_bp
 from datetime import datetime
 from config import Config
 from marketing_app.routes import marketing_bp
 from system_routes import system_bp
+from file_transfer import send_download
+import blob_store
+from logging_setup import configure_logging
+import profiling
+import retention
+from translation_app.scheduler import start_scheduler
 
 # Initialisation de l'application Flask
 app = Flask(__name__)
@@ -20,11 +24,6 @@ auth = HTTPBasicAuth()
 with app.app_context():
     Config.create_directories()
 
-print("Current working directory:", os.getcwd())
-print("Python path:", sys.path)
-import config
-print("Config attributes:", dir(config))
-
 # Exemple d'utilisateurs autorisés
 users = {
     "admin": "Roue2021*",
@@ -39,7 +38,7 @@ app.config.from_object(Config)
 app.config["PERSISTENT_STORAGE"] = Config.PERSISTENT_STORAGE
 
 # Configuration des logs
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Créer les dossiers nécessaires si non existants
@@ -57,6 +56,34 @@ app.register_blueprint(calculator_bp, url_prefix="/calculator")
 app.register_blueprint(marketing_bp, url_prefix="/marketing")
 app.register_blueprint(system_bp, url_prefix="/system")
 
+@app.before_request
+def start_background_services():
+    # Démarré ici plutôt qu'à l'import : avec --preload, un thread lancé avant le fork
+    # n'existerait que dans le processus maître.
+    retention.start_retention_daemon()
+    if Config.TRANSLATION_RUN_IN_WEB:
+        start_scheduler()
+
+@app.before_request
+def start_profiling():
+    # 📌 Profilage à la demande d'un administrateur (en-tête X-Profile ou ?_profile=1)
+    if profiling.requested(request):
+        g.profile = profiling.start_request_profile(request, request.authorization.username)
+
+@app.after_request
+def stop_profiling(response):
+    handle = g.pop("profile", None)
+    if handle:
+        response.headers["X-Profile-Id"] = profiling.stop_request_profile(handle)
+    return response
+
+@app.teardown_request
+def discard_profiling(exception=None):
+    # Requête interrompue par une exception : after_request n'a pas été appelé
+    handle = g.pop("profile", None)
+    if handle:
+        profiling.stop_request_profile(handle)
+
 # Dictionnaire pour suivre le statut des tâches
 task_status = {
     "status": "idle",
@@ -71,13 +98,16 @@ def set_task_status(status, message, output_file_name=None):
     task_status["status"] = status
     task_status["message"] = message
     task_status["output_file_name"] = output_file_name
-    logger.info(f"Statut mis à jour : {task_status}")
+    logger.info("Statut mis à jour : %s", task_status)
 
 def start_translation_process(input_file_path, output_file_path):
     """
     Fonction de traitement en arrière-plan pour la traduction.
     Utilisation correcte du contexte Flask.
     """
+    # Import différé : requests n'est chargé qu'au premier lancement de traduction
+    from translation_app.utils import translate_docx_with_deepl
+
     app_context = app.app_context()
     app_context.push()
     try:
@@ -97,7 +127,7 @@ def start_translation_process(input_file_path, output_file_path):
         logger.info("Traduction terminée avec succès.")
     except Exception as e:
         set_task_status("error", f"Erreur lors du traitement : {str(e)}")
-        logger.error(f"Erreur dans le traitement : {e}")
+        logger.error("Erreur dans le traitement : %s", e)
     finally:
         app_context.pop()
 
@@ -153,11 +183,10 @@ def upload_file():
     if file.filename == "":
         return jsonify({"message": "Nom de fichier invalide"}), 400
 
-    input_file_path = os.path.join(app.config["UPLOAD_FOLDER"], file.filename)
-    output_file_path = os.path.join(app.config["DOWNLOAD_FOLDER"], f"translated_{file.filename}")
-    
-    file.save(input_file_path)
-    logger.info(f"Fichier téléchargé : {input_file_path}")
+    blob = blob_store.save_upload(file, "translation", owner=auth.current_user())
+    input_file_path = blob["path"]
+    output_file_path = os.path.join(app.config["DOWNLOAD_FOLDER"], f"translated_{blob['filename']}")
+    logger.info("Fichier téléchargé : %s", input_file_path)
 
     # Lancer la traduction dans un thread séparé
     thread = threading.Thread(target=start_translation_process, args=(input_file_path, output_file_path))
@@ -203,7 +232,7 @@ def download_file(filename):
     if not os.path.exists(os.path.join(download_path, filename)):
         return jsonify({"message": "Fichier non trouvé."}), 404
     
-    return send_from_directory(download_path, filename, as_attachment=True)
+    return send_download(download_path, filename)
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,87 @@
+"""
+Mémoire maximale de l'amélioration d'un .docx selon sa taille, en mode classique (documents
+entiers en mémoire) et en mode streaming. Les appels ChatGPT sont remplacés par l'identité :
+seul le traitement des documents est mesuré.
+
+Usage : python benchmarks/docx_memory_benchmark.py [--paragraphs 2000,10000,40000] [--history fichier.jsonl]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PARAGRAPH = ("Le magicien présente un jeu de cartes ordinaire, le fait mélanger par un spectateur "
+             "puis annonce, sans jamais le toucher, la carte choisie. ") * 3
+
+# Exécuté dans un processus neuf : la mémoire maximale mesurée est celle d'un seul passage
+PROBE = """
+import json, resource, sys, time
+from translation_app import utils
+utils.process_paragraphs = lambda paragraphs, *args, **kwargs: "\\n".join(paragraphs)
+baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+utils.improve_translation(sys.argv[1], None, sys.argv[2], "soutenu", "EN", "FR", 5, "gpt-4",
+                          checkpoint_interval=3600, streaming=sys.argv[3] == "1")
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "baseline_rss_kb": baseline_kb,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+
+def make_document(path, paragraphs):
+    """Document de test écrit au fil de l'eau (sa création ne pèse pas sur la mesure)."""
+    from translation_app.docx_stream import StreamingDocxWriter
+
+    with StreamingDocxWriter(os.path.dirname(path)) as writer:
+        for index in range(paragraphs):
+            writer.add_paragraph(f"{index}. {PARAGRAPH}")
+        writer.save(path)
+
+
+def run_once(input_path, output_path, streaming, storage):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, input_path, output_path, "1" if streaming else "0"],
+        cwd=ROOT,
+        env={**os.environ, "PERSISTENT_STORAGE": storage},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", default="2000,10000,40000", help="Tailles de document (paragraphes)")
+    parser.add_argument("--history", help="Fichier JSONL auquel ajouter le résultat")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for paragraphs in [int(value) for value in args.paragraphs.split(",")]:
+            input_path = os.path.join(workdir, f"input_{paragraphs}.docx")
+            make_document(input_path, paragraphs)
+            row = {"paragraphs": paragraphs, "input_bytes": os.path.getsize(input_path)}
+            for mode, streaming in (("in_memory", False), ("streaming", True)):
+                run = run_once(input_path, os.path.join(workdir, f"output_{mode}.docx"), streaming, workdir)
+                row[f"{mode}_peak_mb"] = round((run["max_rss_kb"] - run["baseline_rss_kb"]) / 1024, 1)
+                row[f"{mode}_seconds"] = round(run["seconds"], 2)
+            results.append(row)
+            print(json.dumps(row))
+
+    result = {"date": datetime.now().isoformat(timespec="seconds"), "results": results}
+    if args.history:
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
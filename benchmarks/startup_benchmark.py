@@ -0,0 +1,72 @@
+"""
+Mesure du démarrage de l'application : temps d'import de `app`, mémoire maximale
+et dépendances lourdes chargées à l'import.
+
+Usage : python benchmarks/startup_benchmark.py [--runs 5] [--history fichier.jsonl]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["docx", "openai", "requests", "pandas", "fpdf", "PyPDF2", "chardet", "tqdm", "fontTools"]
+
+# Exécuté dans un processus neuf pour mesurer un démarrage à froid
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+import_seconds = time.perf_counter() - start
+start = time.perf_counter()
+app.app.test_client().get("/favicon.ico")
+first_request_seconds = time.perf_counter() - start
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "first_request_seconds": first_request_seconds,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "heavy_loaded": [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def run_once():
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    # Seule la dernière ligne est le résultat (l'application peut écrire dans stdout)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--history", help="Fichier JSONL auquel ajouter le résultat")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    result = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "runs": args.runs,
+        "import_seconds_median": statistics.median(r["import_seconds"] for r in runs),
+        "first_request_seconds_median": statistics.median(r["first_request_seconds"] for r in runs),
+        "max_rss_kb_median": statistics.median(r["max_rss_kb"] for r in runs),
+        "heavy_loaded": runs[-1]["heavy_loaded"],
+    }
+    print(json.dumps(result, indent=2))
+
+    if args.history:
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+from werkzeug.utils import secure_filename
+
+from config import Config
+import retention
+
+logger = logging.getLogger(__name__)
+
+# Stockage adressé par contenu : chaque fichier est rangé sous
+# BLOB_FOLDER/<2 premiers caractères du SHA-256>/<sha256><extension>.
+# Les noms de fichiers d'origine d'un espace de noms (translation, calculator, marketing...)
+# sont associés aux blobs par un petit enregistrement par nom, names/<espace>/<clé>.json,
+# et chaque blob garde ses références, names/refs/<sha256>/<espace>.<clé>, pour que la
+# rétention efface les noms d'un blob supprimé sans parcourir les espaces de noms.
+BLOB_FOLDER = Config.BLOB_FOLDER
+NAMES_FOLDER = os.path.join(BLOB_FOLDER, "names")
+REFS_FOLDER = os.path.join(NAMES_FOLDER, "refs")
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_STEM = "fichier"
+
+
+def blob_path(sha256, ext=""):
+    return os.path.join(BLOB_FOLDER, sha256[:2], f"{sha256}{ext.lower()}")
+
+
+def _name_key(filename):
+    return hashlib.sha1(filename.encode("utf-8")).hexdigest()
+
+
+def _record_path(namespace, filename):
+    return os.path.join(NAMES_FOLDER, namespace, f"{_name_key(filename)}.json")
+
+
+def _ref_path(sha256, namespace, filename):
+    return os.path.join(REFS_FOLDER, sha256, f"{namespace}.{_name_key(filename)}")
+
+
+def _read_record(namespace, filename):
+    try:
+        with open(_record_path(namespace, filename), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_record(namespace, filename, entry):
+    path = _record_path(namespace, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(dict(entry, filename=filename), f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def secure_name(filename):
+    """
+    secure_filename qui conserve l'extension d'origine : un nom non ASCII ("日本.docx")
+    deviendrait sinon "docx", sans extension.
+    """
+    stem, ext = os.path.splitext(os.path.basename(filename or ""))
+    if not ext and stem.startswith("."):
+        # ".docx" : splitext y voit un nom sans extension
+        stem, ext = "", stem
+    ext = secure_filename(ext).lower()
+    return f"{secure_filename(stem) or DEFAULT_STEM}{'.' + ext if ext else ''}"
+
+
+def store_stream(stream, filename, namespace, owner=None):
+    """
+    Écrit le flux dans le stockage en calculant son SHA-256 au passage
+    (fichier temporaire puis rename atomique). Si le contenu existe déjà,
+    le blob existant est réutilisé. `filename` doit déjà être sûr (secure_name).
+    Retourne la description du blob.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    tmp_folder = os.path.join(BLOB_FOLDER, "tmp")
+    os.makedirs(tmp_folder, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_folder)
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                tmp_file.write(chunk)
+                size += len(chunk)
+
+        sha256 = digest.hexdigest()
+        path = blob_path(sha256, ext)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            # Rafraîchir la date pour que la rétention ne supprime pas un blob réutilisé
+            os.utime(path)
+            logger.info("♻️ Contenu déjà stocké, blob réutilisé : %s", path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            retention.record_file_added(path)
+            logger.info("✅ Nouveau blob enregistré : %s (%s octets)", path, size)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    entry = {
+        "sha256": sha256,
+        "ext": ext,
+        "size": size,
+        "owner": owner,
+        "stored_at": datetime.now().isoformat(),
+    }
+    # Référence écrite avant l'enregistrement : un nom ne pointe jamais vers un blob qui l'ignore
+    ref_path = _ref_path(sha256, namespace, filename)
+    os.makedirs(os.path.dirname(ref_path), exist_ok=True)
+    open(ref_path, "a").close()
+    _write_record(namespace, filename, entry)
+
+    return dict(entry, filename=filename, path=path)
+
+
+def save_upload(file_storage, namespace, owner=None):
+    """Enregistre un fichier envoyé (werkzeug FileStorage) dans le stockage par contenu."""
+    return store_stream(file_storage.stream, secure_name(file_storage.filename), namespace, owner=owner)
+
+
+def resolve_name(namespace, filename):
+    """Retourne le chemin du blob associé à un nom de fichier, ou None."""
+    entry = _read_record(namespace, filename)
+    if not entry:
+        return None
+    path = blob_path(entry["sha256"], entry["ext"])
+    return path if os.path.exists(path) else None
+
+
+def forget_blob(path):
+    """
+    Retire les noms qui désignent encore un blob supprimé (appelé par la rétention).
+    Un nom réassocié depuis à un autre contenu est conservé.
+    """
+    sha256 = os.path.splitext(os.path.basename(path))[0]
+    refs_folder = os.path.join(REFS_FOLDER, sha256)
+    if os.path.dirname(os.path.dirname(os.path.abspath(path))) != os.path.abspath(BLOB_FOLDER) \
+            or not os.path.isdir(refs_folder):
+        return
+    for ref in os.listdir(refs_folder):
+        namespace, key = ref.split(".", 1)
+        record_path = os.path.join(NAMES_FOLDER, namespace, f"{key}.json")
+        try:
+            with open(record_path, "r", encoding="utf-8") as f:
+                if json.load(f).get("sha256") == sha256:
+                    os.remove(record_path)
+        except (FileNotFoundError, ValueError):
+            pass
+    shutil.rmtree(refs_folder, ignore_errors=True)
+    logger.info("🗑️ Noms du blob supprimé retirés : %s", sha256)
+
+
+def link_to(path, destination):
+    """
+    Expose un blob sous un autre nom (lien physique, sans copie).
+    Copie le fichier si le lien est impossible (autre système de fichiers).
+    """
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(path, destination)
+    except OSError:
+        shutil.copyfile(path, destination)
+    return destination
@@ -1,8 +1,9 @@
-import docx
 from datetime import timedelta
 
 def get_docx_stats(file_path):
     """Récupère les statistiques d'un fichier .docx"""
+    import docx
+
     doc = docx.Document(file_path)
     words = 0
     characters = 0
@@ -1,6 +1,5 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from werkzeug.utils import secure_filename
-import os
+import blob_store
 from calculator_app.python_docx import (
     get_docx_stats,
     calculate_translation_time,
@@ -10,10 +9,6 @@ from calculator_app.python_docx import (
 
 calculator_bp = Blueprint("calculator", __name__, template_folder="templates")
 
-# Configuration des dossiers
-UPLOAD_FOLDER = "uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
 @calculator_bp.route("/", methods=["GET", "POST"])
 def index():
     """Affiche l'interface principale de la calculette."""
@@ -27,9 +22,8 @@ def index():
             flash("Veuillez télécharger un fichier.", "error")
             return redirect(url_for("calculator.index"))
 
-        # Enregistrer le fichier téléchargé
-        file_path = os.path.join(UPLOAD_FOLDER, secure_filename(file.filename))
-        file.save(file_path)
+        # Enregistrer le fichier téléchargé (stockage adressé par contenu)
+        file_path = blob_store.save_upload(file, "calculator", owner=request.authorization.username if request.authorization else None)["path"]
 
         # Calculs basés sur le fichier
         try:
@@ -22,20 +22,135 @@ class Config:
     DOWNLOAD_FOLDER = os.path.join(PERSISTENT_STORAGE, "downloads")
     MARKETING_FOLDER = os.path.join(DOWNLOAD_FOLDER, "marketing")
 
+    # Stockage des fichiers envoyés, adressé par contenu (SHA-256)
+    BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, "blobs")
+
     # Dossiers pour les glossaires
     GLOSSARY_FOLDER = os.path.join(PERSISTENT_STORAGE, "glossaries")
     DEEPL_GLOSSARY_FOLDER = os.path.join(GLOSSARY_FOLDER, "deepl")
     GPT_GLOSSARY_FOLDER = os.path.join(GLOSSARY_FOLDER, "chatgpt")
 
+    # Dossier des tâches en arrière-plan (partagé entre les workers gunicorn)
+    JOBS_FOLDER = os.path.join(PERSISTENT_STORAGE, "jobs")
+
+    # Cache des améliorations ChatGPT par paragraphe (sortie structurée)
+    GPT_CACHE_FOLDER = os.path.join(PERSISTENT_STORAGE, "gpt_cache")
+
+    # Enregistrements des traductions produites (base des révisions : seuls les paragraphes modifiés
+    # sont retraduits)
+    REVISIONS_FOLDER = os.path.join(PERSISTENT_STORAGE, "revisions")
+
+    # Profils cProfile des requêtes et tâches profilées à la demande
+    PROFILES_FOLDER = os.path.join(PERSISTENT_STORAGE, "profiles")
+
+    # Journal de consommation API (un fichier JSONL par mois), jamais purgé par la rétention :
+    # source de /system/usage_report une fois les tâches supprimées
+    USAGE_LEDGER_FOLDER = os.path.join(PERSISTENT_STORAGE, "usage_ledger")
+
+    # Téléchargements : délégation optionnelle à un proxy frontal
+    # ("x-accel-redirect" pour nginx, "x-sendfile" pour Apache/lighttpd)
+    DOWNLOAD_OFFLOAD = os.environ.get("DOWNLOAD_OFFLOAD", "").lower() or None
+    X_ACCEL_REDIRECT_PREFIX = os.environ.get("X_ACCEL_REDIRECT_PREFIX", "/protected/")
+    USE_X_SENDFILE = DOWNLOAD_OFFLOAD == "x-sendfile"
+    DOWNLOAD_MAX_AGE = int(os.environ.get("DOWNLOAD_MAX_AGE", 0))
+
+    # Politiques de rétention par dossier (None = pas de limite).
+    # Les fichiers modifiés depuis moins de RETENTION_MIN_AGE_SECONDS ne sont jamais supprimés,
+    # ni ceux encore utilisés ("protect" : blobs d'entrée et fichiers des tâches non terminées).
+    RETENTION_POLICIES = {
+        "uploads": {"path": UPLOAD_FOLDER, "recursive": True, "max_age_days": 30,
+                    "max_total_bytes": 20 * 1024**3, "keep_latest": None, "evictable": True,
+                    "exclude": [os.path.join("blobs", "names")], "protect": "referenced_blobs"},
+        "downloads": {"path": DOWNLOAD_FOLDER, "recursive": False, "max_age_days": 90,
+                      "max_total_bytes": 20 * 1024**3, "keep_latest": None, "evictable": True},
+        "marketing": {"path": MARKETING_FOLDER, "recursive": False, "max_age_days": 180,
+                      "max_total_bytes": 5 * 1024**3, "keep_latest": None, "evictable": True},
+        "glossaries": {"path": GLOSSARY_FOLDER, "recursive": True, "max_age_days": None,
+                       "max_total_bytes": None, "keep_latest": None, "evictable": False},
+        # Seuls le JSON et la sortie partielle des tâches sont purgés (jamais leurs fichiers de verrou)
+        "jobs": {"path": JOBS_FOLDER, "recursive": False, "max_age_days": 30,
+                 "max_total_bytes": None, "keep_latest": 5000, "evictable": True,
+                 "extensions": [".json", ".out"], "protect": "active_jobs"},
+        # Les enregistrements utilisés par une révision en cours, ou dont le manuscrit source
+        # sert à une tâche non terminée, sont conservés
+        "revisions": {"path": REVISIONS_FOLDER, "recursive": False, "max_age_days": 180,
+                      "max_total_bytes": 2 * 1024**3, "keep_latest": None, "evictable": True,
+                      "extensions": [".json"], "protect": "revision_records"},
+        # Cache reconstructible : un paragraphe absent est simplement redemandé à ChatGPT.
+        # Compté à chaque passage (pas de mise à jour des compteurs à chaque paragraphe écrit)
+        "gpt_cache": {"path": GPT_CACHE_FOLDER, "recursive": True, "max_age_days": 60,
+                      "max_total_bytes": 2 * 1024**3, "keep_latest": None, "evictable": True,
+                      "extensions": [".json"]},
+        "profiles": {"path": PROFILES_FOLDER, "recursive": False, "max_age_days": 14,
+                     "max_total_bytes": 1024**3, "keep_latest": None, "evictable": True},
+        # Ancien dossier relatif de la calculette (plus alimenté depuis le stockage par contenu)
+        # (seuls les .docx déposés par la calculette sont concernés)
+        "calculator": {"path": os.path.join(BASE_DIR, "uploads"), "recursive": False, "max_age_days": 7,
+                       "max_total_bytes": None, "keep_latest": None, "evictable": True,
+                       "extensions": [".docx"]},
+    }
+    RETENTION_INTERVAL_SECONDS = int(os.environ.get("RETENTION_INTERVAL_SECONDS", 3600))
+    RETENTION_MIN_AGE_SECONDS = 3600
+    # Purge d'urgence quand l'espace libre passe sous ce ratio, jusqu'à revenir au ratio cible
+    DISK_LOW_WATERMARK = float(os.environ.get("DISK_LOW_WATERMARK", 0.10))
+    DISK_TARGET_FREE = float(os.environ.get("DISK_TARGET_FREE", 0.20))
+
+    # File d'attente des traductions : limites partagées par tous les processus
+    TRANSLATION_MAX_JOBS = int(os.environ.get("TRANSLATION_MAX_JOBS", 6))
+    DEEPL_MAX_CONCURRENCY = int(os.environ.get("DEEPL_MAX_CONCURRENCY", 3))
+    OPENAI_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", 4))
+    # Moteur DeepL par défaut : "document" (API document) ou "text" (API texte, par paragraphes)
+    DEEPL_ENGINE = os.environ.get("DEEPL_ENGINE", "document")
+    # Sortie ChatGPT par défaut : "text" (un texte par groupe) ou "structured" (JSON par paragraphe)
+    GPT_OUTPUT = os.environ.get("GPT_OUTPUT", "text")
+    # Au-delà de cette taille (traduction DeepL), l'amélioration lit et écrit le .docx au fil de l'eau
+    # en mémoire bornée plutôt que de charger les documents entiers (0 : toujours)
+    DOCX_STREAMING_MIN_BYTES = int(os.environ.get("DOCX_STREAMING_MIN_BYTES", 2 * 1024 * 1024))
+    # Priorités des tâches (la plus petite valeur passe en premier)
+    JOB_PRIORITIES = {"rush": 0, "normal": 1, "background": 2}
+    # Priorités accessibles aux lots (/bulk) : "rush" est réservée aux tâches interactives, qui
+    # n'occupent pas d'emplacement "bulk"
+    BULK_PRIORITIES = ("normal", "background")
+    SCHEDULER_POLL_SECONDS = 2
+    # Une tâche "running" sans signe de vie depuis ce délai est remise en file (processus mort)
+    JOB_STALE_SECONDS = 600
+    # Exécution des tâches dans les workers gunicorn. À désactiver ("0") lorsque des processus
+    # dédiés (`python -m translation_app.your_script worker`) consomment la file.
+    TRANSLATION_RUN_IN_WEB = os.environ.get("TRANSLATION_RUN_IN_WEB", "1") != "0"
+    # Emplacements de TRANSLATION_MAX_JOBS réservés aux tâches urgentes (document unique, révision) :
+    # les lots ("normal", "background") n'en occupent jamais plus que le reste
+    INTERACTIVE_RESERVED_JOBS = int(os.environ.get("INTERACTIVE_RESERVED_JOBS", 1))
+    # Processus d'extraction des gros PDF (marketing), partagés par toutes les tâches d'un worker
+    PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", 2))
+
+    # Partage équitable de la file entre utilisateurs : valeurs par défaut, surchargées par
+    # utilisateur dans USER_QUOTAS, par ex. {"thomas": {"weight": 2, "daily_spend": 40}}.
+    # weight : part relative des emplacements ; max_running_jobs : tâches simultanées ;
+    # daily_spend : dépense API estimée (USD) au-delà de laquelle ses tâches attendent le lendemain (0 = illimitée)
+    USER_DEFAULT_QUOTA = {
+        "weight": 1,
+        "max_running_jobs": int(os.environ.get("USER_MAX_RUNNING_JOBS", 3)),
+        "daily_spend": float(os.environ.get("USER_DAILY_SPEND", 0)),
+    }
+    USER_QUOTAS = {}
+    # Tarifs servant à estimer la dépense (USD) : par 1 000 tokens OpenAI, par caractère DeepL
+    API_PRICES = {
+        "gpt-3.5-turbo": {"prompt": 0.0005, "completion": 0.0015},
+        "gpt-4": {"prompt": 0.03, "completion": 0.06},
+        "deepl": 0.00002,
+    }
+
     # Création des répertoires s'ils n'existent pas
     @staticmethod
     def create_directories():
         os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+        os.makedirs(Config.BLOB_FOLDER, exist_ok=True)
         os.makedirs(Config.DOWNLOAD_FOLDER, exist_ok=True)
         os.makedirs(Config.MARKETING_FOLDER, exist_ok=True)
         os.makedirs(Config.GLOSSARY_FOLDER, exist_ok=True)
         os.makedirs(Config.DEEPL_GLOSSARY_FOLDER, exist_ok=True)
         os.makedirs(Config.GPT_GLOSSARY_FOLDER, exist_ok=True)
+        os.makedirs(Config.JOBS_FOLDER, exist_ok=True)
 
     # Configuration des sessions
     SESSION_TYPE = "filesystem"
@@ -51,6 +166,19 @@ class Config:
         "florian": os.environ.get('VIEWER_PASSWORD', 'Roue2021*')
     }
 
+    # Utilisateurs autorisés à profiler une requête ou une tâche (en-tête X-Profile ou ?_profile=1)
+    ADMIN_USERS = {"admin"}
+
+    # Journalisation : niveau global, niveaux par module et échantillonnage des messages fréquents
+    # (1 message sur N : lignes d'accès werkzeug/gunicorn des routes /<clé> et logs marqués extra={"sample": clé})
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    LOG_LEVELS = {
+        "werkzeug": "INFO",
+        "urllib3": "WARNING",
+        "openai": "WARNING",
+    }
+    LOG_SAMPLE_RATES = {"check_status": 50, "file_listing": 20}
+
     # Configuration Flask-HTTPAuth pour HTTP Basic Auth
     AUTH_REALM = "Authentification requise"
     AUTH_ERROR_MESSAGE = "Nom d'utilisateur ou mot de passe incorrect."
@@ -0,0 +1,52 @@
+import mimetypes
+import os
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from flask import abort, current_app, make_response, send_from_directory
+from werkzeug.security import safe_join
+
+
+def send_download(directory, filename):
+    """
+    Envoie un fichier en téléchargement.
+
+    - Par défaut : réponse conditionnelle (ETag / Last-Modified → 304) et
+      requêtes HTTP Range (206) pour les téléchargements reprenables.
+    - DOWNLOAD_OFFLOAD = "x-accel-redirect" : le fichier est servi par nginx
+      via un emplacement interne (X_ACCEL_REDIRECT_PREFIX → PERSISTENT_STORAGE),
+      le worker Python ne renvoie que les en-têtes.
+    - DOWNLOAD_OFFLOAD = "x-sendfile" : idem via l'en-tête X-Sendfile
+      (Apache mod_xsendfile, lighttpd), géré nativement par Flask.
+    """
+    offload = current_app.config.get("DOWNLOAD_OFFLOAD")
+
+    if offload == "x-accel-redirect":
+        file_path = safe_join(directory, filename)
+        # Même contrôle que send_from_directory : nom hors du dossier ("..", chemin absolu) ou absent
+        if file_path is None or not os.path.isfile(file_path):
+            abort(404)
+        storage = os.path.abspath(current_app.config["PERSISTENT_STORAGE"])
+        relative_path = os.path.relpath(os.path.abspath(file_path), storage)
+        stat = os.stat(file_path)
+
+        response = make_response("")
+        response.headers["X-Accel-Redirect"] = current_app.config["X_ACCEL_REDIRECT_PREFIX"] + quote(relative_path)
+        response.headers["Content-Type"] = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(os.path.basename(filename))}"
+        response.set_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+        response.last_modified = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+        return response
+
+    response = send_from_directory(
+        directory,
+        filename,
+        as_attachment=True,
+        conditional=True,
+        etag=True,
+        max_age=current_app.config.get("DOWNLOAD_MAX_AGE", 0),
+    )
+    # Fichiers propres à l'utilisateur : pas de cache partagé, revalidation par ETag
+    response.cache_control.private = True
+    response.cache_control.public = False
+    return response
@@ -0,0 +1,35 @@
+import importlib
+import logging
+import resource
+
+logger = logging.getLogger("gunicorn.error")
+
+# Modules lourds importés paresseusement par l'application : chargés une fois
+# dans le processus maître (--preload) pour être partagés en copy-on-write.
+WARM_MODULES = ["docx", "openai", "requests", "pandas", "fpdf", "PyPDF2"]
+
+
+def when_ready(server):
+    """Préchauffe les dépendances lourdes et la police PDF avant le fork des workers."""
+    # Les lignes d'accès gunicorn ne passent pas par le logger racine : /check_status y est
+    # échantillonné directement (filtre hérité par les workers)
+    from logging_setup import sample_access_log
+    sample_access_log()
+
+    for name in WARM_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning("⚠️ Préchargement de %s impossible : %s", name, e)
+
+    try:
+        from marketing_app.pdf_renderer import preload_fonts
+        preload_fonts()
+    except Exception as e:
+        logger.warning("⚠️ Préchargement de la police impossible : %s", e)
+
+    logger.info("✅ Maître prêt, mémoire max : %s Ko", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def post_worker_init(worker):
+    logger.info("📌 Worker %s démarré, mémoire max : %s Ko", worker.pid, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
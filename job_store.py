@@ -0,0 +1,211 @@
+import fcntl
+import json
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import Config
+
+# Les tâches sont stockées sur disque (un fichier JSON par tâche) afin que
+# tous les workers gunicorn voient le même état, quel que soit le worker
+# qui a lancé la tâche.
+JOBS_FOLDER = Config.JOBS_FOLDER
+# Index des tâches actives (un marqueur vide par tâche en attente ou en cours) et des lots
+# (identifiants de leurs tâches) : la file et le suivi des lots ne relisent que ces tâches-là,
+# pas l'ensemble des tâches conservées.
+ACTIVE_STATUSES = ("queued", "running")
+ACTIVE_FOLDER = os.path.join(JOBS_FOLDER, "active")
+BATCHES_FOLDER = os.path.join(JOBS_FOLDER, "batches")
+
+
+def _job_path(job_id):
+    return os.path.join(JOBS_FOLDER, f"{job_id}.json")
+
+
+def _output_path(job_id):
+    return os.path.join(JOBS_FOLDER, f"{job_id}.out")
+
+
+@contextmanager
+def _locked(job_id):
+    """Verrou exclusif inter-processus sur une tâche."""
+    os.makedirs(JOBS_FOLDER, exist_ok=True)
+    with open(os.path.join(JOBS_FOLDER, f"{job_id}.lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _marker_path(job_id):
+    return os.path.join(ACTIVE_FOLDER, job_id)
+
+
+def _write_job(job):
+    """
+    Écriture atomique (fichier temporaire + rename) du JSON de la tâche, sous son verrou.
+    Le marqueur d'activité est créé avant l'écriture et supprimé après : un arrêt entre les deux
+    ne peut laisser qu'un marqueur en trop, jamais une tâche active absente de l'index.
+    """
+    active = job["status"] in ACTIVE_STATUSES
+    if active:
+        os.makedirs(ACTIVE_FOLDER, exist_ok=True)
+        open(_marker_path(job["id"]), "a").close()
+    fd, tmp_path = tempfile.mkstemp(dir=JOBS_FOLDER, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, _job_path(job["id"]))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if not active and os.path.exists(_marker_path(job["id"])):
+        os.remove(_marker_path(job["id"]))
+
+
+def create_job(kind, owner=None, **fields):
+    """Crée une nouvelle tâche en attente et la retourne."""
+    os.makedirs(JOBS_FOLDER, exist_ok=True)
+    now = datetime.now().isoformat()
+    job = {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "owner": owner,
+        "status": "queued",
+        "message": "En attente de traitement.",
+        "created_at": now,
+        "updated_at": now,
+        "result_files": [],
+    }
+    job.update(fields)
+    with _locked(job["id"]):
+        _write_job(job)
+    if job.get("batch_id"):
+        os.makedirs(BATCHES_FOLDER, exist_ok=True)
+        with open(os.path.join(BATCHES_FOLDER, job["batch_id"]), "a", encoding="utf-8") as f:
+            f.write(job["id"] + "\n")
+    return job
+
+
+def get_job(job_id):
+    """Retourne la tâche ou None si elle n'existe pas."""
+    try:
+        with open(_job_path(job_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def update_job(job_id, **fields):
+    """Met à jour les champs d'une tâche et retourne la version enregistrée."""
+    with _locked(job_id):
+        job = get_job(job_id)
+        if job is None:
+            raise KeyError(f"Tâche introuvable : {job_id}")
+        job.update(fields)
+        job["updated_at"] = datetime.now().isoformat()
+        _write_job(job)
+    return job
+
+
+def transition_job(job_id, from_statuses, **fields):
+    """
+    Met à jour la tâche seulement si son statut fait partie de `from_statuses`
+    (vérifié sous verrou). Retourne la tâche mise à jour, ou None sinon.
+    """
+    with _locked(job_id):
+        job = get_job(job_id)
+        if job is None or job["status"] not in from_statuses:
+            return None
+        job.update(fields)
+        job["updated_at"] = datetime.now().isoformat()
+        _write_job(job)
+    return job
+
+
+def claim_job(job_id, **fields):
+    """Réserve une tâche en attente (un seul processus peut l'obtenir), ou retourne None."""
+    return transition_job(job_id, ("queued",), status="running", **fields)
+
+
+def _load_jobs(job_ids, kind=None):
+    jobs = []
+    for job_id in job_ids:
+        job = get_job(job_id)
+        if job and (kind is None or job.get("kind") == kind):
+            jobs.append(job)
+    jobs.sort(key=lambda j: j["created_at"], reverse=True)
+    return jobs
+
+
+def list_jobs(kind=None):
+    """Liste toutes les tâches conservées (les plus récentes en premier)."""
+    if not os.path.exists(JOBS_FOLDER):
+        return []
+    return _load_jobs((name[:-len(".json")] for name in os.listdir(JOBS_FOLDER) if name.endswith(".json")), kind)
+
+
+def _drop_stale_marker(job_id):
+    """Retire le marqueur d'une tâche terminée ou supprimée (vérifié sous le verrou de la tâche)."""
+    with _locked(job_id):
+        job = get_job(job_id)
+        if (job is None or job["status"] not in ACTIVE_STATUSES) and os.path.exists(_marker_path(job_id)):
+            os.remove(_marker_path(job_id))
+
+
+def list_active_jobs(kind=None):
+    """Tâches en attente ou en cours (les plus récentes en premier), lues à partir de l'index."""
+    if not os.path.isdir(ACTIVE_FOLDER):
+        return []
+    jobs = []
+    for job_id in os.listdir(ACTIVE_FOLDER):
+        job = get_job(job_id)
+        if job is None or job["status"] not in ACTIVE_STATUSES:
+            _drop_stale_marker(job_id)
+        elif kind is None or job.get("kind") == kind:
+            jobs.append(job)
+    jobs.sort(key=lambda j: j["created_at"], reverse=True)
+    return jobs
+
+
+def list_batch_jobs(batch_id, kind=None):
+    """Tâches d'un lot (les plus récentes en premier), sans parcourir les autres tâches."""
+    if not batch_id.isalnum():
+        return []
+    try:
+        with open(os.path.join(BATCHES_FOLDER, batch_id), "r", encoding="utf-8") as f:
+            job_ids = f.read().split()
+    except (FileNotFoundError, ValueError):
+        return []
+    return _load_jobs(job_ids, kind)
+
+
+def append_output(job_id, text):
+    """Ajoute du texte au flux de sortie partiel de la tâche."""
+    if text:
+        with open(_output_path(job_id), "a", encoding="utf-8") as f:
+            f.write(text)
+
+
+def has_output(job_id):
+    return os.path.exists(_output_path(job_id))
+
+
+def read_output(job_id, offset=0):
+    """
+    Lit le flux de sortie à partir d'un offset (en octets).
+    Retourne le texte lu et le nouvel offset à utiliser au prochain appel.
+    """
+    try:
+        with open(_output_path(job_id), "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return "", offset
+    # Ne pas couper un caractère UTF-8 multi-octets en deux
+    text = data.decode("utf-8", errors="ignore")
+    return text, offset + len(text.encode("utf-8"))
@@ -0,0 +1,116 @@
+import atexit
+import copy
+import itertools
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from config import Config
+
+# Journalisation non bloquante : les threads des requêtes et des tâches ne font que déposer
+# l'enregistrement (message déjà interpolé) dans une file ; la mise en forme et l'écriture sur
+# la sortie sont faites par le thread du QueueListener. Configurée une seule fois par processus.
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+# Loggers des lignes d'accès HTTP : serveur de développement et gunicorn
+ACCESS_LOGGERS = ("werkzeug", "gunicorn.access")
+
+_lock = threading.Lock()
+_queue_handler = None
+_listener = None
+
+
+class _LazyQueueHandler(QueueHandler):
+    """Dépose une copie de l'enregistrement, sans appliquer le Formatter (fait par le listener)."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Trace rendue ici : l'objet traceback ne doit pas survivre au thread appelant
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Ne laisse passer qu'un message sur N pour les messages fréquents : ceux marqués
+    `extra={"sample": clé}` et les lignes d'accès (werkzeug, gunicorn) des routes `/<clé>`, avec N lu
+    dans `rates` ({clé: N}). Les avertissements et erreurs ne sont jamais échantillonnés.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = {key: rate for key, rate in rates.items() if rate > 1}
+        self._counters = {key: itertools.count() for key in self.rates}
+
+    def _key(self, record):
+        key = getattr(record, "sample", None)
+        if key is None and record.name in ACCESS_LOGGERS and self.rates:
+            message = record.getMessage()
+            key = next((candidate for candidate in self.rates if f"/{candidate}" in message), None)
+        return key
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = self._key(record)
+        if key not in self.rates:
+            return True
+        return next(self._counters[key]) % self.rates[key] == 0
+
+
+def sample_access_log(name="gunicorn.access"):
+    """
+    Échantillonne les lignes d'accès d'un logger qui ne se propage pas jusqu'au logger racine
+    (gunicorn.access a ses propres handlers), en posant le filtre sur le logger lui-même.
+    """
+    logger = logging.getLogger(name)
+    if not any(isinstance(f, SamplingFilter) for f in logger.filters):
+        logger.addFilter(SamplingFilter(Config.LOG_SAMPLE_RATES))
+
+
+def _start_listener():
+    global _listener
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_after_fork():
+    # gunicorn --preload : le thread du listener n'existe plus dans le worker forké
+    if _queue_handler is not None:
+        _start_listener()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def configure_logging():
+    """Installe le QueueHandler sur le logger racine et applique les niveaux de Config (idempotent)."""
+    global _queue_handler
+    with _lock:
+        if _queue_handler is not None:
+            return
+        _queue_handler = _LazyQueueHandler(queue.SimpleQueue())
+        _queue_handler.addFilter(SamplingFilter(Config.LOG_SAMPLE_RATES))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(Config.LOG_LEVEL)
+        for name, level in Config.LOG_LEVELS.items():
+            logging.getLogger(name).setLevel(level)
+
+        _start_listener()
+        os.register_at_fork(after_in_child=_restart_after_fork)
+        atexit.register(_stop_listener)
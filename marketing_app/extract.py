@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Au-delà de ce nombre de pages, l'extraction PDF est répartie entre plusieurs processus
+PARALLEL_PDF_MIN_PAGES = 40
+PAGES_PER_TASK = 10
+
+SUPPORTED_EXTENSIONS = {".docx", ".txt", ".pdf"}
+
+# Pool unique par processus, créé au premier gros PDF. "spawn" : un fork depuis un worker
+# gunicorn multithreadé (répartiteur, listener de logs) pourrait hériter d'un verrou tenu.
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def iter_docx_text(path):
+    """Produit le texte de chaque paragraphe non vide d'un fichier DOCX."""
+    from docx import Document
+
+    doc = Document(path)
+    for paragraph in doc.paragraphs:
+        if paragraph.text.strip():
+            yield paragraph.text
+
+
+def iter_txt_text(path):
+    """Produit les lignes d'un fichier texte sans le charger entièrement."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.strip():
+                yield line
+
+
+def _extract_pdf_pages(args):
+    """Extrait le texte d'une plage de pages (exécuté dans un processus du pool)."""
+    from PyPDF2 import PdfReader
+
+    path, start, end = args
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=Config.PDF_EXTRACT_WORKERS, mp_context=get_context("spawn"))
+        return _pool
+
+
+def _discard_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_pdf_text(path, parallel=True):
+    """
+    Produit le texte d'un PDF page par page, dans l'ordre.
+    Les gros PDF sont découpés en plages de pages traitées en parallèle.
+    """
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    page_count = len(reader.pages)
+    logger.info("Extraction du PDF %s (%s pages)", path, page_count)
+
+    if page_count < PARALLEL_PDF_MIN_PAGES or not parallel or Config.PDF_EXTRACT_WORKERS <= 1:
+        for page in reader.pages:
+            text = page.extract_text() or ""
+            if text.strip():
+                yield text
+        return
+
+    ranges = [(path, start, min(start + PAGES_PER_TASK, page_count))
+              for start in range(0, page_count, PAGES_PER_TASK)]
+    done = 0
+    try:
+        # map() rend les plages dans l'ordre, dès que chacune est prête
+        for pages in _get_pool().map(_extract_pdf_pages, ranges):
+            done += 1
+            for text in pages:
+                if text.strip():
+                    yield text
+    except BrokenProcessPool as e:
+        # Processus du pool tué (mémoire...) : pool recréé au prochain PDF, fin de celui-ci ici
+        logger.warning("⚠️ Pool d'extraction PDF interrompu (%s), extraction séquentielle des pages restantes", e)
+        _discard_pool()
+        for pages in map(_extract_pdf_pages, ranges[done:]):
+            for text in pages:
+                if text.strip():
+                    yield text
+
+
+def iter_text(path):
+    """Produit le texte d'un fichier .docx, .txt ou .pdf, bloc par bloc, en mémoire."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".docx":
+        return iter_docx_text(path)
+    if ext == ".pdf":
+        return iter_pdf_text(path)
+    if ext == ".txt":
+        return iter_txt_text(path)
+    raise ValueError(f"Format de fichier non supporté : {ext}")
+
+
+def iter_chunks(blocks, max_length=3000):
+    """
+    Regroupe les blocs de texte (séparés par des sauts de ligne) en morceaux
+    de `max_length` caractères, au fil de l'eau.
+    """
+    parts = []
+    size = 0
+    for block in blocks:
+        if parts:
+            parts.append("\n")
+            size += 1
+        parts.append(block)
+        size += len(block)
+        if size >= max_length:
+            # Découpage par position dans le texte accumulé, sans recopier le reste à chaque morceau
+            buffer = "".join(parts)
+            offset = 0
+            while size - offset >= max_length:
+                yield buffer[offset:offset + max_length]
+                offset += max_length
+            parts = [buffer[offset:]] if offset < size else []
+            size -= offset
+    if size:
+        yield "".join(parts)
@@ -0,0 +1,78 @@
+import logging
+import os
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+from config import Config
+import job_store
+import profiling
+import retention
+from usage import UsageMeter, metering
+
+from .utils import generate_fiches
+
+logger = logging.getLogger(__name__)
+
+# Les fiches passent par la même file que les traductions : même répartiteur, mêmes emplacements
+# "jobs", même reprise des tâches dont le processus s'est arrêté. Le texte de la fiche est diffusé
+# au fil de l'eau dans la sortie partielle de la tâche (job_store.append_output).
+JOB_KIND = "marketing"
+LANGUAGE_HEADERS = {"fr": "Français", "en": "Anglais"}
+
+
+def enqueue_fiche(owner, blob, fiche_type):
+    """Ajoute la génération d'une fiche à la file partagée et retourne la tâche créée."""
+    from translation_app.scheduler import wake_up
+
+    job = job_store.create_job(
+        JOB_KIND,
+        owner=owner,
+        # L'utilisateur attend la fiche à l'écran : elle passe avant les lots de traduction
+        priority="rush",
+        fiche_type=fiche_type,
+        input_file=blob["filename"],
+        input_sha256=blob["sha256"],
+        input_path=blob["path"],
+        base_name=f"{os.path.splitext(blob['filename'])[0]}_{int(time.time())}",
+        profile=profiling.active(),
+    )
+    wake_up()
+    logger.info("📌 Fiche %s en file (%s) : %s", job["id"], fiche_type, blob["filename"])
+    return job
+
+
+def run_fiche_job(job):
+    """Génère la fiche d'une tâche réservée par le répartiteur et enregistre son résultat."""
+    job_id = job["id"]
+    meter = UsageMeter()
+    current_language = []
+
+    if job_store.has_output(job_id):
+        # Tâche relancée après l'arrêt de son processus : la fiche est rédigée à nouveau
+        job_store.append_output(job_id, "\n\n===== Reprise après interruption =====\n")
+
+    def on_delta(language, text):
+        # 📌 Ajouter un en-tête à chaque changement de langue
+        if current_language != [language]:
+            current_language[:] = [language]
+            job_store.append_output(job_id, f"\n\n===== {LANGUAGE_HEADERS.get(language, language)} =====\n\n")
+        job_store.append_output(job_id, text)
+
+    def on_step(message):
+        job_store.update_job(job_id, message=message, heartbeat_at=datetime.now().isoformat(), usage=meter.to_dict())
+
+    try:
+        with metering(meter), (profiling.session(f"marketing {job_id}", "job", job.get("owner"))
+                               if job.get("profile") else nullcontext()):
+            result_files = generate_fiches(job["input_path"], job["fiche_type"], Config.MARKETING_FOLDER,
+                                           job["base_name"], on_delta=on_delta, on_step=on_step)
+        for filename in result_files:
+            retention.record_file_added(os.path.join(Config.MARKETING_FOLDER, filename))
+        job_store.update_job(job_id, status="done", message="Fiche générée.", result_files=result_files,
+                             usage=meter.to_dict(), finished_at=datetime.now().isoformat())
+        logger.info("✅ Fiche %s générée pour %s : %s", job["fiche_type"], job["input_path"], result_files)
+    except Exception as e:
+        job_store.update_job(job_id, status="error", message=f"Erreur lors de la génération : {e}",
+                             usage=meter.to_dict(), finished_at=datetime.now().isoformat())
+        logger.error("❌ Erreur lors de la génération de la fiche (tâche %s) : %s", job_id, e)
@@ -0,0 +1,187 @@
+import copy
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from config import BASE_DIR
+
+logger = logging.getLogger(__name__)
+
+FONT_FAMILY = "FreeSerif"
+FONT_PATH = os.path.join(BASE_DIR, "static", "fonts", "FreeSerif-4aeK.ttf")
+
+# Police analysée une seule fois par processus : {chemin: (prototype TTFFont, octets du fichier)}
+_font_cache = {}
+# Résultat de la vérification du cache (chemin -> bool) : le clonage du prototype s'appuie sur des
+# attributs internes de fpdf2 (version épinglée dans requirements.txt) ; si le clone ne leur
+# correspond plus, chaque rendu recharge la police normalement
+_font_cache_ok = {}
+# Attributs de TTFFont (fpdf2 2.8) pris en compte par le clonage : tout attribut ajouté ou retiré
+# par une autre version pourrait porter un état propre au document, non réinitialisé
+KNOWN_FONT_SLOTS = frozenset((
+    "i", "type", "name", "desc", "glyph_ids", "_hbfont", "sp", "ss", "up", "ut", "cw", "ttffile", "fontkey",
+    "emphasis", "scale", "subset", "cmap", "ttfont", "missing_glyphs", "biggest_size_pt", "color_font",
+    "unicode_range", "palette_index", "is_compressed", "is_cff", "is_cid_keyed", "is_symbol", "cff_ros",
+    "collection_font_number",
+))
+
+HEADING_SIZES = {1: 16, 2: 14, 3: 13}
+BODY_SIZE = 12
+LINE_HEIGHT = 7
+
+_heading_re = re.compile(r"^(#{1,3})\s+(.*)$")
+_numbered_heading_re = re.compile(r"^\d+\.\s+\*\*(.+?)\*\*\s*:?\s*(.*)$")
+_bold_heading_re = re.compile(r"^\*\*(.+?)\*\*\s*:?\s*$")
+_bullet_re = re.compile(r"^\s*(?:[-*•]|\d+\))\s+(.*)$")
+
+
+def preload_fonts(font_path=FONT_PATH):
+    """
+    Analyse la police et la garde en cache pour le processus courant.
+    Appelée au démarrage (avant le fork des workers gunicorn avec --preload).
+    """
+    from fpdf import FPDF
+
+    if font_path in _font_cache:
+        return
+    pdf = FPDF()
+    pdf.add_font(FONT_FAMILY, "", font_path)
+    prototype = pdf.fonts[FONT_FAMILY.lower()]
+    with open(font_path, "rb") as f:
+        font_bytes = f.read()
+    _font_cache[font_path] = (prototype, font_bytes)
+    logger.info("Police %s préchargée depuis %s", FONT_FAMILY, font_path)
+    _check_font_cache(font_path)
+
+
+def _check_font_cache(font_path):
+    """
+    Vérifie, sans rendu, qu'un clone du prototype en cache n'en partage aucun état propre au
+    document : attributs de TTFFont connus, sous-ensemble, police fontTools et glyphes manquants neufs.
+    """
+    from fpdf import FPDF
+
+    prototype = _font_cache[font_path][0]
+    try:
+        slots = set(getattr(type(prototype), "__slots__", ()))
+        if slots != KNOWN_FONT_SLOTS:
+            raise ValueError(f"attributs de TTFFont modifiés : {sorted(slots ^ KNOWN_FONT_SLOTS)}")
+        pdf = FPDF()
+        _clone_font(pdf, font_path)
+        font = pdf.fonts[FONT_FAMILY.lower()]
+        shared = [name for name in ("subset", "ttfont", "missing_glyphs")
+                  if getattr(font, name) is getattr(prototype, name)]
+        if font.subset.font is not font:
+            shared.append("subset.font")
+        if font.color_font is not None:
+            shared.append("color_font")
+        if shared:
+            raise ValueError(f"état partagé avec le prototype : {shared}")
+        _font_cache_ok[font_path] = True
+    except Exception as e:
+        _font_cache_ok[font_path] = False
+        logger.warning("⚠️ Cache de police invalide avec cette version de fpdf2 (%s), chargement standard.", e)
+
+
+def _clone_font(pdf, font_path):
+    """
+    Ajoute la police au document à partir du prototype en cache.
+    Seul l'objet fontTools (modifié par le sous-ensemblage à l'export) est recréé,
+    en mode paresseux ; les métriques déjà calculées sont partagées.
+    """
+    from fontTools import ttLib
+    from fpdf.fonts import SubsetMap
+
+    prototype, font_bytes = _font_cache[font_path]
+    font = copy.copy(prototype)
+    font.i = len(pdf.fonts) + 1
+    font.ttfont = ttLib.TTFont(BytesIO(font_bytes), recalcTimestamp=False, lazy=True)
+    font.subset = SubsetMap(font)
+    font.missing_glyphs = []
+    font.biggest_size_pt = 0
+    font._hbfont = None
+    pdf.fonts[FONT_FAMILY.lower()] = font
+
+
+def _attach_font(pdf, font_path):
+    """Ajoute la police au document : prototype en cache s'il a passé la vérification, sinon add_font."""
+    preload_fonts(font_path)
+    if _font_cache_ok.get(font_path):
+        try:
+            _clone_font(pdf, font_path)
+            return
+        except (ImportError, AttributeError, TypeError) as e:
+            _font_cache_ok[font_path] = False
+            logger.warning("Cache de police indisponible (%s), chargement standard.", e)
+    pdf.add_font(FONT_FAMILY, "", font_path)
+
+
+def _clean_inline(text):
+    """Retire le balisage gras/italique markdown."""
+    return text.replace("**", "").replace("__", "").strip()
+
+
+def render_pdf(content, path, font_path=FONT_PATH):
+    """
+    Rend une fiche en PDF en une seule passe : titres (#, **Titre**, 1. **Titre**),
+    listes à puces et paragraphes.
+    """
+    from fpdf import FPDF
+    from fpdf.enums import XPos, YPos
+
+    pdf = FPDF()
+    pdf.add_page()
+    _attach_font(pdf, font_path)
+    pdf.set_font(FONT_FAMILY, size=BODY_SIZE)
+
+    for line in content.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            pdf.ln(LINE_HEIGHT / 2)
+            continue
+
+        heading = _heading_re.match(stripped)
+        numbered = _numbered_heading_re.match(stripped)
+        bold = _bold_heading_re.match(stripped)
+        bullet = _bullet_re.match(line)
+
+        if heading or numbered or bold:
+            if heading:
+                level, text = len(heading.group(1)), heading.group(2)
+            elif numbered:
+                level, text = 2, f"{numbered.group(1)} {numbered.group(2)}"
+            else:
+                level, text = 3, bold.group(1)
+            pdf.ln(LINE_HEIGHT / 2)
+            pdf.set_font(FONT_FAMILY, size=HEADING_SIZES[level])
+            pdf.multi_cell(0, LINE_HEIGHT + 2, _clean_inline(text), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            pdf.set_font(FONT_FAMILY, size=BODY_SIZE)
+        elif bullet:
+            indent = 5 + min(len(line) - len(line.lstrip()), 8)
+            pdf.set_x(pdf.l_margin + indent)
+            pdf.multi_cell(0, LINE_HEIGHT, f"• {_clean_inline(bullet.group(1))}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        else:
+            pdf.multi_cell(0, LINE_HEIGHT, _clean_inline(stripped), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+    pdf.output(path)
+    logger.info("PDF sauvegardé : %s", path)
+    return path
+
+
+def _render_item(item):
+    content, path = item
+    return render_pdf(content, path)
+
+
+def render_pdfs(items, max_workers=None):
+    """
+    Rend un lot de fiches [(contenu, chemin), ...] dans un pool de processus.
+    Chaque processus précharge la police une fois pour tout le lot.
+    """
+    items = list(items)
+    if len(items) <= 1 or max_workers == 1:
+        return [_render_item(item) for item in items]
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=preload_fonts) as executor:
+        return list(executor.map(_render_item, items))
@@ -1,7 +1,13 @@
-from flask import Blueprint, render_template, request, jsonify, send_from_directory, current_app
+from flask import Blueprint, render_template, request, jsonify, current_app, url_for
 import os
+import time
 from datetime import datetime
 import logging
+import job_store
+from file_transfer import send_download
+import blob_store
+import retention
+from .jobs import enqueue_fiche
 
 # 📌 Ajout du logger
 logger = logging.getLogger(__name__)
@@ -9,8 +15,8 @@ logger = logging.getLogger(__name__)
 marketing_bp = Blueprint('marketing', __name__)
 
 def allowed_file(filename):
-    """ Vérifie si l'extension du fichier est autorisée (ici, DOCX et TXT). """
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'docx', 'txt'}
+    """ Vérifie si l'extension du fichier est autorisée (ici, DOCX, TXT et PDF). """
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'docx', 'txt', 'pdf'}
 
 def get_marketing_folder():
     with current_app.app_context():
@@ -46,19 +52,22 @@ def upload_marketing_file():
         return jsonify({"success": False, "message": "Nom de fichier invalide."}), 400
 
     # 📌 Ajouter un timestamp pour éviter les conflits de nom de fichier
-    filename, ext = os.path.splitext(file.filename)
+    filename, ext = os.path.splitext(blob_store.secure_name(file.filename))
     new_filename = f"{filename}_{int(time.time())}{ext}"
     file_path = os.path.join(marketing_folder, new_filename)
 
-    # 📌 Sauvegarde du fichier
-    file.save(file_path)
+    # 📌 Sauvegarde du contenu dans le stockage dédupliqué, exposé dans le dossier marketing par lien physique
+    owner = request.authorization.username if request.authorization else None
+    blob = blob_store.save_upload(file, "marketing", owner=owner)
+    blob_store.link_to(blob["path"], file_path)
+    retention.record_file_added(file_path)
 
     # 📌 Vérifier si le fichier est bien sauvegardé
     if os.path.exists(file_path):
-        logger.info(f"✅ Fichier marketing {new_filename} sauvegardé dans {marketing_folder}")
+        logger.info("✅ Fichier marketing %s sauvegardé dans %s", new_filename, marketing_folder)
         return jsonify({"success": True, "message": f"Fichier {new_filename} uploadé avec succès."})
     else:
-        logger.error(f"❌ Erreur : Le fichier {new_filename} n'a pas pu être sauvegardé.")
+        logger.error("❌ Erreur : Le fichier %s n'a pas pu être sauvegardé.", new_filename)
         return jsonify({"success": False, "message": "Erreur lors de l'enregistrement du fichier."}), 500
 
 @marketing_bp.route('/get_uploaded_files', methods=['GET'])
@@ -85,7 +94,53 @@ def download_file(filename):
     if not os.path.exists(os.path.join(marketing_folder, filename)):
         return jsonify({"error": "Fichier non trouvé"}), 404
 
-    return send_from_directory(marketing_folder, filename, as_attachment=True)
+    return send_download(marketing_folder, filename)
+
+@marketing_bp.route("/jobs", methods=["POST"])
+def create_fiche_job():
+    """Ajoute la génération d'une fiche à la file des tâches et retourne l'identifiant de la tâche."""
+    file = request.files.get("file")
+    fiche_type = request.form.get("fiche_type", "commercial")
+
+    if not file or file.filename == "":
+        return jsonify({"success": False, "message": "Aucun fichier sélectionné."}), 400
+    if not allowed_file(file.filename):
+        return jsonify({"success": False, "message": "Seuls les fichiers .docx, .txt et .pdf sont autorisés."}), 400
+    if fiche_type not in ("commercial", "shopify"):
+        return jsonify({"success": False, "message": "Type de fiche invalide."}), 400
+
+    marketing_folder = current_app.config["MARKETING_FOLDER"]
+    os.makedirs(marketing_folder, exist_ok=True)
+
+    owner = request.authorization.username if request.authorization else None
+    blob = blob_store.save_upload(file, "marketing", owner=owner)
+    job_id = enqueue_fiche(owner, blob, fiche_type)["id"]
+
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status_url": url_for("marketing.get_fiche_job", job_id=job_id),
+    }), 202
+
+@marketing_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_fiche_job(job_id):
+    """
+    Retourne l'état de la tâche et le texte de fiche produit depuis `offset`,
+    ce qui permet d'afficher la fiche au fur et à mesure de sa rédaction.
+    """
+    job = job_store.get_job(job_id)
+    if job is None or job.get("kind") != "marketing":
+        return jsonify({"error": "Tâche introuvable"}), 404
+
+    offset = request.args.get("offset", 0, type=int)
+    text, next_offset = job_store.read_output(job_id, offset)
+    return jsonify({
+        "status": job["status"],
+        "message": job["message"],
+        "text": text,
+        "offset": next_offset,
+        "result_files": job.get("result_files", []),
+    })
 
 def get_uploaded_files_data():
     """Récupère les fichiers avec leur date de création"""
@@ -105,9 +160,11 @@ def delete_marketing_file(filename):
     file_path = os.path.join(marketing_folder, filename)
 
     if os.path.exists(file_path):
+        size = os.path.getsize(file_path)
         os.remove(file_path)
-        logger.info(f"🗑️ Fichier marketing supprimé : {file_path}")
+        retention.record_file_removed(file_path, size)
+        logger.info("🗑️ Fichier marketing supprimé : %s", file_path)
         return jsonify({"success": True, "message": f"Le fichier {filename} a été supprimé."})
     else:
-        logger.warning(f"⚠️ Tentative de suppression d'un fichier inexistant : {filename}")
+        logger.warning("⚠️ Tentative de suppression d'un fichier inexistant : %s", filename)
         return jsonify({"success": False, "message": "Fichier introuvable."}), 404
@@ -1,11 +1,10 @@
-import openai
 import os
-from fpdf import FPDF
-from flask import current_app
-from docx import Document
 import logging
 import time
-from fpdf.enums import XPos, YPos
+from usage import record_openai, stage
+from translation_app.limits import api_slot
+from .pdf_renderer import render_pdf, render_pdfs
+from .extract import iter_text, iter_chunks
 
 logger = logging.getLogger(__name__)
 
@@ -79,15 +78,17 @@ SHOPIFY_PROMPT = """
 
 def convert_docx_to_txt(docx_path, txt_path):
     """Convertit un fichier DOCX en fichier TXT."""
+    from docx import Document
+
     try:
         doc = Document(docx_path)
         content = "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
         with open(txt_path, "w", encoding="utf-8") as txt_file:
             txt_file.write(content)
-        logger.info(f"Conversion DOCX vers TXT réussie : {txt_path}")
+        logger.info("Conversion DOCX vers TXT réussie : %s", txt_path)
         return txt_path
     except Exception as e:
-        logger.error(f"Erreur lors de la conversion DOCX -> TXT : {e}")
+        logger.error("Erreur lors de la conversion DOCX -> TXT : %s", e)
         raise ValueError("Impossible de convertir le fichier DOCX en TXT.")
 
 def split_text_into_chunks(text, max_length=3000):
@@ -95,66 +96,153 @@ def split_text_into_chunks(text, max_length=3000):
     return [text[i:i + max_length] for i in range(0, len(text), max_length)]
 
 def analyze_chunks(file_path):
-    """Analyse chaque chunk d'un fichier TXT après regroupement."""
-    with open(file_path, "r", encoding="utf-8") as f:
-        content = f.read()
+    """Analyse le contenu d'un fichier DOCX, TXT ou PDF par groupes de chunks."""
+    return analyze_text_chunks(iter_chunks(iter_text(file_path), max_length=3000))
 
-    # Diviser le texte en chunks de 3000 caractères
-    chunks = split_text_into_chunks(content, max_length=3000)
+def analyze_text_chunks(chunks):
+    """Analyse chaque groupe de chunks au fur et à mesure de l'extraction."""
+    import openai
 
     # Regrouper les chunks par paquets de 1 ou 2 pour éviter les retards excessifs
-    grouped_chunks = ["\n".join(chunks[i:i + 2]) for i in range(0, len(chunks), 2)]
+    def grouped(chunks):
+        pending = []
+        for chunk in chunks:
+            pending.append(chunk)
+            if len(pending) == 2:
+                yield "\n".join(pending)
+                pending = []
+        if pending:
+            yield "\n".join(pending)
 
     analysis_results = []
-    for i, group in enumerate(grouped_chunks, start=1):
+    for i, group in enumerate(grouped(chunks), start=1):
         start_time = time.time()
-        logger.info(f"Envoi du groupe {i}/{len(grouped_chunks)} à OpenAI...")
+        logger.info("Envoi du groupe %s à OpenAI...", i)
 
         try:
             analysis_prompt = f"Voici une partie d'un livre. Analyse ce contenu : {group}"
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": analysis_prompt}]
-            )["choices"][0]["message"]["content"]
+            with stage("analysis"), api_slot("openai"):
+                completion = openai.ChatCompletion.create(
+                    model="gpt-3.5-turbo",
+                    messages=[{"role": "user", "content": analysis_prompt}]
+                )
+            response = completion["choices"][0]["message"]["content"]
+            record_openai("gpt-3.5-turbo", completion.get("usage"), analysis_prompt, response)
             analysis_results.append(response)
-            logger.info(f"Groupe {i} analysé avec succès en {time.time() - start_time:.2f} secondes")
+            logger.info("Groupe %s analysé avec succès en %.2f secondes", i, time.time() - start_time)
         except Exception as e:
-            logger.error(f"Erreur lors de l'analyse du groupe {i}: {e}")
+            logger.error("Erreur lors de l'analyse du groupe %s: %s", i, e)
             raise
 
     consolidated_analysis = "\n".join(analysis_results)
     return consolidated_analysis
 
-def generate_final_fiche(consolidated_analysis, prompt_template):
-    """Génère une fiche commerciale ou produit Shopify."""
-    final_prompt = f"{prompt_template}\n\nVoici une analyse globale du livre :\n{consolidated_analysis}"
-    logger.info("Envoi du prompt global à OpenAI.")
+def stream_chat_completion(prompt, model="gpt-3.5-turbo", on_delta=None):
+    """Interroge ChatGPT en streaming et transmet chaque fragment de texte reçu."""
+    import openai
 
-    french_response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": final_prompt + "\nLangue: Français"}]
-    )["choices"][0]["message"]["content"]
+    parts = []
+    usage = None
+    try:
+        # L'emplacement est gardé tant que la réponse arrive
+        with api_slot("openai"):
+            response = openai.ChatCompletion.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            for chunk in response:
+                # Le dernier fragment ne porte que la consommation, sans choix
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                if not chunk["choices"]:
+                    continue
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    if on_delta:
+                        on_delta(delta)
+    finally:
+        record_openai(model, usage, prompt, "".join(parts))
+    return "".join(parts)
+
+def generate_final_fiche(consolidated_analysis, prompt_template, on_delta=None):
+    """
+    Génère une fiche commerciale ou produit Shopify.
+    Si `on_delta(langue, texte)` est fourni, la fiche est générée en streaming
+    et chaque fragment est transmis dès sa réception.
+    """
+    import openai
 
-    english_response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": final_prompt + "\nLangue: Anglais"}]
-    )["choices"][0]["message"]["content"]
+    final_prompt = f"{prompt_template}\n\nVoici une analyse globale du livre :\n{consolidated_analysis}"
+    logger.info("Envoi du prompt global à OpenAI.")
 
-    return french_response, english_response
+    with stage("fiche"):
+        if on_delta:
+            french_response = stream_chat_completion(
+                final_prompt + "\nLangue: Français",
+                on_delta=lambda delta: on_delta("fr", delta),
+            )
+            english_response = stream_chat_completion(
+                final_prompt + "\nLangue: Anglais",
+                on_delta=lambda delta: on_delta("en", delta),
+            )
+            return french_response, english_response
+
+        responses = []
+        for language in ("Français", "Anglais"):
+            prompt = final_prompt + f"\nLangue: {language}"
+            with api_slot("openai"):
+                completion = openai.ChatCompletion.create(
+                    model="gpt-3.5-turbo",
+                    messages=[{"role": "user", "content": prompt}]
+                )
+            responses.append(completion["choices"][0]["message"]["content"])
+            record_openai("gpt-3.5-turbo", completion.get("usage"), prompt, responses[-1])
+
+        return responses[0], responses[1]
 
 def save_pdf(content, path):
     """Sauvegarde le contenu dans un fichier PDF avec support Unicode."""
-    pdf = FPDF()
-    pdf.add_page()
-    
-    # Ajouter une police compatible Unicode (FreeSerif)
-    font_path = os.path.join(current_app.root_path, "static", "fonts", "FreeSerif-4aeK.ttf")
-    pdf.add_font("FreeSerif", "", font_path, uni=True)
-    pdf.set_font("FreeSerif", size=12)
-    
-    # Ajouter le contenu au PDF
-    pdf.multi_cell(0, 10, content)
-    
-    # Sauvegarde du fichier PDF
-    pdf.output(path)
-    logger.info(f"PDF sauvegardé : {path}")
+    render_pdf(content, path)
+
+def save_docx(content, path):
+    """Sauvegarde le contenu dans un fichier DOCX (un paragraphe par ligne)."""
+    from docx import Document
+
+    doc = Document()
+    for line in content.splitlines():
+        if line.strip():
+            doc.add_paragraph(line)
+    doc.save(path)
+    logger.info("DOCX sauvegardé : %s", path)
+
+def generate_fiches(input_path, fiche_type, output_folder, base_name, on_delta=None, on_step=None):
+    """
+    Enchaîne extraction → analyse → fiche → PDF/DOCX pour un livre (.docx, .txt ou .pdf).
+    Retourne la liste des fichiers générés dans `output_folder`.
+    """
+    prompt_template = SHOPIFY_PROMPT if fiche_type == "shopify" else COMMERCIAL_PROMPT
+
+    if on_step:
+        on_step("Analyse du livre...")
+    # Extraction en mémoire, directement découpée en chunks (pas de fichier .txt intermédiaire)
+    consolidated_analysis = analyze_chunks(input_path)
+
+    if on_step:
+        on_step("Rédaction de la fiche...")
+    french, english = generate_final_fiche(consolidated_analysis, prompt_template, on_delta=on_delta)
+
+    if on_step:
+        on_step("Création des fichiers PDF et DOCX...")
+    result_files = []
+    pdf_items = []
+    for language, content in (("fr", french), ("en", english)):
+        filename = f"{base_name}_{fiche_type}_{language}"
+        pdf_items.append((content, os.path.join(output_folder, f"{filename}.pdf")))
+        save_docx(content, os.path.join(output_folder, f"{filename}.docx"))
+        result_files += [f"{filename}.pdf", f"{filename}.docx"]
+    # Deux fiches seulement : rendu dans le processus courant (police déjà en cache)
+    render_pdfs(pdf_items, max_workers=1)
+    return result_files
@@ -0,0 +1,176 @@
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Profilage à la demande (administrateurs) d'une requête ou d'une tâche en arrière-plan.
+# Une session cProfile est portée par une variable de contexte : `usage.propagate` la transmet
+# aux threads des pools, chacun profilé séparément puis fusionné dans la même session.
+# Sans demande explicite, aucun profileur n'est installé.
+PROFILES_FOLDER = Config.PROFILES_FOLDER
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_ARG = "_profile"
+SUMMARY_LINES = 60
+
+_current_session = contextvars.ContextVar("profile_session", default=None)
+
+
+def is_admin(authorization):
+    return bool(
+        authorization
+        and authorization.username in Config.ADMIN_USERS
+        and Config.USERS.get(authorization.username) == authorization.password
+    )
+
+
+def requested(request):
+    """Profilage demandé par l'en-tête X-Profile ou le paramètre ?_profile=1, par un administrateur."""
+    flag = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_ARG)
+    return flag not in (None, "", "0") and is_admin(request.authorization)
+
+
+class ProfileSession:
+    def __init__(self, label, kind, user=None):
+        self.id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{kind}_{uuid.uuid4().hex[:8]}"
+        self.label = label
+        self.kind = kind
+        self.user = user
+        self.started = time.time()
+        self.threads = 0
+        self._stats = None
+        self._lock = threading.Lock()
+
+    def add(self, profiler):
+        with self._lock:
+            self.threads += 1
+            if self._stats is None:
+                self._stats = pstats.Stats(profiler)
+            else:
+                self._stats.add(profiler)
+
+    def save(self):
+        """Écrit le profil (.prof, lisible par pstats/snakeviz), son résumé texte et ses métadonnées."""
+        if self._stats is None:
+            return None
+        os.makedirs(PROFILES_FOLDER, exist_ok=True)
+        path = os.path.join(PROFILES_FOLDER, self.id)
+        self._stats.dump_stats(f"{path}.prof")
+        summary = io.StringIO()
+        self._stats.stream = summary
+        self._stats.sort_stats("cumulative").print_stats(SUMMARY_LINES)
+        with open(f"{path}.txt", "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+        meta = {
+            "id": self.id,
+            "label": self.label,
+            "kind": self.kind,
+            "user": self.user,
+            "created_at": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "duration_seconds": round(time.time() - self.started, 3),
+            "threads": self.threads,
+        }
+        with open(f"{path}.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        logger.info("Profil %s enregistré (%s, %ss).", self.id, self.label, meta['duration_seconds'])
+        return meta
+
+
+@contextmanager
+def _profiled_thread(session):
+    profiler = cProfile.Profile()
+    enabled = True
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Un autre profileur est déjà actif (Python 3.12+ : un seul à la fois par interpréteur)
+        logger.warning("Profilage impossible dans ce thread : %s", e)
+        enabled = False
+    try:
+        yield
+    finally:
+        if enabled:
+            profiler.disable()
+            session.add(profiler)
+
+
+@contextmanager
+def session(label, kind, user=None):
+    """Profile le bloc (et les threads lancés via `usage.propagate`) puis enregistre le profil."""
+    current = ProfileSession(label, kind, user)
+    token = _current_session.set(current)
+    try:
+        with _profiled_thread(current):
+            yield current
+    finally:
+        _current_session.reset(token)
+        try:
+            current.save()
+        except Exception as e:
+            logger.error("Échec de l'enregistrement du profil %s : %s", current.id, e)
+
+
+def current_session():
+    return _current_session.get()
+
+
+def active():
+    """Vrai si le code courant s'exécute sous profilage (pour propager la demande à une tâche)."""
+    return _current_session.get() is not None
+
+
+def run_in_session(current, fn, *args, **kwargs):
+    with _profiled_thread(current):
+        return fn(*args, **kwargs)
+
+
+def start_request_profile(request, user=None):
+    """Ouvre une session pour la requête en cours ; à refermer avec `stop_request_profile`."""
+    current = ProfileSession(f"{request.method} {request.full_path.rstrip('?')}", "request", user)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        logger.warning("Profilage de la requête impossible : %s", e)
+        return None
+    return current, profiler, _current_session.set(current)
+
+
+def stop_request_profile(handle):
+    current, profiler, token = handle
+    profiler.disable()
+    _current_session.reset(token)
+    current.add(profiler)
+    try:
+        current.save()
+    except Exception as e:
+        logger.error("Échec de l'enregistrement du profil %s : %s", current.id, e)
+    return current.id
+
+
+def list_profiles():
+    """Métadonnées des profils enregistrés (les plus récents en premier)."""
+    if not os.path.exists(PROFILES_FOLDER):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILES_FOLDER):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILES_FOLDER, name), "r", encoding="utf-8") as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda meta: meta["created_at"], reverse=True)
+    return profiles
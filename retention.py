@@ -0,0 +1,291 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Compteurs d'occupation par dossier, partagés entre processus.
+# Mis à jour à chaque écriture/suppression connue, et recalculés à chaque passage du démon.
+USAGE_FILE = os.path.join(Config.PERSISTENT_STORAGE, ".storage_usage.json")
+SWEEP_LOCK_FILE = os.path.join(Config.PERSISTENT_STORAGE, ".retention.lock")
+# Fréquence de vérification du seuil d'espace libre (un simple statvfs)
+WATERMARK_CHECK_SECONDS = 60
+
+_daemon_started = False
+_daemon_lock = threading.Lock()
+
+
+@contextmanager
+def _locked_usage():
+    with open(USAGE_FILE + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_usage():
+    try:
+        with open(USAGE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"folders": {}, "last_sweep": None}
+
+
+def _write_usage(usage):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(USAGE_FILE), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(usage, f)
+    os.replace(tmp_path, USAGE_FILE)
+
+
+def folder_for(path):
+    """Retourne le nom de la politique qui couvre ce chemin (préfixe le plus long)."""
+    path = os.path.abspath(path)
+    best, best_len = None, -1
+    for name, policy in Config.RETENTION_POLICIES.items():
+        root = os.path.abspath(policy["path"])
+        if path.startswith(root + os.sep) and len(root) > best_len:
+            if not policy["recursive"] and os.path.dirname(path) != root:
+                continue
+            best, best_len = name, len(root)
+    return best
+
+
+def record_change(path, delta_bytes, delta_files):
+    """Met à jour les compteurs du dossier contenant `path`."""
+    name = folder_for(path)
+    if name is None:
+        return
+    try:
+        with _locked_usage():
+            usage = _read_usage()
+            counters = usage["folders"].setdefault(name, {"bytes": 0, "files": 0})
+            counters["bytes"] = max(0, counters["bytes"] + delta_bytes)
+            counters["files"] = max(0, counters["files"] + delta_files)
+            _write_usage(usage)
+    except OSError as e:
+        logger.warning("Impossible de mettre à jour les compteurs d'espace disque : %s", e)
+
+
+def record_file_added(path):
+    if os.path.exists(path):
+        record_change(path, os.path.getsize(path), 1)
+
+
+def record_file_removed(path, size):
+    record_change(path, -size, -1)
+
+
+def get_usage():
+    """Compteurs par dossier (sans parcourir les arborescences)."""
+    return _read_usage()
+
+
+def _list_files(policy):
+    """Liste (chemin, taille, mtime) des fichiers couverts par une politique."""
+    root = policy["path"]
+    if not os.path.isdir(root):
+        return []
+    # Les sous-dossiers couverts par une autre politique (ou exclus explicitement) sont ignorés
+    other_roots = {os.path.abspath(p["path"]) for p in Config.RETENTION_POLICIES.values()} - {os.path.abspath(root)}
+    other_roots |= {os.path.abspath(os.path.join(root, sub)) for sub in policy.get("exclude", [])}
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if not policy["recursive"]:
+            dirnames[:] = []
+        dirnames[:] = [d for d in dirnames if os.path.abspath(os.path.join(dirpath, d)) not in other_roots]
+        for filename in filenames:
+            if filename.startswith("."):
+                continue
+            if policy.get("extensions") and os.path.splitext(filename)[1].lower() not in policy["extensions"]:
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((path, stat.st_size, stat.st_mtime))
+    return files
+
+
+def _active_job_files():
+    import job_store
+
+    files = set()
+    for job in job_store.list_active_jobs():
+        for ext in (".json", ".out"):
+            files.add(os.path.abspath(os.path.join(Config.JOBS_FOLDER, f"{job['id']}{ext}")))
+    return files
+
+
+def _referenced_blobs():
+    """
+    Fichiers d'entrée des tâches en attente ou en cours (traductions, révisions, fiches) et
+    manuscrits source des traductions qui peuvent encore servir de base à une révision.
+    """
+    import job_store
+    from translation_app.revision import record_sources
+
+    blobs = {os.path.abspath(job["input_path"]) for job in job_store.list_active_jobs() if job.get("input_path")}
+    return blobs | {os.path.abspath(path) for path in record_sources().values()}
+
+
+def _revision_records():
+    """Enregistrements de révision repris par une tâche non terminée, ou dont elle utilise le manuscrit."""
+    import job_store
+    from translation_app.revision import record_path, record_sources
+
+    active = job_store.list_active_jobs()
+    names = {job["revision_of"] for job in active if job.get("revision_of")}
+    inputs = {os.path.abspath(job["input_path"]) for job in active if job.get("input_path")}
+    names |= {name for name, path in record_sources().items() if os.path.abspath(path) in inputs}
+    return {os.path.abspath(record_path(name)) for name in names}
+
+
+# Fichiers encore utilisés, que ni l'âge, ni le nombre, ni la taille, ni la purge d'urgence ne suppriment
+PROTECTORS = {
+    "active_jobs": _active_job_files,
+    "referenced_blobs": _referenced_blobs,
+    "revision_records": _revision_records,
+}
+
+
+def _protected(policy):
+    protect = policy.get("protect")
+    return PROTECTORS[protect]() if protect else set()
+
+
+def _delete(path, reason):
+    try:
+        os.remove(path)
+        logger.info("🗑️ Rétention (%s) : %s", reason, path)
+        if os.path.abspath(path).startswith(os.path.abspath(Config.BLOB_FOLDER) + os.sep):
+            import blob_store
+
+            blob_store.forget_blob(path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.warning("Suppression impossible (%s) pour %s : %s", reason, path, e)
+        return False
+
+
+def apply_policy(policy, now=None):
+    """Applique âge maximal, keep-N-latest et taille maximale à un dossier."""
+    now = now or time.time()
+    protected_after = now - Config.RETENTION_MIN_AGE_SECONDS
+    protected = _protected(policy)
+    files = sorted(_list_files(policy), key=lambda f: f[2], reverse=True)  # plus récents d'abord
+    kept = []
+    for index, (path, size, mtime) in enumerate(files):
+        if mtime >= protected_after or os.path.abspath(path) in protected:
+            kept.append((path, size, mtime))
+            continue
+        if policy["max_age_days"] is not None and now - mtime > policy["max_age_days"] * 86400:
+            _delete(path, "âge maximal")
+        elif policy["keep_latest"] is not None and index >= policy["keep_latest"]:
+            _delete(path, "nombre maximal")
+        else:
+            kept.append((path, size, mtime))
+
+    if policy["max_total_bytes"] is not None:
+        total = sum(size for _, size, _ in kept)
+        # Supprimer les plus anciens jusqu'à repasser sous la limite
+        for path, size, mtime in reversed(list(kept)):
+            if total <= policy["max_total_bytes"]:
+                break
+            if mtime < protected_after and os.path.abspath(path) not in protected and _delete(path, "taille maximale"):
+                kept.remove((path, size, mtime))
+                total -= size
+    return kept
+
+
+def _free_ratio():
+    total, used, free = shutil.disk_usage(Config.PERSISTENT_STORAGE)
+    return free / total if total else 1.0
+
+
+def evict_until_target(now=None):
+    """Purge d'urgence : supprime les fichiers les plus anciens des dossiers évictables."""
+    now = now or time.time()
+    protected_after = now - Config.RETENTION_MIN_AGE_SECONDS
+    candidates = []
+    for policy in Config.RETENTION_POLICIES.values():
+        if policy["evictable"]:
+            protected = _protected(policy)
+            candidates += [f for f in _list_files(policy)
+                           if f[2] < protected_after and os.path.abspath(f[0]) not in protected]
+    candidates.sort(key=lambda f: f[2])
+    for path, size, mtime in candidates:
+        if _free_ratio() >= Config.DISK_TARGET_FREE:
+            break
+        _delete(path, "espace disque faible")
+
+
+def sweep():
+    """
+    Applique toutes les politiques puis recalcule les compteurs.
+    Un seul processus à la fois effectue le passage (verrou non bloquant).
+    """
+    with open(SWEEP_LOCK_FILE, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        try:
+            now = time.time()
+            if _free_ratio() < Config.DISK_LOW_WATERMARK:
+                logger.warning("⚠️ Espace disque faible, purge d'urgence des fichiers les plus anciens.")
+                evict_until_target(now)
+
+            folders = {}
+            for name, policy in Config.RETENTION_POLICIES.items():
+                kept = apply_policy(policy, now)
+                folders[name] = {"bytes": sum(size for _, size, _ in kept), "files": len(kept)}
+
+            with _locked_usage():
+                _write_usage({"folders": folders, "last_sweep": datetime.now().isoformat()})
+            logger.info("Rétention terminée : %s", folders)
+            return True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _sweep_due():
+    last_sweep = _read_usage().get("last_sweep")
+    if not last_sweep:
+        return True
+    elapsed = (datetime.now() - datetime.fromisoformat(last_sweep)).total_seconds()
+    return elapsed >= Config.RETENTION_INTERVAL_SECONDS
+
+
+def _daemon_loop():
+    while True:
+        try:
+            if _sweep_due() or _free_ratio() < Config.DISK_LOW_WATERMARK:
+                sweep()
+        except Exception as e:
+            logger.error("Erreur dans le démon de rétention : %s", e)
+        time.sleep(WATERMARK_CHECK_SECONDS)
+
+
+def start_retention_daemon():
+    """Démarre le démon de rétention une fois par processus (après le fork des workers)."""
+    global _daemon_started
+    with _daemon_lock:
+        if _daemon_started:
+            return
+        _daemon_started = True
+    threading.Thread(target=_daemon_loop, name="retention", daemon=True).start()
@@ -1,18 +1,98 @@
+import os
 import shutil
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request, send_from_directory
+from config import Config
+import profiling
+import retention
+import usage as usage_meter
 
 system_bp = Blueprint('system', __name__)
 
+def _format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
 @system_bp.route("/disk_usage", methods=["GET"])
 def get_disk_usage():
-    var_data_path = "/var/data"  # 📌 Spécifie le dossier utilisé par Render
-    total, used, free = shutil.disk_usage(var_data_path)  # ✅ Utilise le bon chemin
+    total, used, free = shutil.disk_usage(Config.PERSISTENT_STORAGE)  # ✅ Volume persistant configuré
+
+    # 📌 Occupation par dossier lue depuis les compteurs (pas de parcours d'arborescence)
+    usage = retention.get_usage()
+    folders = {
+        name: {
+            "bytes": counters["bytes"],
+            "files": counters["files"],
+            "size": _format_size(counters["bytes"]),
+        }
+        for name, counters in usage.get("folders", {}).items()
+    }
 
     disk_info = {
         "total": f"{total // (1024**3)} GB",
         "used": f"{used // (1024**3)} GB",
-        "free": f"{free // (1024**3)} GB"
+        "free": f"{free // (1024**3)} GB",
+        "free_ratio": round(free / total, 3) if total else None,
+        "low_watermark": Config.DISK_LOW_WATERMARK,
+        "folders": folders,
+        "last_sweep": usage.get("last_sweep"),
     }
 
     return jsonify(disk_info)
 
+
+@system_bp.route("/usage_report", methods=["GET"])
+def get_usage_report():
+    """
+    Consommation API agrégée des tâches (tokens, caractères DeepL, reprises, durées), lue dans
+    le journal de consommation : l'historique survit à la purge des tâches.
+    Paramètres : group_by (parmi user, model, day, kind, stage ; défaut user,model,day),
+    since / until (AAAA-MM-JJ inclus) et kind (translation ou marketing).
+    """
+    group_by = [dim.strip() for dim in request.args.get("group_by", "user,model,day").split(",") if dim.strip()]
+    invalid = [dim for dim in group_by if dim not in usage_meter.REPORT_DIMENSIONS]
+    if not group_by or invalid:
+        return jsonify({"success": False, "message": f"Dimensions invalides : {', '.join(invalid) or '(aucune)'} "
+                                                     f"(possibles : {', '.join(usage_meter.REPORT_DIMENSIONS)})."}), 400
+    since, until = request.args.get("since"), request.args.get("until")
+    for value in (since, until):
+        if value and not _is_day(value):
+            return jsonify({"success": False, "message": f"Date invalide : {value} (format AAAA-MM-JJ)."}), 400
+
+    entries = usage_meter.read_ledger(since, until, request.args.get("kind") or None)
+    rows = usage_meter.aggregate(entries, group_by=group_by, since=since, until=until)
+    totals = {counter: round(sum(row[counter] for row in rows), 4) for counter in usage_meter.REPORT_COUNTERS}
+    return jsonify({"group_by": group_by, "since": since, "until": until, "rows": rows, "totals": totals})
+
+def _is_day(value):
+    from datetime import date
+
+    try:
+        date.fromisoformat(value)
+        return True
+    except ValueError:
+        return False
+
+@system_bp.route("/profiles", methods=["GET"])
+def get_profiles():
+    """Profils enregistrés (requêtes et tâches profilées à la demande d'un administrateur)."""
+    if not profiling.is_admin(request.authorization):
+        return jsonify({"success": False, "message": "Réservé aux administrateurs."}), 403
+    return jsonify({"profiles": profiling.list_profiles()})
+
+@system_bp.route("/profiles/<profile_id>", methods=["GET"])
+def download_profile(profile_id):
+    """
+    Télécharge un profil : .prof (pstats, snakeviz) par défaut,
+    ou le résumé texte trié par temps cumulé avec ?format=text.
+    """
+    if not profiling.is_admin(request.authorization):
+        return jsonify({"success": False, "message": "Réservé aux administrateurs."}), 403
+    extension = ".txt" if request.args.get("format") == "text" else ".prof"
+    filename = f"{os.path.basename(profile_id)}{extension}"
+    if not os.path.exists(os.path.join(profiling.PROFILES_FOLDER, filename)):
+        return jsonify({"success": False, "message": "Profil introuvable."}), 404
+    if extension == ".txt":
+        return send_from_directory(profiling.PROFILES_FOLDER, filename, mimetype="text/plain")
+    return send_from_directory(profiling.PROFILES_FOLDER, filename, as_attachment=True)
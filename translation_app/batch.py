@@ -0,0 +1,200 @@
+import contextvars
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from usage import UsageMeter, metering, propagate
+
+from .pipeline import run_languages
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+LOGS_FOLDER = "logs"
+
+# Document en cours de traitement dans le thread (et ses threads propagés), pour les journaux par fichier
+_current_document = contextvars.ContextVar("batch_document", default=None)
+
+
+def collect_inputs(pattern):
+    """Fichiers .docx d'un dossier, ou correspondant à un motif glob (** accepté)."""
+    if os.path.isdir(pattern):
+        paths = glob.glob(os.path.join(pattern, "*.docx"))
+    else:
+        paths = glob.glob(pattern, recursive=True)
+    # Les fichiers verrous de Word (~$nom.docx) ne sont pas des documents
+    return sorted(os.path.abspath(p) for p in paths
+                  if p.lower().endswith(".docx") and not os.path.basename(p).startswith("~$"))
+
+
+def output_stems(inputs):
+    """Nom de sortie de chaque document ; suffixé d'une empreinte du chemin si deux documents portent le même nom."""
+    stems = {path: os.path.splitext(os.path.basename(path))[0] for path in inputs}
+    counts = {}
+    for stem in stems.values():
+        counts[stem] = counts.get(stem, 0) + 1
+    return {
+        path: stem if counts[stem] == 1 else f"{stem}_{hashlib.sha1(path.encode('utf-8')).hexdigest()[:6]}"
+        for path, stem in stems.items()
+    }
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def settings_fingerprint(target_languages, settings):
+    """Empreinte des paramètres : un document déjà traduit avec d'autres paramètres est refait."""
+    relevant = {key: value for key, value in settings.items() if key not in ("api_key", "stream")}
+    raw = json.dumps({"target_languages": target_languages, **relevant}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    """Suivi des documents traités d'un lot, réécrit atomiquement après chaque document."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def is_done(self, input_path, input_hash, fingerprint):
+        entry = self.entries.get(input_path)
+        return bool(
+            entry
+            and entry["status"] == "done"
+            and entry["input_sha256"] == input_hash
+            and entry["settings"] == fingerprint
+            and all(os.path.exists(path) for path in entry["outputs"])
+        )
+
+    def record(self, input_path, **entry):
+        with self._lock:
+            self.entries[input_path] = {**entry, "updated_at": datetime.now().isoformat()}
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+class _DocumentFilter(logging.Filter):
+    def __init__(self, document):
+        super().__init__()
+        self.document = document
+
+    def filter(self, record):
+        return _current_document.get() == self.document
+
+
+def _translate_document(input_path, stem, output_dir, target_languages, settings, manifest, input_hash, fingerprint):
+    """Traduit un document du lot avec son propre journal et son propre compteur de consommation."""
+    _current_document.set(input_path)
+    handler = logging.FileHandler(os.path.join(output_dir, LOGS_FOLDER, f"{stem}.log"), encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s"))
+    handler.addFilter(_DocumentFilter(input_path))
+    logging.getLogger().addHandler(handler)
+
+    meter = UsageMeter()
+    started = time.time()
+    try:
+        with metering(meter):
+            logger.info("Début de %s vers %s", input_path, ', '.join(target_languages))
+            outputs, errors = run_languages(
+                target_languages,
+                input_path=input_path,
+                output_path=os.path.join(output_dir, f"{stem}.docx"),
+                **settings,
+            )
+        duration = time.time() - started
+        status = "done" if not errors else "error"
+        manifest.record(
+            input_path,
+            status=status,
+            input_sha256=input_hash,
+            settings=fingerprint,
+            outputs=[outputs[lang] for lang in target_languages if lang in outputs],
+            errors={lang: str(error) for lang, error in errors.items()},
+            duration_seconds=round(duration, 1),
+            usage=meter.to_dict(),
+        )
+        logger.info("Fin de %s (%s) en %.0fs, %s tokens", input_path, status, duration, meter.total_tokens())
+        return status, duration, meter
+    except Exception as e:
+        duration = time.time() - started
+        manifest.record(input_path, status="error", input_sha256=input_hash, settings=fingerprint, outputs=[],
+                        errors={"*": str(e)}, duration_seconds=round(duration, 1), usage=meter.to_dict())
+        logger.error("Échec de %s : %s", input_path, e)
+        return "error", duration, meter
+    finally:
+        logging.getLogger().removeHandler(handler)
+        handler.close()
+
+
+def run_batch(pattern, output_dir, target_languages, parallel=2, force=False, **settings):
+    """
+    Traduit tous les documents d'un dossier ou d'un motif glob, `parallel` documents à la fois.
+    Le manifeste du dossier de sortie permet de reprendre un lot interrompu : les documents déjà
+    traduits (même contenu, mêmes paramètres, sorties présentes) sont ignorés sauf avec `force`.
+    Retourne le récapitulatif du lot.
+    """
+    inputs = collect_inputs(pattern)
+    stems = output_stems(inputs)
+    os.makedirs(os.path.join(output_dir, LOGS_FOLDER), exist_ok=True)
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME))
+    fingerprint = settings_fingerprint(target_languages, settings)
+
+    pending, skipped = [], []
+    for input_path in inputs:
+        input_hash = file_sha256(input_path)
+        if not force and manifest.is_done(input_path, input_hash, fingerprint):
+            skipped.append(input_path)
+        else:
+            pending.append((input_path, input_hash))
+    logger.info("Lot : %s document(s), %s déjà traduit(s), %s à traiter (%s en parallèle).",
+                len(inputs), len(skipped), len(pending), parallel)
+
+    started = time.time()
+    total = UsageMeter()
+    done, failed = [], []
+    with ThreadPoolExecutor(max_workers=max(1, parallel), thread_name_prefix="batch") as executor:
+        futures = {
+            executor.submit(propagate(_translate_document), input_path, stems[input_path], output_dir, target_languages, settings, manifest,
+                            input_hash, fingerprint): input_path
+            for input_path, input_hash in pending
+        }
+        for future in as_completed(futures):
+            status, duration, meter = future.result()
+            total.merge(meter.to_dict())
+            (done if status == "done" else failed).append(futures[future])
+            logger.info("[%s/%s] %s : %s (%.0fs)",
+                        len(done) + len(failed), len(pending), os.path.basename(futures[future]), status, duration)
+
+    elapsed = time.time() - started
+    usage = total.to_dict()
+    return {
+        "documents": len(inputs),
+        "translated": len(done),
+        "skipped": len(skipped),
+        "failed": failed,
+        "elapsed_seconds": round(elapsed, 1),
+        "documents_per_hour": round(len(done) * 3600 / elapsed, 1) if elapsed and done else 0,
+        "deepl_characters": usage["deepl"]["characters"],
+        "tokens": usage["openai"],
+        "total_tokens": total.total_tokens(),
+    }
+
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import job_store
+
+
+class JobCancelled(Exception):
+    """Levée au prochain point de contrôle d'une tâche dont l'annulation a été demandée."""
+
+
+class CancelToken:
+    """
+    Drapeau d'annulation coopératif partagé par les étapes d'une tâche.
+    Pour une tâche de la file, la demande peut venir d'un autre processus : le champ
+    `cancel_requested` de la tâche est alors relu au plus une fois par `poll_seconds`.
+    """
+
+    def __init__(self, job_id=None, poll_seconds=1.0):
+        self.job_id = job_id
+        self.poll_seconds = poll_seconds
+        self._event = threading.Event()
+        self._last_poll = 0.0
+
+    def cancel(self):
+        self._event.set()
+
+    def cancelled(self):
+        if self._event.is_set():
+            return True
+        if self.job_id and time.time() - self._last_poll >= self.poll_seconds:
+            self._last_poll = time.time()
+            job = job_store.get_job(self.job_id)
+            if job and job.get("cancel_requested"):
+                self._event.set()
+        return self._event.is_set()
+
+    def check(self):
+        """Point de contrôle : lève JobCancelled si l'annulation a été demandée."""
+        if self.cancelled():
+            raise JobCancelled(self.job_id)
+
+    def sleep(self, seconds):
+        """Attente interrompue dès l'annulation (locale) de la tâche."""
+        self._event.wait(seconds)
+        self.check()
+
+
+def check(token):
+    if token is not None:
+        token.check()
+
+
+# Jetons des tâches exécutées par ce processus : annulation immédiate sans attendre la relecture
+_tokens = {}
+_tokens_lock = threading.Lock()
+
+
+def register(job_id):
+    token = CancelToken(job_id)
+    with _tokens_lock:
+        _tokens[job_id] = token
+    return token
+
+
+def unregister(job_id):
+    with _tokens_lock:
+        _tokens.pop(job_id, None)
+
+
+def cancel_local(job_id):
+    with _tokens_lock:
+        token = _tokens.get(job_id)
+    if token is not None:
+        token.cancel()
+    return token is not None
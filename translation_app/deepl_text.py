@@ -0,0 +1,206 @@
+import hashlib
+import html
+import logging
+import re
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote_plus
+from xml.sax.saxutils import escape
+
+from config import Config
+
+from usage import propagate, record_deepl, record_retry
+
+from .cancellation import check as check_cancelled
+from .limits import api_slot
+
+logger = logging.getLogger(__name__)
+
+API_URL = "https://api.deepl.com/v2/translate"
+# Limites de l'API /v2/translate : 50 textes par requête, 128 Kio par requête. La taille comptée
+# est celle du corps encodé (application/x-www-form-urlencoded) : balises et caractères non ASCII
+# y occupent 3 à 9 octets. La marge couvre les autres paramètres (langues, glossaire...).
+MAX_TEXTS_PER_REQUEST = 50
+MAX_REQUEST_BYTES = 120 * 1024
+MAX_ATTEMPTS = 4
+RETRY_STATUSES = {429, 456, 500, 502, 503, 504}
+
+
+def iter_docx_paragraphs(doc):
+    """Paragraphes du corps du document, y compris ceux des tableaux (imbriqués)."""
+    yield from doc.paragraphs
+    for table in doc.tables:
+        yield from _iter_table_paragraphs(table)
+
+
+def _iter_table_paragraphs(table):
+    for row in table.rows:
+        for cell in row.cells:
+            yield from cell.paragraphs
+            for nested in cell.tables:
+                yield from _iter_table_paragraphs(nested)
+
+
+def paragraph_runs(paragraph):
+    """
+    Runs du paragraphe dans l'ordre du texte, y compris ceux des liens hypertexte (et des
+    insertions suivies), que `Paragraph.runs` ignore. Les runs des paragraphes imbriqués
+    (zones de texte) appartiennent à ces paragraphes et ne sont pas repris.
+    """
+    from docx.oxml.ns import qn
+    from docx.text.run import Run
+
+    p = paragraph._p
+    return [Run(r, paragraph) for r in p.iter(qn("w:r")) if next(r.iterancestors(qn("w:p"))) is p]
+
+
+def paragraph_markup(paragraph):
+    """
+    Texte du paragraphe où chaque run est balisé (<r i="n">), pour que DeepL
+    (tag_handling=xml) conserve la correspondance avec les runs d'origine.
+    """
+    return "".join(f'<r i="{i}">{escape(run.text)}</r>' for i, run in enumerate(paragraph_runs(paragraph)) if run.text)
+
+
+def _markup_text(markup):
+    try:
+        return "".join(ET.fromstring(f"<p>{markup}</p>").itertext())
+    except ET.ParseError:
+        return html.unescape(re.sub(r"<[^>]+>", "", markup))
+
+
+def apply_markup(paragraph, translated):
+    """
+    Réécrit le texte traduit dans les runs d'origine (styles conservés). Les runs sans texte
+    (images, champs...) ne sont pas touchés.
+    """
+    runs = paragraph_runs(paragraph)
+    texts = [""] * len(runs)
+    try:
+        root = ET.fromstring(f"<p>{translated}</p>")
+        # Texte hors balise : rattaché au run qui le précède (ou au premier)
+        texts[0] += root.text or ""
+        for element in root:
+            index = int(element.get("i"))
+            texts[index] += "".join(element.itertext()) + (element.tail or "")
+    except (ET.ParseError, ValueError, TypeError, IndexError) as e:
+        # Balisage perdu : tout le texte dans le premier run, les autres vidés
+        logger.warning("Run mapping lost (%s), falling back to plain text for one paragraph.", e)
+        first = next((index for index, run in enumerate(runs) if run.text), 0)
+        texts = [""] * len(runs)
+        texts[first] = _markup_text(translated)
+    for run, text in zip(runs, texts):
+        if run.text or text:
+            run.text = text
+
+
+def cache_key(markup, source_language, target_language, glossary_id):
+    raw = "\u0000".join([source_language or "", target_language, glossary_id or "", markup])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def encoded_size(text):
+    """Octets occupés par `text=...&` dans le corps de la requête."""
+    return len(quote_plus(text)) + len("text=&")
+
+
+def make_batches(texts):
+    """Découpe les textes en lots respectant les limites de l'API (nombre de textes, octets encodés)."""
+    batch, size = [], 0
+    for text in texts:
+        text_size = encoded_size(text)
+        if batch and (len(batch) >= MAX_TEXTS_PER_REQUEST or size + text_size > MAX_REQUEST_BYTES):
+            yield batch
+            batch, size = [], 0
+        batch.append(text)
+        size += text_size
+    if batch:
+        yield batch
+
+
+def translate_batch(api_key, texts, target_language, source_language=None, glossary_id=None, cancel=None):
+    """Traduit un lot de textes balisés avec /v2/translate, avec reprise sur erreur transitoire."""
+    import requests
+
+    data = {
+        "text": texts,
+        "target_lang": target_language,
+        "tag_handling": "xml",
+        "split_sentences": "nonewlines",
+        "preserve_formatting": "1",
+        "show_billed_characters": "1",
+    }
+    if source_language:
+        data["source_lang"] = source_language
+    if glossary_id:
+        data["glossary_id"] = glossary_id
+    headers = {"Authorization": f"DeepL-Auth-Key {api_key}"}
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        check_cancelled(cancel)
+        with api_slot("deepl", cancel=cancel):
+            response = requests.post(API_URL, headers=headers, data=data, timeout=120)
+        if response.status_code == 200:
+            translations = response.json()["translations"]
+            record_deepl(sum(item.get("billed_characters", len(text)) for item, text in zip(translations, texts)))
+            return [item["text"] for item in translations]
+        if response.status_code not in RETRY_STATUSES or attempt == MAX_ATTEMPTS:
+            raise Exception(f"DeepL text translation failed ({response.status_code}): {response.text}")
+        delay = 2 ** attempt
+        record_retry("deepl")
+        logger.warning("DeepL returned %s, retrying batch in %ss (%s/%s).",
+                       response.status_code, delay, attempt, MAX_ATTEMPTS)
+        if cancel is not None:
+            cancel.sleep(delay)
+        else:
+            time.sleep(delay)
+
+
+def translate_docx_paragraphs(api_key, input_file_path, output_file_path, target_language, source_language=None,
+                              glossary_id=None, max_workers=None, cache=None, cancel=None):
+    """
+    Traduit un .docx paragraphe par paragraphe avec l'API texte de DeepL : les paragraphes
+    sont regroupés en lots envoyés en parallèle, puis réécrits dans leurs runs d'origine.
+    `cache` (dictionnaire ou équivalent) évite de retraduire un paragraphe déjà traduit.
+    Après une annulation (`cancel`), les lots pas encore envoyés sont abandonnés.
+    Retourne le nombre de caractères envoyés à DeepL.
+    """
+    from docx import Document
+    from .utils import save_document_atomic
+
+    doc = Document(input_file_path)
+    paragraphs = [(p, paragraph_markup(p)) for p in iter_docx_paragraphs(doc)]
+    paragraphs = [(p, markup) for p, markup in paragraphs if markup and p.text.strip()]
+    cache = cache if cache is not None else {}
+
+    keys = [cache_key(markup, source_language, target_language, glossary_id) for _, markup in paragraphs]
+    # Chaque texte distinct n'est envoyé qu'une fois
+    pending = list(dict.fromkeys(markup for (_, markup), key in zip(paragraphs, keys) if key not in cache))
+    batches = list(make_batches(pending))
+    logger.info(
+        "DeepL text mode: %s paragraphs, %s distinct uncached texts to translate in %s batches.",
+        len(paragraphs), len(pending), len(batches)
+    )
+
+    executor = ThreadPoolExecutor(max_workers=max_workers or Config.DEEPL_MAX_CONCURRENCY)
+    try:
+        futures = {
+            executor.submit(propagate(translate_batch), api_key, batch, target_language, source_language, glossary_id, cancel): batch
+            for batch in batches
+        }
+        for future in as_completed(futures):
+            for markup, translated in zip(futures[future], future.result()):
+                cache[cache_key(markup, source_language, target_language, glossary_id)] = translated
+    except BaseException:
+        # Annulation ou échec d'un lot : ne pas envoyer les lots restants
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    for (paragraph, _), key in zip(paragraphs, keys):
+        apply_markup(paragraph, cache[key])
+
+    save_document_atomic(doc, output_file_path)
+    logger.info("Translated document saved to %s", output_file_path)
+    return sum(len(text) for text in pending)
@@ -0,0 +1,139 @@
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape
+
+# Lecture et écriture de .docx sans charger le document entier en mémoire : les paragraphes du
+# corps sont lus un à un (iterparse, éléments libérés au fur et à mesure) et les paragraphes de
+# sortie sont ajoutés à un fichier XML temporaire, assemblé en .docx à chaque sauvegarde.
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+_W = f"{{{W_NS}}}"
+DOCUMENT_PART = "word/document.xml"
+
+# Caractères refusés par XML 1.0 (python-docx lève une erreur sur ces caractères)
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _run_text(run):
+    """Texte d'un w:r, avec les mêmes équivalences que python-docx (tabulations, sauts de ligne...)."""
+    parts = []
+    for child in run:
+        tag = child.tag
+        if tag == f"{_W}t":
+            parts.append(child.text or "")
+        elif tag in (f"{_W}tab", f"{_W}ptab"):
+            parts.append("\t")
+        elif tag == f"{_W}br":
+            parts.append("\n" if child.get(f"{_W}type", "textWrapping") == "textWrapping" else "")
+        elif tag == f"{_W}cr":
+            parts.append("\n")
+        elif tag == f"{_W}noBreakHyphen":
+            parts.append("-")
+    return "".join(parts)
+
+
+def paragraph_text(paragraph):
+    """Texte d'un w:p : ses runs et ceux de ses liens hypertexte (comme `Paragraph.text`)."""
+    parts = []
+    for child in paragraph:
+        if child.tag == f"{_W}r":
+            parts.append(_run_text(child))
+        elif child.tag == f"{_W}hyperlink":
+            parts.extend(_run_text(run) for run in child if run.tag == f"{_W}r")
+    return "".join(parts)
+
+
+def iter_paragraph_texts(path, skip_empty=True):
+    """
+    Textes des paragraphes du corps d'un .docx (hors tableaux, comme `Document.paragraphs`),
+    lus au fil de l'eau : la mémoire utilisée ne dépend pas de la taille du document.
+    """
+    from lxml import etree
+
+    with zipfile.ZipFile(path) as package, package.open(DOCUMENT_PART) as part:
+        body = None
+        for event, element in etree.iterparse(part, events=("start", "end")):
+            if event == "start":
+                if body is None and element.tag == f"{_W}body":
+                    body = element
+                continue
+            if body is None or element.getparent() is not body:
+                continue
+            if element.tag == f"{_W}p":
+                text = paragraph_text(element)
+                if not skip_empty or text.strip():
+                    yield text
+            # Élément de premier niveau traité : libérer son sous-arbre et les frères déjà vus
+            element.clear()
+            while element.getprevious() is not None:
+                del body[0]
+
+
+def count_paragraphs(path, skip_empty=True):
+    return sum(1 for _ in iter_paragraph_texts(path, skip_empty=skip_empty))
+
+
+def _paragraph_xml(text):
+    """XML d'un paragraphe équivalent à `Document.add_paragraph(text)`."""
+    if not text:
+        return "<w:p/>"
+    content = []
+    for piece in re.split(r"(\t|\r\n|\n|\r)", _INVALID_XML.sub("", text)):
+        if piece == "\t":
+            content.append("<w:tab/>")
+        elif piece in ("\r\n", "\n", "\r"):
+            content.append("<w:br/>")
+        elif piece:
+            space = ' xml:space="preserve"' if piece != piece.strip() else ""
+            content.append(f"<w:t{space}>{escape(piece)}</w:t>")
+    return f"<w:p><w:r>{''.join(content)}</w:r></w:p>"
+
+
+class StreamingDocxWriter:
+    """
+    Document de sortie construit paragraphe par paragraphe sur disque. `save` produit un .docx
+    complet (à partir du modèle par défaut de python-docx) sans relire les paragraphes en mémoire.
+    """
+
+    def __init__(self, directory=None):
+        fd, self._body_path = tempfile.mkstemp(dir=directory, prefix=".body_", suffix=".xml")
+        self._body = os.fdopen(fd, "w", encoding="utf-8")
+        self.paragraph_count = 0
+
+    def add_paragraph(self, text):
+        self._body.write(_paragraph_xml(text))
+        self.paragraph_count += 1
+
+    def save(self, path):
+        """Écrit le .docx via un fichier temporaire (jamais de fichier à moitié écrit)."""
+        from docx.api import _default_docx_path
+
+        self._body.flush()
+        tmp_path = f"{path}.tmp"
+        with zipfile.ZipFile(_default_docx_path()) as template, \
+                zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as package:
+            for item in template.infolist():
+                if item.filename != DOCUMENT_PART:
+                    package.writestr(item, template.read(item.filename))
+                    continue
+                # Le corps du modèle ne contient que la mise en page de section (w:sectPr)
+                document = template.read(DOCUMENT_PART).decode("utf-8")
+                head, rest = document.split("<w:body>", 1)
+                with package.open(DOCUMENT_PART, "w") as part, open(self._body_path, "rb") as body:
+                    part.write(f"{head}<w:body>".encode("utf-8"))
+                    shutil.copyfileobj(body, part)
+                    part.write(rest.encode("utf-8"))
+        os.replace(tmp_path, path)
+
+    def close(self):
+        self._body.close()
+        if os.path.exists(self._body_path):
+            os.remove(self._body_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
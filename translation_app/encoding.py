@@ -0,0 +1,91 @@
+import codecs
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+BINARY_EXTENSIONS = (".xlsx", ".docx")
+CHUNK_SIZE = 1024 * 1024
+
+# Encodages lisibles tels quels par le lecteur UTF-8 des glossaires
+UTF8_COMPATIBLE = ("utf-8", "utf-8-sig", "ascii")
+
+# L'ordre compte : la BOM UTF-32 LE commence par la BOM UTF-16 LE
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def _sniff_bom(head):
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    return None
+
+
+def _strict_utf8(f):
+    """
+    Valide le flux en UTF-8 strict, morceau par morceau.
+    Retourne "ascii", "utf-8" ou None si le contenu n'est pas de l'UTF-8.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")("strict")
+    is_ascii = True
+    try:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            decoder.decode(chunk)
+            is_ascii = is_ascii and chunk.isascii()
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return None
+    return "ascii" if is_ascii else "utf-8"
+
+
+def detect_encoding(file_path):
+    """
+    Détecte l'encodage d'un fichier texte en une passe : BOM, puis validation UTF-8
+    stricte, et charset-normalizer uniquement en dernier recours.
+    Retourne "binary" pour les fichiers Excel/Word, None si l'encodage est introuvable.
+    """
+    if file_path.lower().endswith(BINARY_EXTENSIONS):
+        return "binary"
+
+    with open(file_path, "rb") as f:
+        encoding = _sniff_bom(f.read(4))
+        if encoding is None:
+            f.seek(0)
+            encoding = _strict_utf8(f)
+
+    if encoding is None:
+        from charset_normalizer import from_path
+
+        best = from_path(file_path).best()
+        encoding = best.encoding if best else None
+
+    logger.info("Encodage détecté : %s pour %s", encoding, file_path)
+    return encoding
+
+
+def transcode_to_utf8(source_path, destination_path, encoding):
+    """
+    Réécrit un fichier texte en UTF-8 (sans BOM) au fil de l'eau, via un fichier
+    temporaire renommé atomiquement. La source peut être la destination.
+    """
+    folder = os.path.dirname(os.path.abspath(destination_path))
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".transcode_")
+    try:
+        with open(source_path, "r", encoding=encoding, newline="") as src, \
+                os.fdopen(fd, "w", encoding="utf-8", newline="") as dst:
+            for block in iter(lambda: src.read(CHUNK_SIZE), ""):
+                dst.write(block)
+        os.replace(tmp_path, destination_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.info("Conversion %s -> UTF-8 : %s", encoding, destination_path)
+    return destination_path
@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import os
+import pickle
+import re
+import threading
+
+from .encoding import detect_encoding
+
+logger = logging.getLogger(__name__)
+
+# Version du format de l'artefact compilé (à incrémenter si la structure change)
+FORMAT_VERSION = 3
+ARTIFACT_SUFFIX = ".compiled"
+
+# Cache par processus : {chemin du glossaire: (mtime_ns, taille, artefact)}
+_memo = {}
+_memo_lock = threading.Lock()
+
+
+def artifact_path(glossary_path):
+    return glossary_path + ARTIFACT_SUFFIX
+
+
+def _normalize(term):
+    return " ".join(str(term).split())
+
+
+def _alternation(terms):
+    """Motif regex unique qui reconnaît l'un des termes (mots entiers)."""
+    if not terms:
+        return None
+    return r"(?<!\w)(?:" + "|".join(re.escape(t) for t in terms) + r")(?!\w)"
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compile_glossary(glossary_path, entries=None, encoding=None):
+    """
+    Compile un glossaire (.csv ou .docx) en artefact binaire stocké à côté de la source :
+    table de termes normalisés, motif de recherche (termes les plus longs d'abord),
+    encodage du fichier et empreinte SHA-256 du contenu source.
+    `encoding` évite une nouvelle détection lorsqu'il est déjà connu (à l'upload).
+    """
+    # Import local pour éviter un import circulaire avec utils
+    from .utils import parse_glossary_source
+
+    if encoding is None:
+        encoding = detect_encoding(glossary_path)
+    if entries is None:
+        entries = parse_glossary_source(glossary_path, encoding=encoding)
+
+    terms = {}
+    for source, target in entries.items():
+        source, target = _normalize(source), _normalize(target)
+        if source and target:
+            terms[source] = target
+
+    ordered_sources = sorted(terms, key=len, reverse=True)
+    stat = os.stat(glossary_path)
+    artifact = {
+        "format_version": FORMAT_VERSION,
+        "source_sha256": _file_hash(glossary_path),
+        "source_mtime_ns": stat.st_mtime_ns,
+        "source_size": stat.st_size,
+        "encoding": encoding,
+        "terms": terms,
+        # Index de correspondance des termes sources : une alternative regex unique, insensible à
+        # la casse, les termes les plus longs d'abord (les cibles sont vérifiées une à une)
+        "pattern": _alternation(ordered_sources),
+    }
+
+    tmp_path = artifact_path(glossary_path) + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, artifact_path(glossary_path))
+    logger.info("Glossaire compilé : %s (%s termes)", artifact_path(glossary_path), len(terms))
+    return artifact
+
+
+def _load_artifact(glossary_path, stat):
+    """Charge l'artefact s'il correspond encore à la source, sinon le recompile."""
+    try:
+        with open(artifact_path(glossary_path), "rb") as f:
+            artifact = pickle.load(f)
+        if (artifact.get("format_version") == FORMAT_VERSION
+                and artifact.get("source_mtime_ns") == stat.st_mtime_ns
+                and artifact.get("source_size") == stat.st_size):
+            return artifact
+        logger.info("Artefact obsolète pour %s, recompilation.", glossary_path)
+    except FileNotFoundError:
+        logger.info("Aucun artefact pour %s, compilation.", glossary_path)
+    except (pickle.UnpicklingError, EOFError, AttributeError) as e:
+        logger.warning("Artefact illisible pour %s (%s), recompilation.", glossary_path, e)
+    return compile_glossary(glossary_path)
+
+
+def load_compiled_glossary(glossary_path):
+    """
+    Retourne l'artefact compilé d'un glossaire, mémorisé par processus.
+    Invalidation sur changement de mtime/taille du fichier source.
+    """
+    stat = os.stat(glossary_path)
+    with _memo_lock:
+        cached = _memo.get(glossary_path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+    artifact = _load_artifact(glossary_path, stat)
+    with _memo_lock:
+        _memo[glossary_path] = (stat.st_mtime_ns, stat.st_size, artifact)
+    return artifact
+
+
+def glossary_encoding(glossary_path):
+    """Encodage enregistré à la compilation du glossaire (aucune relecture du fichier)."""
+    return load_compiled_glossary(glossary_path).get("encoding")
+
+
+def remove_artifact(glossary_path):
+    """Supprime l'artefact compilé d'un glossaire (et l'entrée du cache)."""
+    with _memo_lock:
+        _memo.pop(glossary_path, None)
+    if os.path.exists(artifact_path(glossary_path)):
+        os.remove(artifact_path(glossary_path))
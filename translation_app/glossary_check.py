@@ -0,0 +1,102 @@
+import bisect
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Séparateur entre groupes lors du balayage du document en une seule passe
+_SEPARATOR = "\n\u0000\n"
+
+# Motifs compilés par processus : {(empreinte du glossaire, clé du motif): re.Pattern}
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def _matcher(artifact, key):
+    """Compile (une fois par processus) le motif multi-termes d'un glossaire."""
+    pattern = artifact.get(key)
+    if not pattern:
+        return None
+    cache_key = (artifact["source_sha256"], key)
+    with _compiled_lock:
+        if cache_key not in _compiled:
+            _compiled[cache_key] = re.compile(pattern, re.IGNORECASE)
+        return _compiled[cache_key]
+
+
+def _target_matcher(artifact, target):
+    """
+    Motif d'un seul terme cible (compilé une fois par processus). Chaque terme imposé est
+    cherché séparément : une alternative unique ne rend pas les correspondances imbriquées
+    ("card" dans "card trick"), qui seraient alors signalées à tort comme manquantes.
+    """
+    cache_key = (artifact["source_sha256"], "target", target)
+    with _compiled_lock:
+        if cache_key not in _compiled:
+            _compiled[cache_key] = re.compile(r"(?<!\w)" + re.escape(target) + r"(?!\w)", re.IGNORECASE)
+        return _compiled[cache_key]
+
+
+def _scan(matcher, texts):
+    """
+    Balaye tous les textes en une seule passe et retourne, pour chaque texte,
+    l'ensemble des termes trouvés (tels qu'écrits dans le texte).
+    """
+    found = [set() for _ in texts]
+    if matcher is None or not texts:
+        return found
+    offsets = []
+    position = 0
+    for text in texts:
+        offsets.append(position)
+        position += len(text) + len(_SEPARATOR)
+    document = _SEPARATOR.join(texts)
+    for match in matcher.finditer(document):
+        index = bisect.bisect_right(offsets, match.start()) - 1
+        found[index].add(match.group(0))
+    return found
+
+
+def _matching_terms(by_lower_source, matched):
+    """
+    Entrées du glossaire désignées par un terme trouvé. Les termes sources qui ne diffèrent que
+    par la casse restent distincts : la graphie exacte est préférée, toutes sinon.
+    """
+    candidates = by_lower_source[matched.lower()]
+    exact = [(source, target) for source, target in candidates if source == matched]
+    return exact or candidates
+
+
+def find_violations(source_texts, improved_texts, artifact):
+    """
+    Retourne {indice du groupe: [(terme source, terme cible imposé), ...]} pour chaque
+    groupe dont le texte source contient un terme du glossaire alors que le texte
+    amélioré ne contient pas la traduction imposée.
+    """
+    by_lower_source = {}
+    for source, target in artifact["terms"].items():
+        by_lower_source.setdefault(source.lower(), []).append((source, target))
+
+    sources_found = _scan(_matcher(artifact, "pattern"), source_texts)
+
+    violations = {}
+    for index, found in enumerate(sources_found):
+        required = {term for matched in found for term in _matching_terms(by_lower_source, matched)}
+        missing = [(source, target) for source, target in sorted(required)
+                   if not _target_matcher(artifact, target).search(improved_texts[index])]
+        if missing:
+            violations[index] = missing
+    return violations
+
+
+def build_focused_prompt(improved_text, missing_terms, target_language):
+    """Prompt de correction ciblée : n'imposer que les termes manquants."""
+    rules = "\n".join(f'- "{source}" must be translated as "{target}"' for source, target in missing_terms)
+    return (
+        f"The following {target_language} text must follow these mandatory glossary rules:\n"
+        f"{rules}\n"
+        f"Rewrite the text so that every rule is applied, changing nothing else.\n"
+        f"Return only the corrected text, without additional comments.\n\n"
+        f"{improved_text}"
+    )
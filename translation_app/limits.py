@@ -0,0 +1,62 @@
+import fcntl
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Sémaphores inter-processus : `limit` fichiers de verrou par ressource,
+# un emplacement est occupé tant que son verrou flock est tenu.
+SLOTS_FOLDER = os.path.join(Config.JOBS_FOLDER, "slots")
+
+LIMITS = {
+    "jobs": Config.TRANSLATION_MAX_JOBS,
+    # Emplacements pris en plus de "jobs" par les tâches non urgentes (lots)
+    "bulk": max(1, Config.TRANSLATION_MAX_JOBS - Config.INTERACTIVE_RESERVED_JOBS),
+    "deepl": Config.DEEPL_MAX_CONCURRENCY,
+    "openai": Config.OPENAI_MAX_CONCURRENCY,
+}
+
+
+def try_acquire(name):
+    """Prend un emplacement libre sans attendre. Retourne le fichier verrouillé, ou None."""
+    os.makedirs(SLOTS_FOLDER, exist_ok=True)
+    for index in range(LIMITS[name]):
+        lock_file = open(os.path.join(SLOTS_FOLDER, f"{name}.{index}.lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            continue
+        return lock_file
+    return None
+
+
+def release(lock_file):
+    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    lock_file.close()
+
+
+@contextmanager
+def api_slot(name, poll_seconds=0.5, cancel=None):
+    """
+    Attend un emplacement libre pour l'API `name` (deepl, openai) et le garde pendant le bloc.
+    L'attente s'interrompt si `cancel` (CancelToken) est déclenché.
+    """
+    lock_file = try_acquire(name)
+    if lock_file is None:
+        logger.info("Limite de concurrence %s atteinte, attente d'un emplacement.", name)
+        while lock_file is None:
+            if cancel is not None:
+                cancel.sleep(poll_seconds)
+            else:
+                time.sleep(poll_seconds)
+            lock_file = try_acquire(name)
+    try:
+        yield
+    finally:
+        release(lock_file)
+
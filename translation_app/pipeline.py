@@ -0,0 +1,189 @@
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import Config
+from usage import propagate, stage
+
+from .cancellation import JobCancelled, check as check_cancelled
+from .deepl_text import translate_docx_paragraphs
+from .docx_stream import iter_paragraph_texts
+from .limits import api_slot
+from .revision import save_record
+from .utils import create_glossary, delete_glossary, translate_docx_with_deepl, improve_translation
+
+logger = logging.getLogger(__name__)
+
+
+def output_path_for(output_path, target_language, multiple):
+    """Chemin de sortie d'une langue : suffixé par le code langue si plusieurs langues sont demandées."""
+    if not multiple:
+        return output_path
+    stem, ext = os.path.splitext(output_path)
+    return f"{stem}_{target_language}{ext or '.docx'}"
+
+
+def read_source_paragraphs(input_path):
+    """
+    Paragraphes non vides du document source (lus une fois pour toutes les langues).
+    Lecture au fil de l'eau : seuls les textes sont gardés, pas l'arbre XML du document.
+    """
+    return list(iter_paragraph_texts(input_path))
+
+
+def run_language(api_key, input_path, output_path, source_language, target_language, language_level, group_size, model,
+                 glossary_csv_path=None, glossary_csv_encoding=None, glossary_gpt_path=None,
+                 source_paragraphs=None, on_progress=None, stream=True, deepl_engine="document", cancel=None,
+                 translated_path=None, gpt_output="text"):
+    """
+    Pipeline complet pour une langue cible : glossaire DeepL, traduction DeepL, amélioration ChatGPT.
+    Chaque étape occupe un emplacement de concurrence de son API (partagé entre processus).
+    `deepl_engine` : "document" (API document, en un bloc) ou "text" (API texte, par lots de paragraphes).
+    `gpt_output` : "text" (un texte par groupe) ou "structured" (JSON aligné sur les paragraphes).
+    `cancel` (CancelToken) interrompt le pipeline au prochain point de contrôle (JobCancelled) ;
+    le glossaire DeepL créé pour la tâche est supprimé dans tous les cas.
+    `translated_path` conserve la sortie brute de DeepL (sinon fichier temporaire supprimé à la fin).
+    """
+    temporary = translated_path is None
+    if temporary:
+        # Sortie brute de DeepL dans son propre fichier (caché, ignoré par la rétention) : les points
+        # de contrôle de l'amélioration n'écrivent que dans output_path
+        fd, translated_path = tempfile.mkstemp(dir=os.path.dirname(output_path) or ".", prefix=".deepl_", suffix=".docx")
+        os.close(fd)
+    try:
+        glossary_id = None
+        if glossary_csv_path and os.path.exists(glossary_csv_path):
+            # Un glossaire DeepL est propre à une paire de langues
+            with api_slot("deepl", cancel=cancel), stage("glossary"):
+                glossary_id = create_glossary(
+                    api_key,
+                    f"Glossary_{source_language}_to_{target_language}",
+                    source_language,
+                    target_language,
+                    glossary_csv_path,
+                    encoding=glossary_csv_encoding or "utf-8-sig",
+                )
+            logger.info("Glossaire DeepL %s créé pour %s", glossary_id, target_language)
+
+        try:
+            check_cancelled(cancel)
+            with stage("deepl"):
+                _translate_with_deepl(api_key, input_path, translated_path, source_language, target_language,
+                                      glossary_id, deepl_engine, cancel)
+            logger.info("Traduction DeepL terminée pour %s : %s", target_language, translated_path)
+        finally:
+            # Le glossaire ne sert qu'à l'étape DeepL : le libérer dès qu'elle est finie ou interrompue
+            if glossary_id:
+                delete_glossary(api_key, glossary_id)
+
+        # Gros documents : lecture et écriture au fil de l'eau pour borner la mémoire du worker
+        streaming = os.path.getsize(translated_path) >= Config.DOCX_STREAMING_MIN_BYTES
+        # improve_translation envoie ses groupes l'un après l'autre : une requête OpenAI à la fois
+        with api_slot("openai", cancel=cancel):
+            improvement = improve_translation(
+                input_file=translated_path,
+                glossary_path=glossary_gpt_path,
+                output_file=output_path,
+                language_level=language_level,
+                source_language=source_language,
+                target_language=target_language,
+                group_size=group_size,
+                model=model,
+                stream=stream,
+                on_progress=on_progress,
+                source_file=input_path,
+                source_paragraphs=source_paragraphs,
+                cancel=cancel,
+                output_mode=gpt_output,
+                streaming=streaming,
+            )
+        logger.info("Amélioration ChatGPT terminée pour %s : %s", target_language, output_path)
+    finally:
+        if temporary and os.path.exists(translated_path):
+            os.remove(translated_path)
+
+    # Base d'une future révision : seuls les paragraphes modifiés seront retraduits
+    if source_paragraphs is None:
+        source_paragraphs = read_source_paragraphs(input_path)
+    save_record(output_path, source_paragraphs, improvement, {
+        "source_language": source_language,
+        "target_language": target_language,
+        "language_level": language_level,
+        "group_size": group_size,
+        "model": model,
+        "glossary_csv_path": glossary_csv_path,
+        "glossary_csv_encoding": glossary_csv_encoding,
+        "glossary_gpt_path": glossary_gpt_path,
+    }, source_path=input_path)
+    return output_path
+
+
+def _translate_with_deepl(api_key, input_path, translated_path, source_language, target_language, glossary_id,
+                          deepl_engine, cancel):
+    """Étape DeepL : API document (en un bloc) ou API texte (par lots de paragraphes)."""
+    if deepl_engine == "text":
+        # Mode paragraphe : chaque lot de paragraphes prend son propre emplacement DeepL
+        translate_docx_paragraphs(
+            api_key,
+            input_path,
+            translated_path,
+            target_language,
+            source_language=source_language,
+            glossary_id=glossary_id,
+            cancel=cancel,
+        )
+    else:
+        with api_slot("deepl", cancel=cancel):
+            translate_docx_with_deepl(
+                api_key=api_key,
+                input_file_path=input_path,
+                output_file_path=translated_path,
+                target_language=target_language,
+                source_language=source_language,
+                glossary_id=glossary_id,
+                cancel=cancel,
+            )
+
+
+def run_languages(target_languages, input_path, output_path, on_progress=None, max_workers=None, cancel=None,
+                  translated_path=None, **settings):
+    """
+    Lance le pipeline de chaque langue cible en parallèle à partir du même fichier source.
+    `on_progress(langue, groupes traités, total)` est appelé au fil de l'amélioration.
+    Retourne ({langue: chemin de sortie}, {langue: exception}) ; lève JobCancelled si `cancel`
+    a été déclenché, les pipelines des autres langues s'arrêtant au même signal.
+    """
+    target_languages = list(dict.fromkeys(target_languages))
+    multiple = len(target_languages) > 1
+    # Le document source n'est analysé qu'une fois pour toutes les langues
+    source_paragraphs = read_source_paragraphs(input_path)
+
+    outputs, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers or len(target_languages)) as executor:
+        futures = {
+            executor.submit(
+                propagate(run_language),
+                input_path=input_path,
+                output_path=output_path_for(output_path, language, multiple),
+                translated_path=output_path_for(translated_path, language, multiple) if translated_path else None,
+                target_language=language,
+                source_paragraphs=source_paragraphs,
+                cancel=cancel,
+                on_progress=(lambda done, total, language=language: on_progress(language, done, total)) if on_progress else None,
+                **settings,
+            ): language
+            for language in target_languages
+        }
+        for future in as_completed(futures):
+            language = futures[future]
+            try:
+                outputs[language] = future.result()
+            except JobCancelled as e:
+                logger.info("Pipeline %s interrompu (annulation).", language)
+                errors[language] = e
+            except Exception as e:
+                logger.error("Échec du pipeline %s : %s", language, e)
+                errors[language] = e
+    check_cancelled(cancel)
+    return outputs, errors
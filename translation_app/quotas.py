@@ -0,0 +1,139 @@
+import fcntl
+import json
+import os
+import tempfile
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import Config
+import job_store
+from usage import estimate_cost
+
+# Partage de la file entre utilisateurs (file équitable pondérée) : à chaque emplacement libre,
+# la tâche suivante est prise chez l'utilisateur qui occupe le moins d'emplacements rapporté à
+# son poids, à priorité égale. Le calcul ne repose que sur les tâches enregistrées : tous les
+# processus qui consomment la file appliquent le même ordre.
+ANONYMOUS = "-"
+# Dépense journalière par utilisateur ({utilisateur: USD} par jour), cumulée à la fin de chaque
+# exécution et attribuée au jour où elle se termine (pas à celui de la mise en file)
+SPEND_FOLDER = os.path.join(Config.PERSISTENT_STORAGE, "spend")
+
+
+def user_quota(owner):
+    return {**Config.USER_DEFAULT_QUOTA, **Config.USER_QUOTAS.get(owner or ANONYMOUS, {})}
+
+
+@contextmanager
+def _locked_spend():
+    os.makedirs(SPEND_FOLDER, exist_ok=True)
+    with open(os.path.join(SPEND_FOLDER, ".lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _spend_path(day):
+    return os.path.join(SPEND_FOLDER, f"{day}.json")
+
+
+def _read_spend(day):
+    try:
+        with open(_spend_path(day), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def record_spend(owner, cost, day=None):
+    """Ajoute la dépense d'une exécution de tâche au total journalier de son utilisateur."""
+    if not cost:
+        return
+    day = day or datetime.now().date().isoformat()
+    with _locked_spend():
+        totals = _read_spend(day)
+        totals[owner or ANONYMOUS] = totals.get(owner or ANONYMOUS, 0) + cost
+        fd, tmp_path = tempfile.mkstemp(dir=SPEND_FOLDER, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(totals, f)
+        os.replace(tmp_path, _spend_path(day))
+
+
+def daily_spend(jobs=None, day=None):
+    """
+    Dépense API estimée (USD) par utilisateur pour `day` (aujourd'hui par défaut) : total des
+    exécutions terminées ce jour-là, plus la consommation déjà enregistrée des tâches en cours.
+    """
+    day = day or datetime.now().date().isoformat()
+    spend = Counter(_read_spend(day))
+    if day == datetime.now().date().isoformat():
+        jobs = job_store.list_active_jobs() if jobs is None else jobs
+        for job in jobs:
+            if job["status"] == "running" and job.get("usage"):
+                spend[job.get("owner") or ANONYMOUS] += estimate_cost(job["usage"])
+    return spend
+
+
+def over_budget(owner, spend):
+    limit = user_quota(owner)["daily_spend"]
+    return bool(limit) and spend[owner or ANONYMOUS] >= limit
+
+
+def fair_order(queued, running_counts, respect_limits=True):
+    """
+    Ordre de passage des tâches `queued` (déjà triées par priorité puis ancienneté pour chaque
+    utilisateur) : priorité d'abord, puis l'utilisateur le moins servi (tâches en cours / poids),
+    puis l'ancienneté. Chaque tâche placée compte comme en cours pour son utilisateur.
+    Avec `respect_limits`, un utilisateur à sa limite de tâches simultanées n'est plus servi.
+    """
+    running = Counter(running_counts)
+    pending = {}
+    for job in queued:
+        pending.setdefault(job.get("owner") or ANONYMOUS, deque()).append(job)
+
+    order = []
+    while pending:
+        candidates = []
+        for owner, jobs in pending.items():
+            quota = user_quota(owner)
+            if respect_limits and running[owner] >= quota["max_running_jobs"]:
+                continue
+            head = jobs[0]
+            candidates.append((Config.JOB_PRIORITIES.get(head.get("priority"), 1), running[owner] / quota["weight"],
+                               head["created_at"], owner))
+        if not candidates:
+            break
+        owner = min(candidates)[3]
+        order.append(pending[owner].popleft())
+        running[owner] += 1
+        if not pending[owner]:
+            del pending[owner]
+    return order
+
+
+def queue_state(kinds, jobs=None):
+    """
+    Vue de la file des tâches dont le type fait partie de `kinds` (à partir de `jobs`, par défaut
+    les tâches actives lues dans l'index) :
+    (tâches prêtes dans l'ordre de répartition, {id: raison} des tâches retenues,
+    {id: position dans la file}, nombre de tâches en cours par utilisateur).
+    """
+    jobs = job_store.list_active_jobs() if jobs is None else jobs
+    spend = daily_spend(jobs)
+    jobs = [job for job in jobs if job.get("kind") in kinds]
+    queued = sorted((job for job in jobs if job["status"] == "queued"),
+                    key=lambda job: (Config.JOB_PRIORITIES.get(job.get("priority"), 1), job["created_at"]))
+    running = Counter(job.get("owner") or ANONYMOUS for job in jobs if job["status"] == "running")
+    held = {job["id"]: "daily_spend" for job in queued if over_budget(job.get("owner"), spend)}
+    eligible = [job for job in queued if job["id"] not in held]
+
+    ready = fair_order(eligible, running)
+    ready_ids = {job["id"] for job in ready}
+    for job in eligible:
+        if job["id"] not in ready_ids:
+            held[job["id"]] = "max_running_jobs"
+    # Position : ordre de passage si aucune tâche ne se terminait (limites simultanées ignorées)
+    positions = {job["id"]: index for index, job in enumerate(fair_order(eligible, running, respect_limits=False), start=1)}
+    return ready, held, positions, running
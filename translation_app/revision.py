@@ -0,0 +1,320 @@
+import difflib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from config import Config
+from usage import stage
+
+from .cancellation import check as check_cancelled
+from .limits import api_slot
+
+logger = logging.getLogger(__name__)
+
+# Un enregistrement par traduction produite : groupes de paragraphes source et texte
+# amélioré correspondant, pour ne retraduire que ce qui a changé dans une version révisée.
+# Un index à part associe chaque enregistrement au blob de son manuscrit source (pour la
+# rétention, sans relire les enregistrements eux-mêmes).
+REVISIONS_FOLDER = Config.REVISIONS_FOLDER
+SOURCES_INDEX = os.path.join(REVISIONS_FOLDER, ".sources.json")
+# Au-delà de ce ratio de similarité, un paragraphe est considéré comme une retouche de l'ancien
+FUZZY_THRESHOLD = 0.75
+# Nombre maximal de paragraphes anciens examinés pour chaque paragraphe retouché
+FUZZY_WINDOW = 20
+
+
+def record_path(output_file_name):
+    return os.path.join(REVISIONS_FOLDER, f"{os.path.basename(output_file_name)}.json")
+
+
+def _normalize(text):
+    return " ".join(text.split())
+
+
+def paragraph_hash(text):
+    return hashlib.sha256(_normalize(text).encode("utf-8")).hexdigest()
+
+
+def save_record(output_path, source_paragraphs, improvement, settings, source_path=None):
+    """
+    Enregistre la correspondance groupes source -> texte amélioré d'une traduction
+    (`source_path` : blob du manuscrit source).
+    `improvement` est le résultat de improve_translation ; rien n'est enregistré si le
+    découpage en paragraphes de la traduction ne correspond pas à celui de la source.
+    """
+    if improvement["paragraph_count"] != len(source_paragraphs):
+        logger.warning("Paragraphes source/traduction non alignés, pas d'enregistrement de révision pour %s",
+                       output_path)
+        return None
+    record = {
+        "output_file_name": os.path.basename(output_path),
+        "created_at": datetime.now().isoformat(),
+        "source_path": source_path,
+        "settings": settings,
+        "groups": [
+            {"source": source_paragraphs[start : start + count], "output": text}
+            for start, count, text in improvement["groups"]
+        ],
+    }
+    return _write_record(output_path, record)
+
+
+@contextmanager
+def _locked_sources():
+    os.makedirs(REVISIONS_FOLDER, exist_ok=True)
+    with open(SOURCES_INDEX + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_sources():
+    try:
+        with open(SOURCES_INDEX, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_sources(sources):
+    fd, tmp_path = tempfile.mkstemp(dir=REVISIONS_FOLDER, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(sources, f, ensure_ascii=False)
+    os.replace(tmp_path, SOURCES_INDEX)
+
+
+def _write_record(output_path, record):
+    os.makedirs(REVISIONS_FOLDER, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=REVISIONS_FOLDER, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False)
+    os.replace(tmp_path, record_path(output_path))
+    if record.get("source_path"):
+        with _locked_sources():
+            sources = _read_sources()
+            sources[record["output_file_name"]] = record["source_path"]
+            _write_sources(sources)
+    return record
+
+
+def record_sources():
+    """
+    {nom de la traduction : blob source} des enregistrements existants. Les entrées des
+    enregistrements supprimés (rétention) sont retirées de l'index au passage.
+    """
+    with _locked_sources():
+        sources = _read_sources()
+        existing = {name: path for name, path in sources.items() if os.path.exists(record_path(name))}
+        if len(existing) != len(sources):
+            _write_sources(existing)
+    return existing
+
+
+def load_record(output_file_name):
+    try:
+        with open(record_path(output_file_name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def list_records():
+    """Noms des traductions pouvant servir de base à une révision (les plus récentes en premier)."""
+    if not os.path.exists(REVISIONS_FOLDER):
+        return []
+    names = [name[: -len(".json")] for name in os.listdir(REVISIONS_FOLDER)
+             if name.endswith(".json") and not name.startswith(".")]
+    return sorted(names, key=lambda name: os.path.getmtime(record_path(name)), reverse=True)
+
+
+def align(old_groups, new_paragraphs, fuzzy_threshold=FUZZY_THRESHOLD):
+    """
+    Aligne les paragraphes de la nouvelle version sur ceux de l'ancienne
+    (empreintes exactes, puis rapprochement approximatif des paragraphes retouchés).
+    Retourne un plan ordonné d'éléments :
+      ("reuse", indice du groupe)                       groupe inchangé, traduction réutilisée
+      ("translate", [paragraphes], [groupes d'origine]) paragraphes nouveaux ou modifiés
+    """
+    old_paragraphs, old_group_of = [], []
+    for index, group in enumerate(old_groups):
+        old_paragraphs.extend(group["source"])
+        old_group_of.extend([index] * len(group["source"]))
+
+    old_hashes = [paragraph_hash(p) for p in old_paragraphs]
+    new_hashes = [paragraph_hash(p) for p in new_paragraphs]
+    exact = {}    # indice nouveau -> indice ancien (identique)
+    edited = {}   # indice nouveau -> indice ancien (retouché)
+    matcher = difflib.SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            exact.update({j1 + k: i1 + k for k in range(i2 - i1)})
+        elif tag == "replace":
+            # Rapprochement dans l'ordre des paragraphes retouchés du bloc
+            start = i1
+            for j in range(j1, j2):
+                for i in range(start, min(i2, start + FUZZY_WINDOW)):
+                    similarity = difflib.SequenceMatcher(None, old_paragraphs[i], new_paragraphs[j])
+                    if similarity.quick_ratio() >= fuzzy_threshold and similarity.ratio() >= fuzzy_threshold:
+                        edited[j] = i
+                        start = i + 1
+                        break
+
+    # Un groupe est réutilisable si tous ses paragraphes se retrouvent, à l'identique et contigus
+    new_of_old = {i: j for j, i in exact.items()}
+    reusable_at = {}  # premier indice nouveau -> indice du groupe
+    position = 0
+    for index, group in enumerate(old_groups):
+        size = len(group["source"])
+        mapped = [new_of_old.get(i) for i in range(position, position + size)]
+        if size and None not in mapped and mapped == list(range(mapped[0], mapped[0] + size)):
+            reusable_at[mapped[0]] = index
+        position += size
+
+    plan, pending, origins = [], [], []
+    j = 0
+    while j < len(new_paragraphs):
+        if j in reusable_at:
+            if pending:
+                plan.append(("translate", pending, sorted(set(origins))))
+                pending, origins = [], []
+            index = reusable_at[j]
+            plan.append(("reuse", index))
+            j += len(old_groups[index]["source"])
+            continue
+        pending.append(new_paragraphs[j])
+        old_index = exact.get(j, edited.get(j))
+        if old_index is not None:
+            origins.append(old_group_of[old_index])
+        j += 1
+    if pending:
+        plan.append(("translate", pending, sorted(set(origins))))
+    return plan
+
+
+def _deepl_translate(api_key, paragraphs, settings, glossary_id, cancel=None):
+    """Traduit des paragraphes isolés avec l'API texte de DeepL."""
+    from .deepl_text import make_batches, translate_batch, _markup_text
+
+    translated = []
+    for batch in make_batches([escape(p) for p in paragraphs]):
+        results = translate_batch(api_key, batch, settings["target_language"], settings["source_language"], glossary_id, cancel)
+        translated.extend(_markup_text(text) for text in results)
+    return translated
+
+
+def retranslate_revision(api_key, input_path, previous_output_file_name, output_path, on_progress=None, cancel=None):
+    """
+    Traduit une version révisée d'un manuscrit en ne retraduisant que les paragraphes
+    nouveaux ou modifiés ; les groupes inchangés reprennent la traduction précédente.
+    Retourne les statistiques de la révision.
+    """
+    from docx import Document
+    from .glossary_cache import load_compiled_glossary
+    from .pipeline import read_source_paragraphs
+    from .utils import create_glossary, delete_glossary, process_paragraphs, enforce_glossary, save_document_atomic
+
+    record = load_record(previous_output_file_name)
+    if record is None:
+        raise FileNotFoundError(f"Aucun enregistrement de traduction pour {previous_output_file_name}")
+    settings = record["settings"]
+    old_groups = record["groups"]
+    new_paragraphs = read_source_paragraphs(input_path)
+    plan = align(old_groups, new_paragraphs)
+
+    dirty = [paragraph for item in plan if item[0] == "translate" for paragraph in item[1]]
+    logger.info(
+        "Révision de %s : %s/%s paragraphes à retraduire, %s/%s groupes réutilisés.",
+        previous_output_file_name, len(dirty), len(new_paragraphs),
+        sum(1 for item in plan if item[0] == "reuse"), len(old_groups),
+    )
+
+    glossary_id = None
+    glossary_csv_path = settings.get("glossary_csv_path")
+    if dirty and glossary_csv_path and os.path.exists(glossary_csv_path):
+        with api_slot("deepl", cancel=cancel), stage("glossary"):
+            glossary_id = create_glossary(
+                api_key,
+                f"Glossary_{settings['source_language']}_to_{settings['target_language']}",
+                settings["source_language"],
+                settings["target_language"],
+                glossary_csv_path,
+                encoding=settings.get("glossary_csv_encoding") or "utf-8-sig",
+            )
+    try:
+        with stage("deepl"):
+            translated = iter(_deepl_translate(api_key, dirty, settings, glossary_id, cancel) if dirty else [])
+    finally:
+        if glossary_id:
+            delete_glossary(api_key, glossary_id)
+
+    glossary_gpt_path = settings.get("glossary_gpt_path")
+    glossary_artifact = load_compiled_glossary(glossary_gpt_path) if glossary_gpt_path and os.path.exists(glossary_gpt_path) else None
+    glossary = glossary_artifact["terms"] if glossary_artifact else {}
+    group_size = settings["group_size"]
+
+    output_doc = Document()
+    new_groups, fresh_results, fresh_sources = [], [], []
+    total_chunks = sum((len(item[1]) + group_size - 1) // group_size for item in plan if item[0] == "translate")
+    done_chunks = 0
+    with api_slot("openai", cancel=cancel), stage("gpt"):
+        for item in plan:
+            if item[0] == "reuse":
+                group = old_groups[item[1]]
+                output_doc.add_paragraph(group["output"])
+                new_groups.append(group)
+                continue
+            _, sources, origins = item
+            reference = "\n".join(old_groups[index]["output"] for index in origins) or None
+            for start in range(0, len(sources), group_size):
+                check_cancelled(cancel)
+                chunk = sources[start : start + group_size]
+                chunk_translation = [next(translated) for _ in chunk]
+                improved = process_paragraphs(
+                    chunk_translation, glossary, settings["language_level"], settings["source_language"],
+                    settings["target_language"], settings["model"], previous_translation=reference, cancel=cancel,
+                )
+                done_chunks += 1
+                if on_progress:
+                    on_progress(done_chunks, total_chunks)
+                if not improved:
+                    logger.warning("Groupe révisé ignoré suite à une erreur ChatGPT.")
+                    continue
+                paragraph = output_doc.add_paragraph(improved)
+                fresh_results.append((len(fresh_sources), paragraph))
+                fresh_sources.append("\n".join(chunk))
+                new_groups.append({"source": chunk, "output": None, "_paragraph": paragraph})
+
+    if glossary_artifact and glossary and fresh_results:
+        with api_slot("openai", cancel=cancel), stage("glossary_check"):
+            enforce_glossary(fresh_results, fresh_sources, 1, glossary_artifact, settings["target_language"], settings["model"],
+                             cancel=cancel)
+
+    save_document_atomic(output_doc, output_path)
+
+    # La révision devient à son tour une base pour la suivante
+    for group in new_groups:
+        if "_paragraph" in group:
+            group["output"] = group.pop("_paragraph").text
+    _write_record(output_path, {
+        "output_file_name": os.path.basename(output_path),
+        "created_at": datetime.now().isoformat(),
+        "revision_of": previous_output_file_name,
+        "source_path": input_path,
+        "settings": settings,
+        "groups": new_groups,
+    })
+
+    return {
+        "paragraphs": len(new_paragraphs),
+        "retranslated_paragraphs": len(dirty),
+        "reused_groups": sum(1 for item in plan if item[0] == "reuse"),
+        "previous_groups": len(old_groups),
+    }
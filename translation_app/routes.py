@@ -1,19 +1,25 @@
-from flask import Blueprint, render_template, request, redirect, url_for, jsonify, current_app, send_from_directory, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, current_app, flash, session
 import os
-import threading
+import uuid
+import zipfile
 from .utils import (
-    translate_docx_with_deepl,
-    improve_translation,
-    create_glossary,
     convert_excel_to_csv,
-    verify_csv_encoding,
+    GlossaryFormatError,
 )
+from .pipeline import output_path_for
+from .scheduler import enqueue_translation, cancel_job, queue_info, JOB_KIND
+from .quotas import ANONYMOUS, daily_spend, user_quota
+from .revision import load_record, list_records
+from .glossary_cache import compile_glossary, remove_artifact, glossary_encoding
+from .encoding import detect_encoding, transcode_to_utf8, UTF8_COMPATIBLE
 from datetime import datetime
-from docx import Document
-import chardet
 import logging
 from werkzeug.utils import secure_filename
 from config import Config
+from file_transfer import send_download
+import blob_store
+import job_store
+import retention
 
 PERSISTENT_STORAGE = Config.PERSISTENT_STORAGE
 
@@ -29,83 +35,84 @@ def ensure_directories():
         os.makedirs(current_app.config["DOWNLOAD_FOLDER"], exist_ok=True)
         os.makedirs(current_app.config["UPLOAD_FOLDER"], exist_ok=True)
 
-# État global de la tâche
-task_status = {"status": "idle", "message": "Aucune tâche en cours.", "output_file_name": None}
-
-def set_task_status(status, message, output_file_name=None):
-    logger.info(f"Mise à jour du statut en {status} avec fichier: {output_file_name}")
-    task_status.update({
-        "status": status,
-        "message": message,
-        "output_file_name": output_file_name,
-    })
-
-def detect_encoding(file_path):
-    if file_path.lower().endswith(('.xlsx', '.docx')):
-        logger.info(f"Le fichier {file_path} est un fichier binaire (Excel ou Word), pas besoin de détecter l'encodage.")
-        return 'binary'
-
-    with open(file_path, 'rb') as f:
-        raw_data = f.read(8192)
-        result = chardet.detect(raw_data)
-        detected_encoding = result.get('encoding')
-
-        # Si encodage détecté est UTF-8-SIG, le traiter comme UTF-8 normal
-        if detected_encoding and detected_encoding.lower() == 'utf-8-sig':
-            detected_encoding = 'utf-8'
-
-        if not detected_encoding or detected_encoding.lower() in ['ascii', 'binary']:
-            logger.warning(f"Encodage non détecté pour {file_path}. Utilisation de 'utf-8' par défaut.")
-            detected_encoding = 'utf-8'
-
-        logger.info(f"Encodage détecté : {detected_encoding} pour {file_path}")
-        return detected_encoding
-
-
-
 def detect_and_convert_to_utf8(file_path):
-    """Détecte et convertit un fichier en UTF-8 si nécessaire, sauf pour les fichiers binaires."""
+    """
+    Convertit un fichier texte en UTF-8 si nécessaire : une seule détection et au plus
+    une réécriture. Retourne l'encodage final du fichier, ou None en cas d'échec.
+    """
+    encoding = detect_encoding(file_path)
+    if encoding in ("binary", "utf-8", "ascii"):
+        return encoding
+    if encoding is None:
+        logger.error("Encodage introuvable pour %s", file_path)
+        return None
     try:
-        if file_path.lower().endswith(('.xlsx', '.docx')):
-            logger.info(f"Le fichier {file_path} est un fichier binaire, pas besoin de conversion d'encodage.")
-            return True  # Pas de conversion nécessaire
-
-        encoding = detect_encoding(file_path)
-        
-        if encoding.lower() in ['utf-8', 'utf-8-sig']:
-            logger.info(f"Aucune conversion nécessaire, fichier déjà en {encoding} : {file_path}")
-            return True
-
-        with open(file_path, 'r', encoding=encoding, errors='replace') as f:
-            content = f.read()
-        with open(file_path, 'w', encoding='utf-8-sig') as f:
-            f.write(content)
-        
-        logger.info(f"Conversion réussie de {encoding} vers UTF-8 pour {file_path}")
-        return True
-
-    except UnicodeDecodeError as e:
-        logger.error(f"Erreur de conversion d'encodage {encoding} -> UTF-8 : {e}")
-        return False
-    except Exception as e:
-        logger.error(f"Erreur inattendue dans la détection/conversion d'encodage : {e}")
-        return False
+        transcode_to_utf8(file_path, file_path, encoding)
+        return "utf-8"
+    except (UnicodeDecodeError, LookupError) as e:
+        logger.error("Erreur de conversion d'encodage %s -> UTF-8 : %s", encoding, e)
+        return None
 
 def verify_glossary_encoding(file_path):
-    """Vérifie si le glossaire est lisible avec son encodage détecté, sauf pour les fichiers binaires."""
-    if file_path.lower().endswith(('.xlsx', '.docx')):
-        logger.info(f"Le fichier {file_path} est un fichier binaire (Excel ou Word), pas besoin de vérification d'encodage.")
-        return True  # Supposer que le fichier est valide pour ces types
-
-    encoding = detect_encoding(file_path)
+    """Vérifie l'encodage enregistré à l'upload du glossaire, sans relire le fichier."""
     try:
-        with open(file_path, 'r', encoding=encoding) as f:
-            f.read()
-        logger.info(f"Le fichier {file_path} est lisible avec l'encodage {encoding}.")
-        return True
-    except UnicodeDecodeError:
-        logger.error(f"Erreur de lecture du fichier {file_path} avec l'encodage détecté {encoding}.")
+        encoding = glossary_encoding(file_path)
+    except Exception as e:
+        logger.error("Glossaire %s illisible : %s", file_path, e)
         return False
+    if encoding == "binary" or encoding in UTF8_COMPATIBLE:
+        return True
+    logger.error("Encodage incompatible pour %s : %s", file_path, encoding)
+    return False
+
+def read_translation_settings(form):
+    """
+    Lit et valide les paramètres de traduction d'un formulaire (communs à /process et /bulk).
+    Lève ValueError avec un message destiné à l'utilisateur.
+    """
+    target_languages = [lang for lang in form.getlist("target_language") if lang]
+    if not target_languages:
+        raise ValueError("Veuillez choisir au moins une langue cible.")
+    try:
+        group_size = int(form["group_size"])
+    except (KeyError, ValueError):
+        raise ValueError("Taille de groupe invalide.")
+
+    deepl_engine = form.get("deepl_engine") or Config.DEEPL_ENGINE
+    if deepl_engine not in ("document", "text"):
+        raise ValueError("Mode DeepL invalide.")
+    gpt_output = form.get("gpt_output") or Config.GPT_OUTPUT
+    if gpt_output not in ("text", "structured"):
+        raise ValueError("Mode de sortie ChatGPT invalide.")
+
+    glossary_csv_name = form.get("deepl_glossary", None)
+    glossary_gpt_name = form.get("gpt_glossary", None)
+
+    glossary_csv_path = os.path.join(current_app.config["DEEPL_GLOSSARY_FOLDER"], glossary_csv_name) if glossary_csv_name else None
+    glossary_gpt_path = os.path.join(current_app.config["GPT_GLOSSARY_FOLDER"], glossary_gpt_name) if glossary_gpt_name else None
+
+    # Vérification de l'encodage des glossaires : lu dans les métadonnées enregistrées à l'upload
+    glossary_csv_encoding = None
+    if glossary_csv_path and glossary_csv_path.lower().endswith('.csv'):
+        if not verify_glossary_encoding(glossary_csv_path):
+            raise ValueError("Le glossaire sélectionné a un encodage incompatible. Veuillez vérifier le fichier.")
+        glossary_csv_encoding = glossary_encoding(glossary_csv_path)
+
+    if glossary_gpt_path and not verify_glossary_encoding(glossary_gpt_path):
+        raise ValueError(f"Le fichier de glossaire GPT '{glossary_gpt_name}' a un encodage non valide.")
+
+    return {
+        "target_languages": target_languages,
+        "source_language": form["source_language"],
+        "language_level": form["language_level"],
+        "group_size": group_size,
+        "model": form["gpt_model"],
+        "glossary_csv_path": glossary_csv_path,
+        "glossary_csv_encoding": glossary_csv_encoding,
+        "glossary_gpt_path": glossary_gpt_path,
+        "deepl_engine": deepl_engine,
+        "gpt_output": gpt_output,
+    }
 
 @translation_bp.before_app_request
 def setup():
@@ -127,16 +134,17 @@ def index():
         deepl_glossaries = [f for f in os.listdir(deepl_folder) if f.lower().endswith('.csv')]
         gpt_glossaries = [f for f in os.listdir(gpt_folder) if f.lower().endswith('.docx')]
 
-        logger.info(f"📂 Glossaires Deepl trouvés : {deepl_glossaries}")
-        logger.info(f"📂 Glossaires GPT trouvés : {gpt_glossaries}")
+        logger.info("📂 Glossaires trouvés : Deepl %s, GPT %s", deepl_glossaries, gpt_glossaries,
+                    extra={"sample": "file_listing"})
 
         return render_template(
             "index.html",
             deepl_glossaries=deepl_glossaries,
-            gpt_glossaries=gpt_glossaries
+            gpt_glossaries=gpt_glossaries,
+            revision_records=list_records(),
         )
     except Exception as e:
-        logger.error(f"Erreur lors du chargement des glossaires : {e}")
+        logger.error("Erreur lors du chargement des glossaires : %s", e)
         return "Erreur interne du serveur", 500
 
 @translation_bp.route("/upload_glossary", methods=["GET", "POST"])
@@ -183,9 +191,11 @@ def upload_glossary():
                 return redirect(url_for('translation.upload_glossary'))
 
             # 📂 📌 Stockage du fichier dans le bon dossier
+            stored_encoding = "utf-8"
             if filename.lower().endswith('.docx'):
+                stored_encoding = "binary"
                 glossary_file.save(file_path)
-                logger.info(f"✅ Fichier DOCX {filename} sauvegardé sous {file_path}.")
+                logger.info("✅ Fichier DOCX %s sauvegardé sous %s.", filename, file_path)
 
             elif filename.lower().endswith('.xlsx'):
                 temp_xlsx_path = os.path.join(save_folder, "temp_" + filename)
@@ -194,63 +204,65 @@ def upload_glossary():
                 csv_filename = filename.replace(".xlsx", ".csv")
                 csv_path = os.path.join(save_folder, csv_filename)
 
-                convert_excel_to_csv(temp_xlsx_path, csv_path)
-
-                with open(csv_path, 'r', encoding='utf-8-sig') as f:
-                    content = f.read()
-                with open(csv_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-
-                if not verify_csv_encoding(csv_path):
-                    flash("Erreur d'encodage dans le fichier CSV.", "danger")
-                    os.remove(csv_path)
-                    os.remove(temp_xlsx_path)
+                try:
+                    stats = convert_excel_to_csv(temp_xlsx_path, csv_path)
+                except GlossaryFormatError as format_error:
+                    flash(f"Glossaire Excel invalide : {format_error}", "danger")
+                    logger.error("❌ Glossaire %s invalide : %s", filename, format_error)
                     return redirect(url_for('translation.upload_glossary'))
 
-                if os.path.exists(csv_path):
-                    os.remove(temp_xlsx_path)
-                    file_path = csv_path
-                    logger.info(f"✅ Glossaire {filename} converti en CSV et sauvegardé sous {file_path}")
-                else:
-                    flash("Erreur lors de la conversion en CSV.", "danger")
-                    os.remove(temp_xlsx_path)
-                    return redirect(url_for('translation.upload_glossary'))
+                file_path = csv_path
+                logger.info("✅ Glossaire %s converti en CSV et sauvegardé sous %s", filename, file_path)
+                if stats["duplicates"]:
+                    flash(f"⚠️ {stats['duplicates']} terme(s) en double ignoré(s).", "warning")
+                flash(f"{stats['rows_written']} entrée(s) importée(s).", "info")
 
             elif filename.lower().endswith('.csv'):
                 temp_path = os.path.join(save_folder, "temp_" + filename)
                 glossary_file.save(temp_path)
 
-                if not detect_and_convert_to_utf8(temp_path):
+                # Détection unique : le résultat est conservé dans l'artefact compilé
+                stored_encoding = detect_and_convert_to_utf8(temp_path)
+                if not stored_encoding:
                     flash("Le fichier ne peut pas être converti en UTF-8.", "danger")
                     os.remove(temp_path)
                     return redirect(url_for('translation.upload_glossary'))
 
-                os.rename(temp_path, file_path)
-                logger.info(f"✅ Fichier CSV {filename} sauvegardé après conversion en UTF-8.")
+                os.replace(temp_path, file_path)
+                logger.info("✅ Fichier CSV %s sauvegardé en %s.", filename, stored_encoding)
+
+            retention.record_file_added(file_path)
+
+            # 📌 Compilation du glossaire une fois pour toutes (les tâches chargent l'artefact)
+            try:
+                compile_glossary(file_path, encoding=stored_encoding)
+            except Exception as compile_error:
+                logger.warning("⚠️ Compilation du glossaire %s impossible, elle sera retentée au chargement : %s",
+                               file_path, compile_error)
 
             flash("✅ Glossaire uploadé avec succès !", "success")
 
         except Exception as err:
             e = err
             flash("❌ Une erreur est survenue lors de l'upload.", "danger")
-            logger.error(f"Erreur lors de l'upload du glossaire: {e}")
+            logger.error("Erreur lors de l'upload du glossaire: %s", e)
             return redirect(url_for('translation.upload_glossary'))
 
         finally:
             if temp_xlsx_path and os.path.exists(temp_xlsx_path):
                 os.remove(temp_xlsx_path)
-                logger.info(f"🗑️ Fichier temporaire supprimé : {temp_xlsx_path}")
+                logger.info("🗑️ Fichier temporaire supprimé : %s", temp_xlsx_path)
 
             if csv_path and os.path.exists(csv_path) and e is not None:
                 os.remove(csv_path)
-                logger.info(f"🗑️ Fichier CSV problématique supprimé : {csv_path}")
+                logger.info("🗑️ Fichier CSV problématique supprimé : %s", csv_path)
 
     # 📌 **Correction : Mise à jour immédiate des glossaires après l’upload**
     deepl_glossaries = [f for f in os.listdir(deepl_folder) if f.lower().endswith((".csv", ".xlsx"))]
     gpt_glossaries = [f for f in os.listdir(gpt_folder) if f.lower().endswith(".docx")]
 
-    logger.info(f"📂 Liste actuelle des glossaires Deepl : {deepl_glossaries}")
-    logger.info(f"📂 Liste actuelle des glossaires GPT : {gpt_glossaries}")
+    logger.info("📂 Liste actuelle des glossaires : Deepl %s, GPT %s", deepl_glossaries, gpt_glossaries,
+                extra={"sample": "file_listing"})
 
     if not deepl_glossaries and not gpt_glossaries:
         logger.warning("⚠️ Aucun glossaire disponible après l'upload.")
@@ -260,13 +272,15 @@ def upload_glossary():
 @translation_bp.route("/processing")
 def processing():
     logger.info("Accès à la page de traitement.")
-    return render_template("processing.html")
+    job_id = request.args.get("job_id", "")
+    return render_template("processing.html", job_id=job_id,
+                           cancel_url=url_for("translation.cancel_translation_job", job_id=job_id) if job_id else None)
 
 @translation_bp.route("/done")
 def done():
-    filename = request.args.get("filename")
+    filenames = request.args.getlist("filename")
 
-    if not filename:
+    if not filenames:
         logger.error("Le nom du fichier n'est pas défini dans la requête.")
         return render_template("error.html", message="Nom du fichier non spécifié.")
 
@@ -274,17 +288,20 @@ def done():
     translated_folder = current_app.config["DOWNLOAD_FOLDER"]  # Utilisation du bon chemin
     os.makedirs(translated_folder, exist_ok=True)
 
-    file_path = os.path.join(translated_folder, filename)
+    for filename in filenames:
+        if not os.path.exists(os.path.join(translated_folder, filename)):
+            logger.error("❌ Le fichier traduit %s est introuvable dans %s.", filename, translated_folder)
+            return render_template("error.html", message="Le fichier traduit est introuvable ou corrompu.")
 
-    if not os.path.exists(file_path):
-        logger.error(f"❌ Le fichier traduit {filename} est introuvable dans {translated_folder}.")
-        return render_template("error.html", message="Le fichier traduit est introuvable ou corrompu.")
-
-    logger.info(f"✅ Le fichier {filename} est prêt à être téléchargé.")
-    return render_template("done.html", output_file_name=filename)
+    logger.info("✅ Fichier(s) prêt(s) à être téléchargé(s) : %s", filenames)
+    return render_template("done.html", output_file_name=filenames[0], output_files=filenames)
 
 @translation_bp.route("/process", methods=["POST"])
 def process():
+    """
+    Traduction depuis le formulaire principal : la tâche passe par la file partagée
+    (priorité urgente) et s'exécute dans un worker, la page de suivi interroge son statut.
+    """
     try:
         input_file = request.files["input_file"]
 
@@ -292,140 +309,223 @@ def process():
         allowed_extensions = {".docx"}
         if not input_file.filename.lower().endswith(tuple(allowed_extensions)):
             flash("Seuls les fichiers .docx sont autorisés.", "danger")
-            logger.error(f"Type de fichier non autorisé: {input_file.filename}")
+            logger.error("Type de fichier non autorisé: %s", input_file.filename)
             return redirect(url_for("translation.index"))
 
-        input_path = os.path.join(current_app.config["UPLOAD_FOLDER"], input_file.filename)
-        input_file.save(input_path)
-
-        # Capturer les valeurs du formulaire AVANT de lancer le thread
-        target_language = request.form["target_language"]
-        source_language = request.form["source_language"]
-        language_level = request.form["language_level"]
-        group_size = int(request.form["group_size"])
-        gpt_model = request.form["gpt_model"]
-        output_file_name = request.form.get("output_file_name", "improved_output.docx")
-
-        # Gestion spécifique pour les fichiers .docx et .xlsx : pas de conversion d'encodage
-        if input_path.lower().endswith(('.docx', '.xlsx')):
-            logger.info(f"Fichier DOCX ou XLSX détecté, pas de conversion d'encodage nécessaire : {input_path}")
-        else:
-            # Vérification et conversion de l'encodage pour les fichiers texte
-            encoding = detect_encoding(input_path)
-            if not detect_and_convert_to_utf8(input_path):
-                set_task_status("error", f"Erreur lors de la conversion en UTF-8 pour {input_path}")
-                flash("Erreur lors de la conversion du fichier en UTF-8.", "danger")
-                return redirect(url_for("translation.index"))
-                
-        glossary_csv_name = request.form.get("deepl_glossary", None)
-        glossary_gpt_name = request.form.get("gpt_glossary", None)
-
-        glossary_csv_path = os.path.join(current_app.config["DEEPL_GLOSSARY_FOLDER"], glossary_csv_name) if glossary_csv_name else None
-        glossary_gpt_path = os.path.join(current_app.config["GPT_GLOSSARY_FOLDER"], glossary_gpt_name) if glossary_gpt_name else None
-
-        # Vérification de l'encodage des glossaires
-        if glossary_csv_path and glossary_csv_path.lower().endswith('.csv'):
-            encoding = detect_encoding(glossary_csv_path)
-            if encoding not in ['utf-8', 'utf-8-sig', 'ascii']:
-                flash("Le glossaire sélectionné a un encodage incompatible. Veuillez vérifier le fichier.", "danger")
-                logger.error(f"Encodage incompatible détecté pour {glossary_csv_path}: {encoding}")
-                return redirect(url_for("translation.index"))
-
-            if encoding == 'binary' and not glossary_csv_path.lower().endswith('.xlsx'):
-                flash("Le fichier sélectionné ne semble pas être un fichier texte valide.", "danger")
-                logger.error(f"Fichier incompatible détecté pour {glossary_csv_path}")
-                return redirect(url_for("translation.index"))
-                
-        if glossary_gpt_path and not verify_glossary_encoding(glossary_gpt_path):
-            set_task_status("error", "Erreur d'encodage du glossaire GPT")
-            flash(f"Le fichier de glossaire GPT '{glossary_gpt_path}' a un encodage non valide.", "danger")
-            return redirect(url_for("translation.index"))
+        # Stockage adressé par contenu : pas de doublon ni d'écrasement entre deux envois de même nom
+        owner = request.authorization.username if request.authorization else None
+        blob = blob_store.save_upload(input_file, "translation", owner=owner)
 
-        output_file_name = request.form.get("output_file_name", "improved_output.docx")
-        final_output_path = os.path.join(current_app.config["DOWNLOAD_FOLDER"], output_file_name)
-
-        app = current_app._get_current_object()
+        try:
+            settings = read_translation_settings(request.form)
+        except ValueError as error:
+            flash(str(error), "danger")
+            return redirect(url_for("translation.index"))
 
-        def background_task():
-            with app.app_context():
-                try:
-                    set_task_status("processing", "Traduction en cours...")
-                    logger.info("Début du processus de traduction.")
-
-                    glossary_id = None
-                    if glossary_csv_path and os.path.exists(glossary_csv_path):
-                        # Vérifie si le fichier est au bon format (CSV ou XLSX)
-                        if not glossary_csv_path.lower().endswith(('.csv', '.xlsx')):
-                            flash("Le glossaire Deepl doit être au format CSV ou XLSX.", "danger")
-                            logger.error(f"Format non valide pour {glossary_csv_path}")
-                            return redirect(url_for("translation.index"))
-        
-                        # Création du glossaire Deepl
-                        glossary_id = create_glossary(
-                            app.config["DEEPL_API_KEY"],
-                            f"Glossary_{source_language}_to_{target_language}",
-                            source_language,
-                            target_language,
-                            glossary_csv_path
-                        )
-                        logger.info(f"Glossaire Deepl utilisé : {glossary_csv_path}")
-                    else:
-                        logger.warning("Aucun glossaire Deepl fourni ou fichier inexistant.")
-
-
-                    if input_path.lower().endswith('.docx'):
-                        logger.info("Fichier DOCX détecté, pas de conversion d'encodage nécessaire.")
-                    else:
-                        if not detect_and_convert_to_utf8(input_path):
-                            set_task_status("error", "Erreur lors de la conversion en UTF-8")
-                            flash("Erreur lors de la conversion du fichier en UTF-8.", "danger")
-                            return redirect(url_for("translation.index"))
-
-                    translate_docx_with_deepl(
-                        api_key=app.config["DEEPL_API_KEY"],
-                        input_file_path=input_path,
-                        output_file_path=final_output_path,
-                        target_language=target_language,
-                        source_language=source_language,
-                        glossary_id=glossary_id,  # Utilisation du glossaire sélectionné
-                    )
-                    logger.info(f"Traduction initiale terminée avec DeepL.")
-
-                    improve_translation(
-                        input_file=final_output_path,
-                        glossary_path=glossary_gpt_path,
-                        output_file=final_output_path,
-                        language_level=language_level,
-                        source_language=source_language,
-                        target_language=target_language,
-                        group_size=group_size,
-                        model=gpt_model,
-                    )
-                    logger.info(f"Amélioration de la traduction terminée avec ChatGPT en utilisant le glossaire: {glossary_gpt_path if glossary_gpt_path else 'Aucun'}")
-
-                    set_task_status("done", "Traduction terminée", os.path.basename(final_output_path))
-
-                    # Mise à jour de la session pour check_status
-                    set_task_status("done", "Traduction terminée", os.path.basename(final_output_path))
-            
-                    logger.info(f"Traduction terminée avec succès : {final_output_path}")
-
-                except Exception as e:
-                    set_task_status("error", f"Erreur lors du traitement : {str(e)}")
-                    set_task_status("error", "Erreur lors du traitement")
-                    logger.error(f"Erreur dans le traitement : {e}")
-
-        thread = threading.Thread(target=background_task)
-        thread.start()
-
-        return redirect(url_for("translation.processing"))
+        # Nom de sortie propre à la tâche (comme /bulk) : le nom saisi, assaini, ne sert que de base
+        requested_name = request.form.get("output_file_name", "").strip()
+        stem = os.path.splitext(blob_store.secure_name(requested_name) if requested_name else blob["filename"])[0]
+        job = enqueue_translation(
+            owner,
+            input_path=blob["path"],
+            input_file=blob["filename"],
+            output_file_name=f"{stem}_{uuid.uuid4().hex[:8]}.docx",
+            settings=settings,
+            priority="rush",
+        )
+        return redirect(url_for("translation.processing", job_id=job["id"]))
 
     except Exception as e:
-        logger.error(f"Erreur lors du traitement du fichier : {str(e)}")
+        logger.error("Erreur lors du traitement du fichier : %s", str(e))
         flash("Une erreur est survenue lors du traitement du fichier.", "danger")
         return redirect(url_for("translation.index"))
 
-    logger.info("Fin du thread de traitement.")  # Ajoute ce log pour vérifier la fin du thread
+def store_bulk_documents(files, owner):
+    """
+    Enregistre les .docx envoyés (directement ou dans des archives .zip) dans le stockage
+    par contenu. Retourne (blobs enregistrés, noms de fichiers refusés).
+    """
+    documents, rejected = [], []
+    for file in files:
+        name = file.filename or ""
+        if name.lower().endswith(".docx"):
+            documents.append(blob_store.save_upload(file, "translation", owner=owner))
+        elif name.lower().endswith(".zip"):
+            try:
+                with zipfile.ZipFile(file.stream) as archive:
+                    for member in archive.infolist():
+                        member_name = os.path.basename(member.filename)
+                        if member.is_dir() or member.filename.startswith("__MACOSX/") or member_name.startswith("."):
+                            continue
+                        if not member_name.lower().endswith(".docx"):
+                            rejected.append(f"{name}/{member.filename}")
+                            continue
+                        # Décompression en flux directement vers le stockage par contenu
+                        with archive.open(member) as stream:
+                            documents.append(blob_store.store_stream(stream, blob_store.secure_name(member_name), "translation", owner=owner))
+            except zipfile.BadZipFile:
+                rejected.append(name)
+        elif name:
+            rejected.append(name)
+    return documents, rejected
+
+# Raisons d'attente d'une tâche retenue par un quota de son utilisateur
+HELD_MESSAGES = {
+    "daily_spend": "En attente : budget API journalier atteint.",
+    "max_running_jobs": "En attente : nombre maximal de tâches simultanées atteint.",
+}
+
+def job_summary(job, queue=None):
+    """Résumé d'une tâche ; `queue` (résultat de queue_info) évite de recalculer la file pour chaque tâche."""
+    position = held = None
+    if job["status"] == "queued":
+        info = (queue if queue is not None else queue_info()).get(job["id"], {})
+        position, held = info.get("queue_position"), info.get("held")
+    return {
+        "job_id": job["id"],
+        "input_file": job.get("input_file"),
+        "status": job["status"],
+        "message": job["message"],
+        "priority": job.get("priority"),
+        "progress": job.get("progress"),
+        "queue_position": position,
+        "held": HELD_MESSAGES.get(held),
+        "result_files": job.get("result_files", []),
+        "status_url": url_for("translation.get_translation_job", job_id=job["id"]),
+        "cancel_url": url_for("translation.cancel_translation_job", job_id=job["id"]),
+    }
+
+@translation_bp.route("/bulk", methods=["POST"])
+def bulk_process():
+    """
+    Soumission en lot : plusieurs .docx ou une archive .zip, mêmes paramètres pour tous.
+    Une tâche est mise en file par document ; le répartiteur les exécute selon leur priorité
+    dans la limite de concurrence configurée pour DeepL et OpenAI.
+    """
+    files = request.files.getlist("bulk_files")
+    priority = request.form.get("priority", "normal")
+    if priority not in Config.BULK_PRIORITIES:
+        return jsonify({"success": False, "message": "Priorité invalide pour un lot (normale ou arrière-plan)."}), 400
+    try:
+        settings = read_translation_settings(request.form)
+    except ValueError as error:
+        return jsonify({"success": False, "message": str(error)}), 400
+
+    owner = request.authorization.username if request.authorization else None
+    documents, rejected = store_bulk_documents(files, owner)
+    if not documents:
+        return jsonify({"success": False, "message": "Aucun fichier .docx dans l'envoi.", "rejected": rejected}), 400
+
+    batch_id = uuid.uuid4().hex
+    jobs = []
+    for blob in documents:
+        stem = os.path.splitext(blob["filename"])[0]
+        job = enqueue_translation(
+            owner,
+            input_path=blob["path"],
+            input_file=blob["filename"],
+            output_file_name=f"{stem}_{batch_id[:8]}.docx",
+            settings=settings,
+            priority=priority,
+            batch_id=batch_id,
+        )
+        jobs.append(job_summary(job))
+
+    logger.info("📌 Lot %s : %s tâche(s) en file (%s), %s fichier(s) refusé(s)",
+                batch_id, len(jobs), priority, len(rejected))
+    return jsonify({
+        "success": True,
+        "batch_id": batch_id,
+        "jobs": jobs,
+        "rejected": rejected,
+        "status_url": url_for("translation.list_translation_jobs", batch_id=batch_id),
+    }), 202
+
+@translation_bp.route("/revise", methods=["POST"])
+def revise_translation():
+    """
+    Traduction d'une version révisée d'un manuscrit déjà traduit : seuls les paragraphes
+    nouveaux ou modifiés sont envoyés à DeepL et ChatGPT, avec les paramètres de la
+    traduction précédente. La tâche passe en priorité urgente.
+    """
+    file = request.files.get("revision_file")
+    previous_output = os.path.basename(request.form.get("previous_output", ""))
+    if not file or not file.filename.lower().endswith(".docx"):
+        return jsonify({"success": False, "message": "Un fichier .docx révisé est requis."}), 400
+    record = load_record(previous_output) if previous_output else None
+    if record is None:
+        return jsonify({"success": False, "message": "Traduction précédente introuvable."}), 400
+
+    owner = request.authorization.username if request.authorization else None
+    blob = blob_store.save_upload(file, "translation", owner=owner)
+    batch_id = uuid.uuid4().hex
+    stem = os.path.splitext(blob["filename"])[0]
+    job = enqueue_translation(
+        owner,
+        input_path=blob["path"],
+        input_file=blob["filename"],
+        output_file_name=f"{stem}_rev_{batch_id[:8]}.docx",
+        settings=record["settings"],
+        priority="rush",
+        batch_id=batch_id,
+        revision_of=previous_output,
+    )
+    return jsonify({
+        "success": True,
+        "batch_id": batch_id,
+        "jobs": [job_summary(job)],
+        "status_url": url_for("translation.list_translation_jobs", batch_id=batch_id),
+    }), 202
+
+@translation_bp.route("/jobs", methods=["GET"])
+def list_translation_jobs():
+    """Liste les tâches de traduction (filtrables par lot)."""
+    batch_id = request.args.get("batch_id")
+    jobs = job_store.list_batch_jobs(batch_id, JOB_KIND) if batch_id else job_store.list_jobs(JOB_KIND)
+    queue = queue_info() if any(job["status"] == "queued" for job in jobs) else {}
+    return jsonify({"jobs": [job_summary(job, queue) for job in jobs]})
+
+@translation_bp.route("/queue", methods=["GET"])
+def user_queue():
+    """État de la file pour l'utilisateur connecté : ses tâches en attente, ses quotas et sa dépense du jour."""
+    owner = request.authorization.username if request.authorization else None
+    active_jobs = job_store.list_active_jobs()
+    queue = queue_info(active_jobs)
+    mine = [job for job in active_jobs if job.get("kind") == JOB_KIND and job.get("owner") == owner]
+    quota = user_quota(owner)
+    return jsonify({
+        "user": owner or ANONYMOUS,
+        "running": sum(1 for job in mine if job["status"] == "running"),
+        "queued": sorted(
+            (job_summary(job, queue) for job in mine if job["status"] == "queued"),
+            key=lambda summary: summary["queue_position"] or float("inf"),
+        ),
+        "weight": quota["weight"],
+        "max_running_jobs": quota["max_running_jobs"],
+        "daily_spend_limit": quota["daily_spend"] or None,
+        "daily_spend": round(daily_spend(active_jobs)[owner or ANONYMOUS], 4),
+    })
+
+@translation_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_translation_job(job_id):
+    job = job_store.get_job(job_id)
+    if job is None or job.get("kind") != "translation":
+        return jsonify({"error": "Tâche introuvable"}), 404
+    return jsonify(job_summary(job))
+
+@translation_bp.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_translation_job(job_id):
+    """
+    Annule une tâche de la file. Une tâche en cours s'arrête au prochain point de contrôle
+    (entre deux interrogations DeepL, entre deux groupes ChatGPT) et libère son emplacement.
+    """
+    job = job_store.get_job(job_id)
+    if job is None or job.get("kind") != "translation":
+        return jsonify({"success": False, "message": "Tâche introuvable"}), 404
+    cancelled = cancel_job(job_id)
+    if cancelled is None:
+        return jsonify({"success": False, "message": "La tâche est déjà terminée."}), 409
+    return jsonify({"success": True, **job_summary(cancelled)})
 
 @translation_bp.route("/download/<filename>")
 def download_file(filename):
@@ -435,12 +535,12 @@ def download_file(filename):
     file_path = os.path.join(translated_folder, filename)
 
     if not os.path.exists(file_path):
-        logger.error(f"❌ Le fichier {filename} est introuvable dans {translated_folder}.")
+        logger.error("❌ Le fichier %s est introuvable dans %s.", filename, translated_folder)
         flash("Le fichier demandé est introuvable.", "danger")
         return redirect(url_for("translation.done", filename=filename))  # Redirige vers la page précédente
 
-    logger.info(f"📂 Téléchargement du fichier : {file_path}")
-    return send_from_directory(translated_folder, filename, as_attachment=True)
+    logger.info("📂 Téléchargement du fichier : %s", file_path)
+    return send_download(translated_folder, filename)
 
 @translation_bp.route("/main_menu")
 def main_menu():
@@ -448,7 +548,7 @@ def main_menu():
     translated_folder = os.path.join(PERSISTENT_STORAGE, "translated_files")
 
     if not os.path.exists(translated_folder):
-        logger.warning(f"Le dossier {translated_folder} n'existe pas. Création en cours...")
+        logger.warning("Le dossier %s n'existe pas. Création en cours...", translated_folder)
         os.makedirs(translated_folder, exist_ok=True)
 
     if os.path.exists(translated_folder):
@@ -457,20 +557,52 @@ def main_menu():
             created_at = datetime.fromtimestamp(os.path.getctime(file_path)).strftime('%Y-%m-%d %H:%M:%S')
             translated_files.append({'filename': filename, 'created_at': created_at})
 
-    logger.info(f"Nombre de fichiers traduits trouvés : {len(translated_files)}")
+    logger.info("Nombre de fichiers traduits trouvés : %s", len(translated_files), extra={"sample": "file_listing"})
     return render_template("main_menu.html", translated_files=translated_files)
 
 
 @translation_bp.route("/check_status")
 def check_status():
-    logger.info(f"Statut actuel: {task_status}")  # Ajoute ce log pour débogage
-
-    if task_status["status"] == "done" and task_status["output_file_name"]:
-        return jsonify({"status": "done", "filename": task_status["output_file_name"]})
-    elif task_status["status"] == "error":
-        return jsonify({"status": "error"})
+    """Statut d'une tâche lancée depuis le formulaire principal, pour la page de suivi."""
+    job = job_store.get_job(request.args.get("job_id", ""))
+    if job is None or job.get("kind") != "translation":
+        return jsonify({"status": "error", "message": "Tâche introuvable."})
+
+    if job["status"] == "done" and job["result_files"]:
+        return jsonify({
+            "status": "done",
+            "filename": job["result_files"][0],
+            "filenames": job["result_files"],
+            "message": job["message"],
+        })
+    elif job["status"] in ("error", "cancelled"):
+        return jsonify({"status": job["status"], "message": job["message"]})
     else:
-        return jsonify({"status": "processing"})
+        message = job["message"]
+        if job["status"] == "queued":
+            summary = job_summary(job)
+            if summary["held"]:
+                message = summary["held"]
+            elif summary["queue_position"]:
+                message = f"En file d'attente (position {summary['queue_position']})."
+        return jsonify({
+            "status": "processing",
+            "message": message,
+            "progress": job.get("progress") if job["status"] == "running" else None,
+            "partial_filename": partial_file_name(job),
+        })
+
+def partial_file_name(job):
+    """Première sortie déjà sauvegardée d'une tâche en cours (version partielle téléchargeable)."""
+    if job["status"] != "running" or not job.get("progress"):
+        return None
+    languages = job["settings"].get("target_languages", [])
+    output_path = os.path.join(current_app.config["DOWNLOAD_FOLDER"], job["output_file_name"])
+    for language in languages:
+        path = output_path_for(output_path, language, len(languages) > 1)
+        if os.path.exists(path):
+            return os.path.basename(path)
+    return None
 
 @translation_bp.route("/get_uploaded_glossaries")
 def get_uploaded_glossaries():
@@ -489,11 +621,13 @@ def delete_translated_file(filename):
     file_path = os.path.join(translated_folder, filename)
 
     if os.path.exists(file_path):
+        size = os.path.getsize(file_path)
         os.remove(file_path)
-        logger.info(f"🗑️ Fichier supprimé : {file_path}")
+        retention.record_file_removed(file_path, size)
+        logger.info("🗑️ Fichier supprimé : %s", file_path)
         return jsonify({"success": True, "message": f"Le fichier {filename} a été supprimé."})
     else:
-        logger.warning(f"⚠️ Tentative de suppression d'un fichier inexistant : {filename}")
+        logger.warning("⚠️ Tentative de suppression d'un fichier inexistant : %s", filename)
         return jsonify({"success": False, "message": "Fichier introuvable."}), 404
 
 @translation_bp.route("/delete_glossary/<glossary_type>/<filename>", methods=["DELETE"])
@@ -508,11 +642,14 @@ def delete_glossary(glossary_type, filename):
     file_path = os.path.join(folder, filename)
 
     if os.path.exists(file_path):
+        size = os.path.getsize(file_path)
         os.remove(file_path)
-        logger.info(f"🗑️ Glossaire supprimé : {file_path}")
+        remove_artifact(file_path)
+        retention.record_file_removed(file_path, size)
+        logger.info("🗑️ Glossaire supprimé : %s", file_path)
         return jsonify({"success": True, "message": f"Le glossaire {filename} a été supprimé."})
     else:
-        logger.warning(f"⚠️ Tentative de suppression d'un glossaire inexistant : {filename}")
+        logger.warning("⚠️ Tentative de suppression d'un glossaire inexistant : %s", filename)
         return jsonify({"success": False, "message": "Glossaire introuvable."}), 404
 
 
@@ -0,0 +1,380 @@
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+from config import Config
+import job_store
+import profiling
+import retention
+from usage import UsageMeter, append_ledger, estimate_cost, metering
+
+from . import cancellation
+from .cancellation import JobCancelled
+from .limits import try_acquire, release
+from .pipeline import run_languages, output_path_for
+from .quotas import queue_state, record_spend
+from .revision import retranslate_revision
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND = "translation"
+# Types de tâches consommés par le répartiteur (mêmes emplacements), avec leur message au démarrage
+JOB_KINDS = {
+    JOB_KIND: "Traduction en cours...",
+    "marketing": "Génération de la fiche en cours...",
+}
+# Fréquence minimale d'écriture du signe de vie d'une tâche en cours
+HEARTBEAT_SECONDS = 30
+
+_scheduler_started = False
+_scheduler_lock = threading.Lock()
+# Réveille le répartiteur dès qu'une tâche est ajoutée par ce processus
+_wakeup = threading.Event()
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def wake_up():
+    """Réveille le répartiteur de ce processus (tâche ajoutée ou emplacement libéré)."""
+    _wakeup.set()
+
+
+def enqueue_translation(owner, input_path, input_file, output_file_name, settings, priority="normal", batch_id=None,
+                        revision_of=None):
+    """
+    Ajoute une tâche de traduction à la file partagée et retourne la tâche créée.
+    `revision_of` : traduction précédente dont la tâche ne retraduit que les paragraphes modifiés.
+    """
+    if priority not in Config.JOB_PRIORITIES:
+        raise ValueError(f"Priorité inconnue : {priority}")
+    job = job_store.create_job(
+        JOB_KIND,
+        owner=owner,
+        priority=priority,
+        batch_id=batch_id,
+        revision_of=revision_of,
+        input_path=input_path,
+        input_file=input_file,
+        output_file_name=output_file_name,
+        settings=settings,
+        progress=0,
+        # Tâche soumise par une requête profilée : elle sera profilée à son tour
+        profile=profiling.active(),
+    )
+    _wakeup.set()
+    logger.info("📌 Tâche %s en file (%s) : %s", job['id'], priority, input_file)
+    return job
+
+
+def queued_jobs():
+    """
+    Tâches prêtes à démarrer, dans l'ordre de passage : priorité, puis partage équitable entre
+    utilisateurs, puis ancienneté. Les tâches retenues par un quota n'y figurent pas.
+    """
+    return queue_state(JOB_KINDS)[0]
+
+
+def queue_info(jobs=None):
+    """
+    Position dans la file et raison d'attente des tâches en attente :
+    {id: {"queue_position": n, "held": None | "daily_spend" | "max_running_jobs"}}.
+    """
+    _, held, positions, _ = queue_state(JOB_KINDS, jobs)
+    return {
+        job_id: {"queue_position": positions.get(job_id), "held": held.get(job_id)}
+        for job_id in set(positions) | set(held)
+    }
+
+
+def cancel_job(job_id):
+    """
+    Demande l'annulation d'une tâche : une tâche en attente est annulée aussitôt, une tâche
+    en cours s'arrête à son prochain point de contrôle (quel que soit le processus qui l'exécute).
+    Retourne la tâche mise à jour, ou None si elle est déjà terminée.
+    """
+    job = job_store.transition_job(job_id, ("queued",), status="cancelled", message="Tâche annulée.",
+                                   finished_at=datetime.now().isoformat())
+    if job is None:
+        job = job_store.transition_job(job_id, ("running",), cancel_requested=True, message="Annulation en cours...")
+        if job is not None:
+            cancellation.cancel_local(job_id)
+    if job is not None:
+        logger.info("🛑 Annulation demandée pour la tâche %s", job_id)
+    return job
+
+
+def _finish_cancelled(job, output_paths):
+    """Supprime les sorties partielles d'une tâche annulée et enregistre son statut."""
+    for path in output_paths:
+        if os.path.exists(path):
+            os.remove(path)
+    job_store.update_job(job["id"], status="cancelled", message="Tâche annulée.", finished_at=datetime.now().isoformat())
+    logger.info("🛑 Tâche %s annulée.", job['id'])
+
+
+def run_translation_job(job):
+    """
+    Exécute une tâche de traduction réservée et enregistre son résultat,
+    ainsi que sa consommation réelle (tokens, caractères, reprises, durée par étape).
+    """
+    cancel = cancellation.register(job["id"])
+    meter = UsageMeter()
+    try:
+        with metering(meter), (profiling.session(f"translation {job['id']}", "job", job.get("owner"))
+                               if job.get("profile") else nullcontext()):
+            _run_translation_job(job, cancel, meter)
+    finally:
+        cancellation.unregister(job["id"])
+        job_store.update_job(job["id"], usage=meter.to_dict())
+
+
+def _run_translation_job(job, cancel, meter):
+    output_path = os.path.join(Config.DOWNLOAD_FOLDER, job["output_file_name"])
+    if job.get("revision_of"):
+        return _run_revision_job(job, output_path, cancel, meter)
+
+    job_id = job["id"]
+    settings = dict(job["settings"])
+    target_languages = settings.pop("target_languages")
+    progress = {}
+    last_write = [0.0]
+
+    def on_progress(language, done, total):
+        progress[language] = done / total if total else 1
+        now = time.time()
+        # Limiter les écritures disque : au plus une mise à jour par seconde
+        if now - last_write[0] >= 1 or done == total:
+            last_write[0] = now
+            job_store.update_job(
+                job_id,
+                progress=round(100 * sum(progress.values()) / len(target_languages)),
+                heartbeat_at=datetime.now().isoformat(),
+                usage=meter.to_dict(),
+            )
+
+    try:
+        outputs, errors = run_languages(
+            target_languages,
+            input_path=job["input_path"],
+            output_path=output_path,
+            on_progress=on_progress,
+            cancel=cancel,
+            api_key=Config.DEEPL_API_KEY,
+            **settings,
+        )
+        for path in outputs.values():
+            retention.record_file_added(path)
+        if not outputs:
+            raise Exception("; ".join(f"{lang}: {error}" for lang, error in errors.items()))
+
+        result_files = [os.path.basename(outputs[lang]) for lang in target_languages if lang in outputs]
+        message = "Traduction terminée"
+        if errors:
+            message += f" (échec pour {', '.join(errors)})"
+        job_store.update_job(job_id, status="done", message=message, result_files=result_files, progress=100,
+                             finished_at=datetime.now().isoformat())
+        logger.info("✅ Tâche %s terminée : %s", job_id, result_files)
+    except JobCancelled:
+        multiple = len(set(target_languages)) > 1
+        _finish_cancelled(job, [output_path_for(output_path, lang, multiple) for lang in target_languages])
+    except Exception as e:
+        job_store.update_job(job_id, status="error", message=f"Erreur lors du traitement : {e}",
+                             finished_at=datetime.now().isoformat())
+        logger.error("❌ Tâche %s en erreur : %s", job_id, e)
+
+
+def _run_revision_job(job, output_path, cancel, meter):
+    """Retraduit une version révisée à partir de l'enregistrement de la traduction précédente."""
+    job_id = job["id"]
+    last_write = [0.0]
+
+    def on_progress(done, total):
+        now = time.time()
+        if now - last_write[0] >= 1 or done == total:
+            last_write[0] = now
+            job_store.update_job(job_id, progress=round(100 * done / total) if total else 100,
+                                 heartbeat_at=datetime.now().isoformat(), usage=meter.to_dict())
+
+    try:
+        stats = retranslate_revision(Config.DEEPL_API_KEY, job["input_path"], job["revision_of"], output_path,
+                                     on_progress=on_progress, cancel=cancel)
+        retention.record_file_added(output_path)
+        message = (f"Révision terminée : {stats['retranslated_paragraphs']}/{stats['paragraphs']} paragraphes retraduits, "
+                   f"{stats['reused_groups']} groupes réutilisés")
+        job_store.update_job(job_id, status="done", message=message, result_files=[job["output_file_name"]],
+                             revision_stats=stats, progress=100, finished_at=datetime.now().isoformat())
+        logger.info("✅ Révision %s terminée : %s", job_id, stats)
+    except JobCancelled:
+        _finish_cancelled(job, [output_path])
+    except Exception as e:
+        job_store.update_job(job_id, status="error", message=f"Erreur lors de la révision : {e}",
+                             finished_at=datetime.now().isoformat())
+        logger.error("❌ Révision %s en erreur : %s", job_id, e)
+
+
+def run_job(job):
+    try:
+        if job.get("kind") == "marketing":
+            from marketing_app.jobs import run_fiche_job
+            return run_fiche_job(job)
+        return run_translation_job(job)
+    finally:
+        _record_run(job["id"])
+
+
+def _record_run(job_id):
+    """
+    Enregistre la consommation de l'exécution qui vient de se terminer : dépense du jour de
+    l'utilisateur et journal de consommation (conservé après la purge des tâches).
+    """
+    job = job_store.get_job(job_id)
+    if job is None:
+        return
+    try:
+        record_spend(job.get("owner"), estimate_cost(job.get("usage")))
+        append_ledger(job)
+    except OSError as e:
+        logger.warning("⚠️ Consommation de la tâche %s non enregistrée : %s", job_id, e)
+
+
+def _run_in_slot(job, slot, bulk_slot=None):
+    try:
+        run_job(job)
+    finally:
+        release(slot)
+        if bulk_slot is not None:
+            release(bulk_slot)
+        # Un emplacement vient de se libérer : passer tout de suite à la tâche suivante
+        _wakeup.set()
+
+
+def requeue_stale_jobs():
+    """Remet en file les tâches dont le processus ne donne plus signe de vie."""
+    now = datetime.now()
+    for job in job_store.list_active_jobs():
+        if job["status"] != "running" or job.get("kind") not in JOB_KINDS:
+            continue
+        last_seen = datetime.fromisoformat(job.get("heartbeat_at") or job["updated_at"])
+        if (now - last_seen).total_seconds() > Config.JOB_STALE_SECONDS:
+            if job.get("cancel_requested"):
+                # Annulée avant l'arrêt de son processus : ne pas la relancer
+                job_store.transition_job(job["id"], ("running",), status="cancelled", message="Tâche annulée.",
+                                         finished_at=now.isoformat())
+                continue
+            if job_store.transition_job(job["id"], ("running",), status="queued", worker=None,
+                                        message="Relancée après l'arrêt de son processus."):
+                logger.warning("⚠️ Tâche %s sans signe de vie, remise en file.", job['id'])
+
+
+def dispatch_once(running, max_running=None):
+    """
+    Démarre des tâches en attente tant qu'un emplacement global est libre, dans l'ordre de
+    `queued_jobs`. Les tâches non urgentes prennent en plus un emplacement "bulk" : les
+    emplacements réservés (INTERACTIVE_RESERVED_JOBS) restent libres pour les tâches urgentes.
+    `running` associe l'identifiant des tâches lancées par ce processus à leur thread ;
+    `max_running` limite en plus le nombre de tâches exécutées par ce processus.
+    """
+    started = 0
+    for job in queued_jobs():
+        if max_running is not None and sum(thread.is_alive() for thread in running.values()) >= max_running:
+            break
+        slot = try_acquire("jobs")
+        if slot is None:
+            break
+        bulk_slot = None
+        if job.get("priority") != "rush":
+            bulk_slot = try_acquire("bulk")
+            if bulk_slot is None:
+                # Les tâches urgentes passent en tête : les suivantes ne le sont pas non plus
+                release(slot)
+                break
+        claimed = job_store.claim_job(job["id"], worker=worker_id(), message=JOB_KINDS[job["kind"]],
+                                      started_at=datetime.now().isoformat(), heartbeat_at=datetime.now().isoformat())
+        if claimed is None:
+            # Prise entre-temps par un autre processus
+            release(slot)
+            if bulk_slot is not None:
+                release(bulk_slot)
+            continue
+        thread = threading.Thread(target=_run_in_slot, args=(claimed, slot, bulk_slot), name=f"job-{claimed['id'][:8]}",
+                                  daemon=True)
+        running[claimed["id"]] = thread
+        thread.start()
+        started += 1
+    return started
+
+
+def _heartbeat(running, last_heartbeat):
+    for job_id, thread in list(running.items()):
+        if not thread.is_alive():
+            running.pop(job_id)
+    if time.time() - last_heartbeat < HEARTBEAT_SECONDS:
+        return last_heartbeat
+    for job_id in running:
+        job_store.transition_job(job_id, ("running",), heartbeat_at=datetime.now().isoformat())
+    requeue_stale_jobs()
+    return time.time()
+
+
+def _scheduler_loop(running=None, max_running=None, stop=None):
+    running = running if running is not None else {}
+    last_heartbeat = 0.0
+    while stop is None or not stop.is_set():
+        try:
+            _wakeup.clear()
+            dispatch_once(running, max_running)
+            last_heartbeat = _heartbeat(running, last_heartbeat)
+        except Exception as e:
+            logger.error("Erreur dans le répartiteur de tâches : %s", e)
+        _wakeup.wait(Config.SCHEDULER_POLL_SECONDS)
+
+
+def run_worker(max_jobs=None):
+    """
+    Boucle d'un processus worker dédié (`your_script.py worker`) : consomme la file partagée
+    jusqu'à SIGTERM/SIGINT. Au premier signal, plus aucune tâche n'est prise et les tâches
+    en cours se terminent ; au second, elles sont remises en file et le processus s'arrête.
+    """
+    stop = threading.Event()
+    running = {}
+
+    def on_signal(signum, frame):
+        if stop.is_set():
+            for job_id in list(running):
+                job_store.transition_job(job_id, ("running",), status="queued", worker=None,
+                                         message="Relancée après l'arrêt de son worker.")
+            logger.warning("⚠️ Arrêt immédiat du worker, %s tâche(s) remise(s) en file.", len(running))
+            raise SystemExit(1)
+        logger.info("🛑 Arrêt demandé : fin des tâches en cours (second signal pour forcer).")
+        stop.set()
+        _wakeup.set()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    logger.info("🚀 Worker %s démarré (%s tâche(s) simultanée(s) au plus).",
+                worker_id(), max_jobs or Config.TRANSLATION_MAX_JOBS)
+    _scheduler_loop(running, max_jobs, stop)
+
+    # Drainage : le signe de vie continue d'être écrit jusqu'à la fin des tâches en cours
+    last_heartbeat = 0.0
+    while any(thread.is_alive() for thread in running.values()):
+        last_heartbeat = _heartbeat(running, last_heartbeat)
+        time.sleep(1)
+    logger.info("✅ Worker %s arrêté.", worker_id())
+
+
+def start_scheduler():
+    """Démarre le répartiteur une fois par processus (après le fork des workers)."""
+    global _scheduler_started
+    with _scheduler_lock:
+        if _scheduler_started:
+            return
+        _scheduler_started = True
+    threading.Thread(target=_scheduler_loop, name="translation-scheduler", daemon=True).start()
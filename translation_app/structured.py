@@ -0,0 +1,180 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+
+from config import Config
+from usage import record_openai, record_retry
+
+from .cancellation import check as check_cancelled
+
+logger = logging.getLogger(__name__)
+
+# Amélioration ChatGPT en sortie structurée : le modèle renvoie un tableau JSON aligné sur les
+# paragraphes envoyés ({"id", "text"} par paragraphe). Chaque élément est validé à la réception :
+# seuls les paragraphes invalides ou manquants sont redemandés, et chaque résultat est mis en
+# cache par paragraphe (purgé par la rétention, politique "gpt_cache").
+GPT_CACHE_FOLDER = Config.GPT_CACHE_FOLDER
+MAX_ATTEMPTS = 3
+RATE_LIMIT_DELAY = 30
+
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+class StructuredOutputError(ValueError):
+    """Réponse du modèle inexploitable (JSON invalide ou pas un tableau)."""
+
+
+def cache_key(paragraph, glossary, language_level, source_language, target_language, model):
+    raw = "\u0000".join([
+        model, language_level, source_language or "", target_language,
+        json.dumps(glossary, sort_keys=True, ensure_ascii=False), " ".join(paragraph.split()),
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ParagraphCache:
+    """Améliorations déjà obtenues, un fichier par paragraphe (partagé entre processus)."""
+
+    def __init__(self, folder=GPT_CACHE_FOLDER):
+        self.folder = folder
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                text = json.load(f)["text"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+        try:
+            # Entrée réutilisée : la rétention purge d'abord celles qui ne servent plus
+            os.utime(self._path(key))
+        except OSError:
+            pass
+        return text
+
+    def put(self, key, text):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"text": text}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def build_prompt(paragraphs, glossary, language_level, source_language, target_language):
+    """Prompt demandant un objet JSON par paragraphe, identifié par sa position (à partir de 1)."""
+    items = [{"id": index, "text": text} for index, text in enumerate(paragraphs, start=1)]
+    return (
+        f"Translate each of the following paragraphs from {source_language} to {target_language} "
+        f"and improve its quality to match the '{language_level}' language level.\n"
+        f"Use the glossary strictly when applicable: {glossary}.\n"
+        f"The input is a JSON array of {len(items)} objects {{\"id\", \"text\"}}. "
+        f"Return only a JSON array with exactly one object {{\"id\", \"text\"}} per input paragraph, "
+        f"with the same ids, in the same order. Never merge, split or omit paragraphs.\n\n"
+        f"{json.dumps(items, ensure_ascii=False)}"
+    )
+
+
+def parse_reply(reply, expected):
+    """
+    Valide la réponse du modèle et retourne {position (0..expected-1): texte} pour les éléments
+    corrects ; les éléments absents, en double ou vides sont ignorés (à redemander).
+    Lève StructuredOutputError si la réponse n'est pas un tableau JSON.
+    """
+    try:
+        data = json.loads(_FENCE.sub("", reply or ""))
+    except ValueError as e:
+        raise StructuredOutputError(f"invalid JSON: {e}")
+    if not isinstance(data, list):
+        raise StructuredOutputError("reply is not a JSON array")
+
+    results = {}
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        position, text = item.get("id"), item.get("text")
+        if not isinstance(position, int) or isinstance(position, bool) or not 1 <= position <= expected:
+            continue
+        if not isinstance(text, str) or not text.strip() or position - 1 in results:
+            continue
+        results[position - 1] = text.strip()
+    return results
+
+
+def _request(paragraphs, glossary, language_level, source_language, target_language, model, cancel=None):
+    import openai
+
+    prompt = build_prompt(paragraphs, glossary, language_level, source_language, target_language)
+    while True:
+        try:
+            response = openai.ChatCompletion.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": "You are a skilled translator and editor. You answer in JSON only."},
+                    {"role": "user", "content": prompt},
+                ],
+                max_tokens=2048,
+                temperature=0.7,
+            )
+        except openai.error.RateLimitError as e:
+            logger.error("Rate limit reached: %s. Adding delay before retrying.", e)
+            record_retry("openai", model)
+            if cancel is not None:
+                cancel.sleep(RATE_LIMIT_DELAY)
+            else:
+                time.sleep(RATE_LIMIT_DELAY)
+            continue
+        record_openai(model, response.get("usage"))
+        return response["choices"][0]["message"]["content"]
+
+
+def improve_paragraphs(paragraphs, glossary, language_level, source_language, target_language, model, cache=None,
+                       cancel=None, max_attempts=MAX_ATTEMPTS):
+    """
+    Améliore une liste de paragraphes et retourne une liste alignée (un texte par paragraphe).
+    Les paragraphes déjà en cache ne sont pas envoyés ; ceux dont la réponse est invalide sont
+    redemandés seuls, par requêtes deux fois plus petites à chaque tentative. Un paragraphe
+    toujours invalide après `max_attempts` tentatives vaut None.
+    """
+    keys = [cache_key(p, glossary, language_level, source_language, target_language, model) for p in paragraphs]
+    results = [cache.get(key) if cache is not None else None for key in keys]
+    pending = [index for index, text in enumerate(results) if text is None]
+    chunk_size = len(pending)
+
+    for attempt in range(1, max_attempts + 1):
+        if not pending:
+            break
+        failed = []
+        for start in range(0, len(pending), chunk_size):
+            check_cancelled(cancel)
+            chunk = pending[start : start + chunk_size]
+            reply = _request([paragraphs[i] for i in chunk], glossary, language_level, source_language, target_language,
+                             model, cancel)
+            try:
+                parsed = parse_reply(reply, len(chunk))
+            except StructuredOutputError as e:
+                logger.warning("Structured reply rejected (%s), %s paragraphs to retry.", e, len(chunk))
+                parsed = {}
+            for position, index in enumerate(chunk):
+                if position in parsed:
+                    results[index] = parsed[position]
+                    if cache is not None:
+                        cache.put(keys[index], parsed[position])
+                else:
+                    failed.append(index)
+        if failed and attempt < max_attempts:
+            record_retry("openai", model)
+            logger.info("Retrying %s/%s paragraphs (attempt %s/%s).",
+                        len(failed), len(paragraphs), attempt + 1, max_attempts)
+        pending = failed
+        chunk_size = max(1, (chunk_size + 1) // 2)
+
+    if pending:
+        logger.warning("%s paragraphs still invalid after %s attempts.", len(pending), max_attempts)
+    return results
@@ -1,23 +1,24 @@
-import requests
-from docx import Document
-from tqdm import tqdm
 import time
 import os
-import pandas as pd
 import logging
-import openai
+from usage import record_openai, record_deepl, record_retry, stage
+from .glossary_cache import load_compiled_glossary
+from .glossary_check import find_violations, build_focused_prompt
+from .cancellation import JobCancelled, check as check_cancelled
+from .structured import ParagraphCache, improve_paragraphs
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-def create_glossary(api_key, name, source_lang, target_lang, glossary_path):
+def create_glossary(api_key, name, source_lang, target_lang, glossary_path, encoding="utf-8-sig"):
+    import requests
+
     api_url = "https://api.deepl.com/v2/glossaries"
     
     if not os.path.exists(glossary_path):
-        logger.error(f"Glossary file not found: {glossary_path}")
+        logger.error("Glossary file not found: %s", glossary_path)
         raise FileNotFoundError(f"Glossary file not found: {glossary_path}")
 
-    with open(glossary_path, "r") as glossary_file:
+    with open(glossary_path, "r", encoding=encoding) as glossary_file:
         glossary_content = glossary_file.read()
 
     headers = {
@@ -37,13 +38,38 @@ def create_glossary(api_key, name, source_lang, target_lang, glossary_path):
     response_data = response.json()
 
     if response.status_code in (200, 201) and "glossary_id" in response_data:
-        logger.info(f"Glossary created successfully with ID: {response_data['glossary_id']}")
+        logger.info("Glossary created successfully with ID: %s", response_data['glossary_id'])
         return response_data["glossary_id"]
     else:
-        logger.error(f"Failed to create glossary: {response.text}")
+        logger.error("Failed to create glossary: %s", response.text)
         raise Exception(f"Failed to create glossary: {response.text}")
 
-def translate_docx_with_deepl(api_key, input_file_path, output_file_path, target_language, source_language, glossary_id=None):
+def delete_glossary(api_key, glossary_id):
+    """Supprime un glossaire DeepL ; un échec est seulement journalisé."""
+    import requests
+
+    try:
+        response = requests.delete(
+            f"https://api.deepl.com/v2/glossaries/{glossary_id}",
+            headers={"Authorization": f"DeepL-Auth-Key {api_key}"},
+            timeout=30,
+        )
+        if response.status_code in (200, 204, 404):
+            logger.info("Glossary %s deleted.", glossary_id)
+        else:
+            logger.warning("Failed to delete glossary %s: %s", glossary_id, response.text)
+    except Exception as e:
+        logger.warning("Failed to delete glossary %s: %s", glossary_id, e)
+
+def translate_docx_with_deepl(api_key, input_file_path, output_file_path, target_language, source_language, glossary_id=None,
+                              cancel=None):
+    """
+    Traduit un .docx avec l'API document de DeepL.
+    `cancel` (CancelToken) est vérifié entre deux interrogations du statut : l'API n'offre pas
+    de suppression, le document abandonné expire côté DeepL sans être téléchargé.
+    """
+    import requests
+
     api_url = "https://api.deepl.com/v2/document"
     headers = {"Authorization": f"DeepL-Auth-Key {api_key}"}
     data = {"target_lang": target_language, "source_lang": source_language}
@@ -52,7 +78,7 @@ def translate_docx_with_deepl(api_key, input_file_path, output_file_path, target
         data["glossary_id"] = glossary_id
 
     if not os.path.exists(input_file_path):
-        logger.error(f"Input document not found: {input_file_path}")
+        logger.error("Input document not found: %s", input_file_path)
         raise FileNotFoundError(f"Input document not found: {input_file_path}")
 
     with open(input_file_path, "rb") as file:
@@ -67,13 +93,20 @@ def translate_docx_with_deepl(api_key, input_file_path, output_file_path, target
 
     status_url = f"{api_url}/{document_id}"
     while True:
+        if cancel is not None and cancel.cancelled():
+            logger.info("DeepL document %s abandoned after cancellation.", document_id)
+            raise JobCancelled(cancel.job_id)
         status_response = requests.post(status_url, headers=headers, data={"document_key": document_key})
         status_data = status_response.json()
         if status_data["status"] == "done":
+            record_deepl(status_data.get("billed_characters", 0))
             break
         elif status_data["status"] == "error":
             raise Exception(f"Translation error: {status_data}")
-        time.sleep(1)
+        if cancel is not None:
+            cancel.sleep(1)
+        else:
+            time.sleep(1)
 
     download_url = f"{api_url}/{document_id}/result"
     download_response = requests.post(download_url, headers=headers, data={"document_key": document_key})
@@ -81,75 +114,309 @@ def translate_docx_with_deepl(api_key, input_file_path, output_file_path, target
     if download_response.status_code == 200:
         with open(output_file_path, "wb") as output_file:
             output_file.write(download_response.content)
-        logger.info(f"Translated document saved to {output_file_path}")
+        logger.info("Translated document saved to %s", output_file_path)
     else:
         raise Exception(f"Failed to download translated document: {download_response.text}")
 
-def improve_translation(input_file, glossary_path, output_file, language_level, source_language, target_language, group_size, model):
+def save_document_atomic(doc, path):
+    """Sauvegarde un document via un fichier temporaire, pour ne jamais exposer un fichier à moitié écrit."""
+    tmp_path = f"{path}.tmp"
+    doc.save(tmp_path)
+    os.replace(tmp_path, path)
+
+def improve_translation(input_file, glossary_path, output_file, language_level, source_language, target_language, group_size, model,
+                        stream=False, checkpoint_interval=10, on_progress=None, source_file=None, check_glossary=True,
+                        source_paragraphs=None, cancel=None, output_mode="text", streaming=False):
     """
     Améliore la traduction avec ChatGPT en utilisant le glossaire.
+    Le document de sortie est sauvegardé au fil de l'eau (dès le premier groupe, puis
+    au plus toutes les `checkpoint_interval` secondes) pour être téléchargeable en cours de tâche.
+    Si `check_glossary` est actif, les groupes qui n'appliquent pas le glossaire sont
+    corrigés par une requête ciblée avant la sauvegarde finale.
+    `source_paragraphs` évite de relire `source_file` quand il est déjà analysé.
+    `cancel` (CancelToken) est vérifié avant chaque groupe et pendant la réception du flux.
+    `output_mode` : "text" (un texte par groupe) ou "structured" (réponse JSON alignée sur les
+    paragraphes : un paragraphe de sortie par paragraphe source, reprise et cache par paragraphe).
+    `streaming` : lecture et écriture du .docx au fil de l'eau, en mémoire bornée (gros documents).
+    Retourne la correspondance entre groupes de paragraphes et textes améliorés.
     """
+    from docx import Document
+    from tqdm import tqdm
+
     if glossary_path and not os.path.exists(glossary_path):
-        logger.error(f"Glossary file not found: {glossary_path}")
+        logger.error("Glossary file not found: %s", glossary_path)
         raise FileNotFoundError(f"Glossary file not found: {glossary_path}")
 
+    glossary_artifact = load_compiled_glossary(glossary_path) if glossary_path else None
+    glossary = glossary_artifact["terms"] if glossary_artifact else {}
+    settings = (glossary, language_level, source_language, target_language, model, stream, output_mode, cancel)
+    if streaming:
+        return _improve_translation_streaming(input_file, output_file, group_size, settings, glossary_artifact,
+                                              checkpoint_interval, on_progress, source_file, check_glossary,
+                                              source_paragraphs)
+
     doc = Document(input_file)
-    glossary = read_glossary(glossary_path) if glossary_path else {}
     output_doc = Document()
     paragraphs = [para.text for para in doc.paragraphs if para.text.strip()]
-    logger.debug(f"Loaded {len(paragraphs)} paragraphs for processing.")
+    logger.debug("Loaded %s paragraphs for processing.", len(paragraphs))
+    total_groups = (len(paragraphs) + group_size - 1) // group_size
+    last_checkpoint = None
+    group_results = []  # (indice du premier paragraphe, paragraphe de sortie)
+    result_size = _result_size(output_mode, group_size)
+    cache = ParagraphCache() if output_mode == "structured" else None
     
-    with tqdm(total=len(paragraphs), desc="Processing paragraphs") as pbar:
+    with tqdm(total=len(paragraphs), desc="Processing paragraphs") as pbar, stage("gpt"):
         for i in range(0, len(paragraphs), group_size):
+            check_cancelled(cancel)
             group = paragraphs[i : i + group_size]
-            improved_text = process_paragraphs(group, glossary, language_level, source_language, target_language, model)
-            if improved_text:
-                output_doc.add_paragraph(improved_text)
-            else:
-                logger.warning(f"Skipping group {i // group_size + 1} due to an error.")
+            for index, improved_text in _improve_group(group, i, group_size, settings, cache):
+                group_results.append((index, output_doc.add_paragraph(improved_text)))
             pbar.update(len(group))
-    
-    output_doc.save(output_file)
-    logger.debug(f"Improved document saved to {output_file}.")
 
-def convert_excel_to_csv(excel_path, csv_path):
-    if not os.path.exists(excel_path):
-        logger.error(f"Excel file not found: {excel_path}")
-        raise FileNotFoundError(f"Excel file not found: {excel_path}")
+            if last_checkpoint is None or time.time() - last_checkpoint >= checkpoint_interval:
+                save_document_atomic(output_doc, output_file)
+                last_checkpoint = time.time()
+                logger.debug("Checkpoint saved to %s after group %s/%s.",
+                             output_file, i // group_size + 1, total_groups)
+            if on_progress:
+                on_progress(i // group_size + 1, total_groups)
 
-    df = pd.read_excel(excel_path, header=None)
-    
-    # Enregistrement en UTF-8 strict (sans BOM)
-    df.to_csv(csv_path, index=False, header=False, encoding='utf-8')
+    if check_glossary and glossary_artifact and glossary and group_results:
+        original = source_paragraphs
+        if original is None and source_file:
+            original = [para.text for para in Document(source_file).paragraphs if para.text.strip()]
+        checked_sources = paragraphs
+        if original is not None:
+            if len(original) == len(paragraphs):
+                checked_sources = original
+            else:
+                logger.warning("Source and translated paragraph counts differ; checking glossary against the translated text.")
+        with stage("glossary_check"):
+            enforce_glossary(group_results, checked_sources, result_size, glossary_artifact, target_language, model, cancel=cancel)
     
-    logger.info(f"Converted Excel file to CSV: {csv_path} with UTF-8 encoding")
+    save_document_atomic(output_doc, output_file)
+    logger.debug("Improved document saved to %s.", output_file)
+    # (indice du premier paragraphe, nombre de paragraphes, texte amélioré) par groupe réussi
+    return {
+        "paragraph_count": len(paragraphs),
+        "groups": [(i, len(paragraphs[i : i + result_size]), paragraph.text) for i, paragraph in group_results],
+    }
+
+def _result_size(output_mode, group_size):
+    # En mode structuré, chaque paragraphe de sortie correspond à un seul paragraphe source
+    return 1 if output_mode == "structured" else group_size
+
+def _improve_group(group, start, group_size, settings, cache=None):
+    """
+    Améliore un groupe de paragraphes commençant à l'indice `start`.
+    Retourne les paragraphes de sortie [(indice du premier paragraphe source, texte)].
+    """
+    glossary, language_level, source_language, target_language, model, stream, output_mode, cancel = settings
+    if output_mode == "structured":
+        improved = improve_paragraphs(group, glossary, language_level, source_language, target_language, model,
+                                      cache=cache, cancel=cancel)
+        results = []
+        for offset, (improved_text, translated_text) in enumerate(zip(improved, group)):
+            if improved_text is None:
+                logger.warning("Paragraph %s kept as translated by DeepL (invalid structured output).",
+                               start + offset + 1)
+                improved_text = translated_text
+            results.append((start + offset, improved_text))
+        return results
 
-    # Vérification du contenu après conversion pour debug
-    with open(csv_path, 'r', encoding='utf-8') as f:
-        sample_content = f.read(200)  # Lire les 200 premiers caractères pour vérification
-        logger.info(f"CSV Sample Content: {sample_content}")
+    improved_text = process_paragraphs(group, glossary, language_level, source_language, target_language, model,
+                                       stream=stream, cancel=cancel)
+    if not improved_text:
+        logger.warning("Skipping group %s due to an error.", start // group_size + 1)
+        return []
+    return [(start, improved_text)]
 
-    return csv_path
+class _PendingParagraph:
+    """Paragraphe de sortie pas encore écrit (même interface `text` que pour enforce_glossary)."""
 
+    def __init__(self, text):
+        self.text = text
+
+def _improve_translation_streaming(input_file, output_file, group_size, settings, glossary_artifact, checkpoint_interval,
+                                   on_progress, source_file, check_glossary, source_paragraphs):
+    """
+    Variante en mémoire bornée de improve_translation : les paragraphes sont lus un groupe à la
+    fois et chaque groupe amélioré (vérification du glossaire comprise) est aussitôt écrit sur
+    disque. Seuls les textes améliorés sont conservés, pour l'enregistrement de révision.
+    """
+    from itertools import islice
+    from tqdm import tqdm
+    from .docx_stream import StreamingDocxWriter, count_paragraphs, iter_paragraph_texts
+
+    glossary, _, _, target_language, model, _, output_mode, cancel = settings
+    result_size = _result_size(output_mode, group_size)
+    cache = ParagraphCache() if output_mode == "structured" else None
+    paragraph_count = count_paragraphs(input_file)
+    total_groups = (paragraph_count + group_size - 1) // group_size
+    logger.debug("Streaming %s paragraphs for processing.", paragraph_count)
+
+    # Paragraphes source lus en parallèle des paragraphes traduits, pour la vérification du glossaire
+    sources = None
+    if check_glossary and glossary_artifact and glossary:
+        if source_paragraphs is not None:
+            source_count, sources = len(source_paragraphs), iter(source_paragraphs)
+        elif source_file:
+            source_count, sources = count_paragraphs(source_file), iter_paragraph_texts(source_file)
+        if sources is not None and source_count != paragraph_count:
+            logger.warning("Source and translated paragraph counts differ; checking glossary against the translated text.")
+            sources = None
+
+    groups = []
+    last_checkpoint = None
+    paragraphs = iter_paragraph_texts(input_file)
+    with StreamingDocxWriter(os.path.dirname(os.path.abspath(output_file))) as writer, \
+            tqdm(total=paragraph_count, desc="Processing paragraphs") as pbar:
+        for i in range(0, paragraph_count, group_size):
+            check_cancelled(cancel)
+            group = list(islice(paragraphs, group_size))
+            with stage("gpt"):
+                results = [(index - i, _PendingParagraph(text)) for index, text in _improve_group(group, i, group_size, settings, cache)]
+            if check_glossary and glossary_artifact and glossary and results:
+                group_sources = list(islice(sources, len(group))) if sources is not None else group
+                with stage("glossary_check"):
+                    enforce_glossary(results, group_sources, result_size, glossary_artifact, target_language, model, cancel=cancel)
+            for offset, paragraph in results:
+                writer.add_paragraph(paragraph.text)
+                groups.append((i + offset, len(group[offset : offset + result_size]), paragraph.text))
+            pbar.update(len(group))
 
-def verify_csv_encoding(csv_path):
+            if last_checkpoint is None or time.time() - last_checkpoint >= checkpoint_interval:
+                writer.save(output_file)
+                last_checkpoint = time.time()
+                logger.debug("Checkpoint saved to %s after group %s/%s.",
+                             output_file, i // group_size + 1, total_groups)
+            if on_progress:
+                on_progress(i // group_size + 1, total_groups)
+
+        writer.save(output_file)
+    logger.debug("Improved document saved to %s.", output_file)
+    return {"paragraph_count": paragraph_count, "groups": groups}
+
+def enforce_glossary(group_results, source_paragraphs, group_size, glossary_artifact, target_language, model, cancel=None):
+    """
+    Vérifie en une passe que chaque groupe amélioré contient les termes imposés par le
+    glossaire, et ne renvoie à ChatGPT que les groupes fautifs avec un prompt ciblé.
+    """
+    import openai
+
+    source_texts = ["\n".join(source_paragraphs[i : i + group_size]) for i, _ in group_results]
+    improved_texts = [paragraph.text for _, paragraph in group_results]
+    violations = find_violations(source_texts, improved_texts, glossary_artifact)
+    logger.info("Glossary check: %s/%s groups need a correction.", len(violations), len(group_results))
+
+    for index, missing_terms in violations.items():
+        check_cancelled(cancel)
+        paragraph = group_results[index][1]
+        try:
+            response = openai.ChatCompletion.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": "You are a skilled translator and editor."},
+                    {"role": "user", "content": build_focused_prompt(paragraph.text, missing_terms, target_language)},
+                ],
+                max_tokens=2048,
+                temperature=0,
+            )
+            record_openai(model, response.get("usage"))
+            corrected = response["choices"][0]["message"]["content"].strip()
+        except Exception as e:
+            logger.error("Glossary correction failed for group %s: %s", index + 1, e)
+            continue
+        if corrected:
+            paragraph.text = corrected
+
+    remaining = find_violations(source_texts, [paragraph.text for _, paragraph in group_results], glossary_artifact)
+    if remaining:
+        logger.warning("Glossary still not applied in %s groups after correction.", len(remaining))
+    return violations
+
+class GlossaryFormatError(ValueError):
+    """Glossaire Excel invalide (structure différente de deux colonnes source/cible)."""
+
+
+def _cell_text(value):
+    return "" if value is None else " ".join(str(value).split())
+
+
+def convert_excel_to_csv(excel_path, csv_path):
+    """
+    Convertit un glossaire Excel en CSV UTF-8 (sans BOM) pour DeepL, en une seule passe :
+    les lignes sont lues en mode read_only et écrites au fil de l'eau.
+    Vérifie la structure à deux colonnes et ignore les termes source en double.
+    Retourne le décompte des lignes.
+    """
+    import csv
+    import tempfile
+    from openpyxl import load_workbook
+
+    if not os.path.exists(excel_path):
+        logger.error("Excel file not found: %s", excel_path)
+        raise FileNotFoundError(f"Excel file not found: {excel_path}")
+
+    stats = {"rows_read": 0, "rows_written": 0, "empty_rows": 0, "duplicates": 0}
+    seen = set()
+    workbook = load_workbook(excel_path, read_only=True, data_only=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(csv_path)), prefix=".convert_")
     try:
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            sample = f.read(100)
-            logger.info(f"CSV Sample Content: {sample[:100]}")
-        return True
-    except UnicodeDecodeError as e:
-        logger.error(f"Encoding issue detected in {csv_path}: {e}")
-        return False
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            for row_number, row in enumerate(workbook.worksheets[0].iter_rows(values_only=True), start=1):
+                stats["rows_read"] += 1
+                cells = [_cell_text(value) for value in row]
+                while cells and not cells[-1]:
+                    cells.pop()
+                if not cells:
+                    stats["empty_rows"] += 1
+                    continue
+                if len(cells) != 2 or not cells[0] or not cells[1]:
+                    raise GlossaryFormatError(
+                        f"Row {row_number}: expected 2 non-empty columns (source, target), got {cells}"
+                    )
+                key = cells[0].lower()
+                if key in seen:
+                    stats["duplicates"] += 1
+                    logger.warning("Row %s: duplicate source term '%s' ignored.", row_number, cells[0])
+                    continue
+                seen.add(key)
+                writer.writerow(cells)
+                stats["rows_written"] += 1
+        os.replace(tmp_path, csv_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        workbook.close()
+
+    logger.info(
+        "Converted Excel file to CSV: %s (%s entries, %s duplicates, %s empty rows)",
+        csv_path, stats['rows_written'], stats['duplicates'], stats['empty_rows']
+    )
+    return stats
 
 def read_glossary(glossary_path):
+    """
+    Lit un glossaire à partir de son artefact compilé (créé à l'upload),
+    mémorisé par processus : pas de re-parsing du CSV/DOCX à chaque tâche.
+    """
+    return load_compiled_glossary(glossary_path)["terms"]
+
+def parse_glossary_source(glossary_path, encoding=None):
     """
     Lit un glossaire à partir d'un fichier Word (.docx) ou CSV.
     """
+    import pandas as pd
+    from docx import Document
+
     glossary = {}
     try:
         if glossary_path.endswith(".csv"):
-            df = pd.read_csv(glossary_path, header=None)
+            df = pd.read_csv(glossary_path, header=None, encoding=encoding or "utf-8-sig")
             for index, row in df.iterrows():
                 glossary[row[0].strip()] = row[1].strip()
         elif glossary_path.endswith(".docx"):
@@ -158,23 +425,37 @@ def read_glossary(glossary_path):
                 if ":" in paragraph.text:
                     source, target = paragraph.text.split(":", 1)
                     glossary[source.strip()] = target.strip()
-        logger.debug(f"Glossary loaded successfully from {glossary_path}.")
+        logger.debug("Glossary loaded successfully from %s.", glossary_path)
     except Exception as e:
-        logger.error(f"Error reading glossary: {e}")
+        logger.error("Error reading glossary: %s", e)
         raise
     return glossary
 
-def process_paragraphs(paragraphs, glossary, language_level, source_language, target_language, model):
+def process_paragraphs(paragraphs, glossary, language_level, source_language, target_language, model, stream=False, on_delta=None,
+                       previous_translation=None, cancel=None):
     """
     Envoie les paragraphes à ChatGPT pour amélioration de la traduction.
+    Avec `stream=True`, les tokens sont consommés au fur et à mesure de leur arrivée ; ceux
+    du groupe sont transmis à `on_delta` (le cas échéant) une fois son flux complet.
+    `previous_translation` (traduction d'une version antérieure du passage) sert de référence
+    pour garder la même formulation là où le texte n'a pas changé.
+    Si `cancel` est déclenché pendant le flux, la réponse est abandonnée (JobCancelled).
     """
-    logger.debug(f"Processing paragraphs with model {model}.")
+    import openai
+
+    logger.debug("Processing paragraphs with model %s.", model)
     prompt = (
         f"Translate the following text from {source_language} to {target_language} "
         f"and improve its quality to match the '{language_level}' language level.\n"
         f"Use the glossary strictly when applicable: {glossary}.\n"
         f"Return only the improved translation, without additional comments.\n\n"
     )
+    if previous_translation:
+        prompt += (
+            f"This passage is a revised version of a text previously translated as follows. "
+            f"Keep that wording wherever the text did not change:\n{previous_translation}\n\n"
+            f"Text to translate:\n\n"
+        )
 
     for para in paragraphs:
         prompt += f"{para}\n\n"
@@ -188,14 +469,48 @@ def process_paragraphs(paragraphs, glossary, language_level, source_language, ta
             ],
             max_tokens=2048,
             temperature=0.7,
+            stream=stream,
+            # Le dernier fragment du flux porte alors la consommation réelle
+            **({"stream_options": {"include_usage": True}} if stream else {}),
         )
-        return response["choices"][0]["message"]["content"].strip()
+        if not stream:
+            record_openai(model, response.get("usage"))
+            return response["choices"][0]["message"]["content"].strip()
+
+        parts, usage = [], None
+        for chunk in response:
+            if cancel is not None and cancel.cancelled():
+                # Fermer le flux interrompt la génération côté OpenAI
+                if hasattr(response, "close"):
+                    response.close()
+                record_openai(model, None, prompt, "".join(parts))
+                raise JobCancelled(cancel.job_id)
+            usage = chunk.get("usage") or usage
+            if not chunk["choices"]:
+                continue
+            delta = chunk["choices"][0].get("delta", {}).get("content")
+            if delta:
+                parts.append(delta)
+        record_openai(model, usage, prompt, "".join(parts))
+        # Fragments transmis une fois le flux du groupe terminé : la reprise après une RateLimitError
+        # survenue en cours de flux ne renvoie jamais le début du groupe une seconde fois
+        if on_delta:
+            for delta in parts:
+                on_delta(delta)
+        return "".join(parts).strip()
     except openai.error.RateLimitError as e:
-        logger.error(f"Rate limit reached: {e}. Adding delay before retrying.")
-        time.sleep(30)
-        return process_paragraphs(paragraphs, glossary, language_level, source_language, target_language, model)
+        logger.error("Rate limit reached: %s. Adding delay before retrying.", e)
+        record_retry("openai", model)
+        if cancel is not None:
+            cancel.sleep(30)
+        else:
+            time.sleep(30)
+        return process_paragraphs(paragraphs, glossary, language_level, source_language, target_language, model, stream=stream,
+                                  on_delta=on_delta, previous_translation=previous_translation, cancel=cancel)
+    except JobCancelled:
+        raise
     except Exception as e:
-        logger.error(f"An error occurred with OpenAI API: {e}")
+        logger.error("An error occurred with OpenAI API: %s", e)
         raise
 
 def ensure_directory_exists(path):
@@ -205,4 +520,4 @@ def ensure_directory_exists(path):
     directory = os.path.dirname(path)
     if not os.path.exists(directory):
         os.makedirs(directory)
-        logger.debug(f"Directory created: {directory}")
+        logger.debug("Directory created: %s", directory)
@@ -0,0 +1,326 @@
+import contextvars
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import Config
+import job_store
+import profiling
+
+# Consommation réelle des API par tâche : tokens OpenAI, caractères DeepL, reprises et durée,
+# ventilés par étape (glossaire, deepl, gpt...). Le compteur de la tâche en cours est porté par
+# une variable de contexte : les pools de threads le propagent avec `propagate`, si bien que
+# chaque tâche ne compte que ses propres appels, même quand plusieurs tournent dans un processus.
+_current_meter = contextvars.ContextVar("usage_meter", default=None)
+_current_stage = contextvars.ContextVar("usage_stage", default="other")
+
+# Estimation grossière pour les réponses sans champ `usage` (environ 4 caractères par token)
+CHARS_PER_TOKEN = 4
+
+LEDGER_FOLDER = Config.USAGE_LEDGER_FOLDER
+# Champs d'une tâche recopiés dans le journal à la fin de chacune de ses exécutions
+LEDGER_FIELDS = ("id", "kind", "owner", "created_at", "started_at", "finished_at", "usage")
+
+
+def _openai_counts():
+    return {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "estimated_tokens": 0, "retries": 0}
+
+
+def _deepl_counts():
+    return {"requests": 0, "characters": 0, "retries": 0}
+
+
+def _add(target, source):
+    """Somme récursive de dictionnaires de compteurs."""
+    for key, value in source.items():
+        if isinstance(value, dict):
+            _add(target.setdefault(key, {}), value)
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN) if text else 0
+
+
+class UsageMeter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}  # étape -> {"seconds", "openai": {modèle: compteurs}, "deepl": compteurs}
+
+    def _stage(self, name):
+        return self.stages.setdefault(name, {"seconds": 0.0, "openai": {}, "deepl": _deepl_counts()})
+
+    def add_openai(self, model, prompt_tokens=0, completion_tokens=0, estimated=False, stage=None):
+        with self._lock:
+            counts = self._stage(stage or _current_stage.get())["openai"].setdefault(model, _openai_counts())
+            counts["requests"] += 1
+            counts["prompt_tokens"] += prompt_tokens
+            counts["completion_tokens"] += completion_tokens
+            if estimated:
+                counts["estimated_tokens"] += prompt_tokens + completion_tokens
+
+    def add_deepl(self, characters, stage=None):
+        with self._lock:
+            counts = self._stage(stage or _current_stage.get())["deepl"]
+            counts["requests"] += 1
+            counts["characters"] += characters
+
+    def add_retry(self, api, model=None, stage=None):
+        with self._lock:
+            stage_counts = self._stage(stage or _current_stage.get())
+            if api == "openai":
+                stage_counts["openai"].setdefault(model or "unknown", _openai_counts())["retries"] += 1
+            else:
+                stage_counts["deepl"]["retries"] += 1
+
+    def add_seconds(self, stage, seconds):
+        with self._lock:
+            self._stage(stage)["seconds"] += seconds
+
+    def merge(self, other):
+        """Ajoute la consommation d'un autre compteur (résultat de `to_dict`)."""
+        with self._lock:
+            _add(self.stages, other.get("stages", {}))
+
+    def to_dict(self):
+        """Détail par étape et totaux (par modèle OpenAI, DeepL, reprises)."""
+        with self._lock:
+            stages = {name: {"seconds": round(s["seconds"], 2), "openai": {m: dict(c) for m, c in s["openai"].items()},
+                             "deepl": dict(s["deepl"])} for name, s in self.stages.items()}
+        openai_totals, deepl_totals = {}, _deepl_counts()
+        for stage in stages.values():
+            _add(openai_totals, stage["openai"])
+            _add(deepl_totals, stage["deepl"])
+        return {
+            "openai": openai_totals,
+            "deepl": deepl_totals,
+            "retries": sum(c["retries"] for c in openai_totals.values()) + deepl_totals["retries"],
+            "stages": stages,
+        }
+
+    def total_tokens(self):
+        return sum(c["prompt_tokens"] + c["completion_tokens"] for c in self.to_dict()["openai"].values())
+
+
+@contextmanager
+def metering(meter):
+    """Attribue à `meter` les appels API faits dans le bloc (et dans les threads propagés)."""
+    token = _current_meter.set(meter)
+    try:
+        yield meter
+    finally:
+        _current_meter.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Attribue les appels du bloc à l'étape `name` et cumule sa durée (en secondes-thread)."""
+    token = _current_stage.set(name)
+    started = time.time()
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+        meter = _current_meter.get()
+        if meter is not None:
+            meter.add_seconds(name, time.time() - started)
+
+
+def current_meter():
+    return _current_meter.get()
+
+
+def record_openai(model, usage, prompt=None, completion=None):
+    """
+    Enregistre la consommation d'une réponse OpenAI. Sans champ `usage` (flux interrompu),
+    les tokens sont estimés à partir du prompt et de la réponse.
+    """
+    meter = _current_meter.get()
+    if meter is None:
+        return
+    if usage:
+        meter.add_openai(model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+    else:
+        meter.add_openai(model, estimate_tokens(prompt), estimate_tokens(completion), estimated=True)
+
+
+def record_deepl(characters):
+    meter = _current_meter.get()
+    if meter is not None:
+        meter.add_deepl(characters)
+
+
+def record_retry(api, model=None):
+    meter = _current_meter.get()
+    if meter is not None:
+        meter.add_retry(api, model)
+
+
+def _model_prices(model):
+    """Tarif d'un modèle OpenAI (à défaut, celui du modèle connu dont il est une variante)."""
+    prices = Config.API_PRICES
+    if model in prices:
+        return prices[model]
+    variants = [name for name in prices if name != "deepl" and model.startswith(name)]
+    return prices[max(variants, key=len)] if variants else None
+
+
+def openai_cost(model, prompt_tokens, completion_tokens):
+    prices = _model_prices(model)
+    if prices is None:
+        return 0.0
+    return (prompt_tokens * prices["prompt"] + completion_tokens * prices["completion"]) / 1000
+
+
+def deepl_cost(characters):
+    return characters * Config.API_PRICES["deepl"]
+
+
+def estimate_cost(usage):
+    """Dépense estimée (USD) d'une consommation enregistrée (résultat de `to_dict`)."""
+    if not usage:
+        return 0.0
+    cost = sum(openai_cost(model, c["prompt_tokens"], c["completion_tokens"]) for model, c in usage.get("openai", {}).items())
+    return cost + deepl_cost(usage.get("deepl", {}).get("characters", 0))
+
+
+def propagate(fn):
+    """
+    Enveloppe `fn` pour l'exécuter dans une copie du contexte courant. À appeler à chaque
+    soumission à un pool de threads (une copie de contexte ne peut être active que dans un thread).
+    Si le code appelant est profilé (profiling.session), le thread l'est aussi.
+    """
+    context = contextvars.copy_context()
+    current = context.run(profiling.current_session)
+    if current is not None:
+        return lambda *args, **kwargs: context.run(profiling.run_in_session, current, fn, *args, **kwargs)
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def _day(entry):
+    """Jour d'attribution d'une exécution : celui de sa fin (à défaut, de sa création)."""
+    return (entry.get("finished_at") or entry["created_at"])[:10]
+
+
+def _job_facts(job):
+    """Lignes élémentaires (utilisateur, jour, type, étape, modèle, compteurs) d'une tâche."""
+    usage = job.get("usage")
+    if not usage:
+        return
+    base = {"user": job.get("owner") or "-", "day": _day(job), "kind": job.get("kind")}
+    for stage_name, stage_usage in usage.get("stages", {}).items():
+        for model, counts in stage_usage.get("openai", {}).items():
+            yield {**base, "stage": stage_name, "model": model, "openai_requests": counts["requests"],
+                   "prompt_tokens": counts["prompt_tokens"], "completion_tokens": counts["completion_tokens"],
+                   "estimated_tokens": counts.get("estimated_tokens", 0), "retries": counts.get("retries", 0),
+                   "cost": openai_cost(model, counts["prompt_tokens"], counts["completion_tokens"])}
+        deepl = stage_usage.get("deepl", {})
+        if deepl.get("requests") or deepl.get("retries"):
+            yield {**base, "stage": stage_name, "model": "deepl", "deepl_requests": deepl["requests"],
+                   "deepl_characters": deepl["characters"], "retries": deepl.get("retries", 0),
+                   "cost": deepl_cost(deepl["characters"])}
+        yield {**base, "stage": stage_name, "model": "-", "seconds": stage_usage.get("seconds", 0)}
+    if job.get("started_at") and job.get("finished_at"):
+        wall = (datetime.fromisoformat(job["finished_at"]) - datetime.fromisoformat(job["started_at"])).total_seconds()
+        yield {**base, "stage": "job", "model": "-", "wall_seconds": wall}
+
+
+REPORT_DIMENSIONS = ("user", "model", "day", "kind", "stage")
+REPORT_COUNTERS = ("openai_requests", "prompt_tokens", "completion_tokens", "estimated_tokens", "deepl_requests",
+                   "deepl_characters", "retries", "cost", "seconds", "wall_seconds")
+
+
+def aggregate(jobs, group_by=("user", "model", "day"), since=None, until=None):
+    """
+    Agrège la consommation enregistrée des tâches (ou des entrées du journal) selon les
+    dimensions `group_by` (parmi REPORT_DIMENSIONS), sur les jours `since` à `until` inclus
+    (AAAA-MM-JJ). Plusieurs exécutions d'une même tâche comptent pour une seule tâche.
+    """
+    rows = {}
+    for job in jobs:
+        day = _day(job)
+        if (since and day < since) or (until and day > until):
+            continue
+        for fact in _job_facts(job):
+            key = tuple(fact[dim] for dim in group_by)
+            row = rows.setdefault(key, {**dict(zip(group_by, key)), "jobs": set(), **{c: 0 for c in REPORT_COUNTERS}})
+            row["jobs"].add(job["id"])
+            for counter in REPORT_COUNTERS:
+                row[counter] += fact.get(counter, 0)
+    result = []
+    for key in sorted(rows, key=lambda k: tuple(str(v) for v in k)):
+        row = rows[key]
+        row["jobs"] = len(row["jobs"])
+        row["cost"] = round(row["cost"], 4)
+        row["seconds"] = round(row["seconds"], 1)
+        row["wall_seconds"] = round(row["wall_seconds"], 1)
+        result.append(row)
+    return result
+
+
+@contextmanager
+def _locked_ledger():
+    os.makedirs(LEDGER_FOLDER, exist_ok=True)
+    with open(os.path.join(LEDGER_FOLDER, ".lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _ledger_path(month):
+    return os.path.join(LEDGER_FOLDER, f"{month}.jsonl")
+
+
+def _append_entries(entries):
+    for entry in entries:
+        with open(_ledger_path(_day(entry)[:7]), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def _seed_ledger(exclude=None):
+    """Première utilisation : reprend la consommation des tâches terminées encore enregistrées."""
+    marker = os.path.join(LEDGER_FOLDER, ".seeded")
+    if os.path.exists(marker):
+        return
+    _append_entries(
+        {field: job.get(field) for field in LEDGER_FIELDS}
+        for job in job_store.list_jobs()
+        if job["id"] != exclude and job.get("usage") and job["status"] in ("done", "error", "cancelled")
+    )
+    open(marker, "a").close()
+
+
+def append_ledger(job):
+    """Ajoute la consommation de l'exécution d'une tâche qui vient de se terminer au journal."""
+    if not job.get("usage"):
+        return
+    entry = {field: job.get(field) for field in LEDGER_FIELDS}
+    entry["finished_at"] = entry["finished_at"] or datetime.now().isoformat()
+    with _locked_ledger():
+        _seed_ledger(exclude=job["id"])
+        _append_entries([entry])
+
+
+def read_ledger(since=None, until=None, kind=None):
+    """Entrées du journal des mois couvrant `since` à `until` (AAAA-MM-JJ), filtrées par type."""
+    with _locked_ledger():
+        _seed_ledger()
+    for name in sorted(os.listdir(LEDGER_FOLDER)):
+        month = name[:-len(".jsonl")]
+        if not name.endswith(".jsonl") or (since and month < since[:7]) or (until and month > until[:7]):
+            continue
+        with open(os.path.join(LEDGER_FOLDER, name), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # ligne tronquée (arrêt pendant l'écriture)
+                if kind is None or entry.get("kind") == kind:
+                    yield entry